@@ -0,0 +1,230 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Binary adjacency list files.
+An adjacency list file is append-only: a header naming the value columns,
+    followed by chunks of rows. Each chunk holds the integer origin ids, the
+    integer destination ids and then each float64 value column (the impedance
+    and the accumulations) of its rows, optionally compressed with zlib.
+Rows are streamed into a file by |Adjacency_Writer| as they are computed, and
+    the chunks of other adjacency list files are appended as they are, without
+    decoding them. A DBF table with the same rows can be exported for
+    compatibility with the tables written by earlier versions of the tool.
+"""
+
+from Constants import ADJACENCY_CHUNK_ROWS
+from Constants import ADJACENCY_COMPRESSION_LEVEL
+from Constants import DESTINATION_ID_FIELD_NAME
+from Constants import ORIGIN_ID_FIELD_NAME
+from json import dumps
+from json import loads
+from numpy import array
+from numpy import frombuffer
+from Shapefile_IO import DBF_Writer
+from Shapefile_IO import DOUBLE_FIELD
+from Shapefile_IO import INTEGER_FIELD
+from struct import calcsize
+from struct import pack
+from struct import unpack
+from Utils import Invalid_Input_Exception
+from Utils import trim
+from zlib import compress as zlib_compress
+from zlib import decompress
+
+# First bytes of an adjacency list file, with the version of its layout
+ADJACENCY_FILE_MAGIC = "UNA-ADJ1"
+# Header of a chunk: row count, payload length and whether it is compressed
+CHUNK_HEADER = "<IIB"
+# Types of the id and value columns
+ID_TYPE = "<i8"
+VALUE_TYPE = "<f8"
+
+def value_fields(impedance_attribute, accumulator_attributes):
+  """
+  Returns the names of the value columns of the adjacency list for
+      |impedance_attribute| and |accumulator_attributes|, given as a list
+      separated by ";" or "#" for none, as they are named in the DBF tables
+  """
+  return [trim("Total_%s" % attribute) for attribute in [impedance_attribute] +
+      [attribute for attribute in accumulator_attributes.split(";") if
+      attribute.strip() and attribute != "#"]]
+
+def _read_header(adjacency_file, path):
+  """
+  Returns the value fields of the adjacency list file |adjacency_file| opened
+      at its start, leaves it at its first chunk
+  """
+  if adjacency_file.read(len(ADJACENCY_FILE_MAGIC)) != ADJACENCY_FILE_MAGIC:
+    raise Invalid_Input_Exception(path)
+  length = unpack("<I", adjacency_file.read(4))[0]
+  return [str(field) for field in loads(adjacency_file.read(length))[
+      "fields"]]
+
+def _read_chunk_headers(adjacency_file):
+  """
+  Returns an iterator over the (rows, length, compressed) headers of the
+      chunks of |adjacency_file|, the payload of each chunk has to be read or
+      skipped before the next header
+  """
+  size = calcsize(CHUNK_HEADER)
+  while True:
+    header = adjacency_file.read(size)
+    if len(header) < size:
+      return
+    yield unpack(CHUNK_HEADER, header)
+
+def read_fields(path):
+  """
+  Returns the names of the value columns of the adjacency list file at |path|
+  """
+  adjacency_file = open(path, "rb")
+  try:
+    return _read_header(adjacency_file, path)
+  finally:
+    adjacency_file.close()
+
+def row_count(path):
+  """
+  Returns the number of rows in the adjacency list file at |path|, without
+      reading the rows
+  """
+  adjacency_file = open(path, "rb")
+  try:
+    _read_header(adjacency_file, path)
+    count = 0
+    for (rows, length, compressed) in _read_chunk_headers(adjacency_file):
+      adjacency_file.seek(length, 1)
+      count += rows
+    return count
+  finally:
+    adjacency_file.close()
+
+def read_chunks(path):
+  """
+  Returns an iterator over the chunks of the adjacency list file at |path|, as
+      (origins, destinations, values) arrays, where |values| has one row per
+      value column
+  """
+  adjacency_file = open(path, "rb")
+  try:
+    fields = _read_header(adjacency_file, path)
+    for (rows, length, compressed) in _read_chunk_headers(adjacency_file):
+      payload = adjacency_file.read(length)
+      if compressed:
+        payload = decompress(payload)
+      ids = frombuffer(payload, dtype=ID_TYPE, count=2 * rows)
+      values = frombuffer(payload, dtype=VALUE_TYPE, offset=16 * rows).reshape(
+          (len(fields), rows))
+      yield ids[:rows], ids[rows:], values
+  finally:
+    adjacency_file.close()
+
+def read_rows(path):
+  """
+  Returns an iterator over the rows of the adjacency list file at |path|, as
+      (origin_id, destination_id, values) tuples, where |values| is the list
+      of the values of the row
+  """
+  for (origins, destinations, values) in read_chunks(path):
+    for (origin, destination, row_values) in zip(origins.tolist(),
+        destinations.tolist(), values.T.tolist()):
+      yield origin, destination, row_values
+
+class Adjacency_Writer:
+  """
+  Streams rows into an adjacency list file, one chunk at a time
+  """
+
+  def __init__(self, path, fields, compress=False,
+      chunk_rows=ADJACENCY_CHUNK_ROWS):
+    """
+    |path|: path of the file, replaced if it exists
+    |fields|: names of the value columns
+    |compress|: compress the chunks?
+    |chunk_rows|: number of rows held in memory before they are written as a
+        chunk
+    """
+    self.fields = list(fields)
+    self.compress = compress
+    self.chunk_rows = chunk_rows
+    self.rows = []
+    self.row_count = 0
+    self.adjacency_file = open(path, "wb")
+    header = dumps({"fields": self.fields})
+    self.adjacency_file.write(ADJACENCY_FILE_MAGIC + pack("<I", len(header)) +
+        header)
+
+  def write(self, origin_id, destination_id, values):
+    """
+    Adds a row with the integer ids |origin_id| and |destination_id| and the
+        |values| of the value columns
+    """
+    self.rows.append((origin_id, destination_id, values))
+    if len(self.rows) >= self.chunk_rows:
+      self.flush()
+
+  def flush(self):
+    """
+    Writes the rows held in memory as a chunk
+    """
+    if not self.rows:
+      return
+    n = len(self.rows)
+    origins, destinations, values = zip(*self.rows)
+    payload = (array(origins + destinations, dtype=ID_TYPE).tostring() +
+        array(values, dtype=VALUE_TYPE).reshape((n, len(self.fields))).T.copy(
+        ).tostring())
+    if self.compress:
+      payload = zlib_compress(payload, ADJACENCY_COMPRESSION_LEVEL)
+    self.adjacency_file.write(pack(CHUNK_HEADER, n, len(payload),
+        self.compress) + payload)
+    self.row_count += n
+    self.rows = []
+
+  def append_file(self, path):
+    """
+    Appends the chunks of the adjacency list file at |path|, which must have
+        the same value columns, as they are
+    """
+    self.flush()
+    adjacency_file = open(path, "rb")
+    try:
+      if _read_header(adjacency_file, path) != self.fields:
+        raise Invalid_Input_Exception(path)
+      for (rows, length, compressed) in _read_chunk_headers(adjacency_file):
+        self.adjacency_file.write(pack(CHUNK_HEADER, rows, length, compressed) +
+            adjacency_file.read(length))
+        self.row_count += rows
+    finally:
+      adjacency_file.close()
+
+  def close(self):
+    """
+    Writes the remaining rows and closes the file
+    """
+    self.flush()
+    self.adjacency_file.close()
+
+def export_dbf(path, dbf_path):
+  """
+  Writes the rows of the adjacency list file at |path| to the DBF table at
+      |dbf_path|, with the fields of the tables written by Network Analyst
+  Returns the number of rows written
+  """
+  fields = read_fields(path)
+  writer = DBF_Writer(dbf_path, [(ORIGIN_ID_FIELD_NAME,) + INTEGER_FIELD,
+      (DESTINATION_ID_FIELD_NAME,) + INTEGER_FIELD] + [(field,) + DOUBLE_FIELD
+      for field in fields])
+  try:
+    for (origin_id, destination_id, values) in read_rows(path):
+      writer.write([origin_id, destination_id] + values)
+  finally:
+    writer.close()
+  return writer.record_count
@@ -11,24 +11,19 @@
 Script for adjacency list computation.
 """
 
+from Adjacency_File import Adjacency_Writer
+from Adjacency_File import value_fields
 from arcpy import AddField_management
 from arcpy import AddLocations_na
 from arcpy import AddMessage
-from arcpy import Append_management
-from arcpy import CalculateField_management
-from arcpy import Describe
+from arcpy import CheckOutExtension
 from arcpy import env
 from arcpy import Exists
 from arcpy import GetCount_management
 from arcpy import MakeFeatureLayer_management
 from arcpy import MakeODCostMatrixLayer_na
-from arcpy import PointToRaster_conversion
-from arcpy import RasterToPolygon_conversion
-from arcpy import Rename_management
 from arcpy import SelectLayerByAttribute_management
-from arcpy import SelectLayerByLocation_management
 from arcpy import Solve_na
-from arcpy import TableToTable_conversion
 from arcpy import UpdateCursor
 from Constants import ADDING_DESTINATIONS_STARTED
 from Constants import ADDING_DESTINATIONS_FINISHED
@@ -41,24 +36,26 @@ from Constants import BARRIER_COST_COMPUTATION_FINISHED
 from Constants import BARRIER_COST_COMPUTATION_STARTED
 from Constants import BARRIER_COST_FIELD
 from Constants import BARRIER_COST_PRE_PROCESSING
-from Constants import DESTINATION_ID_FIELD_NAME
 from Constants import INPUT_POINTS_LAYER_NAME
 from Constants import NETWORK_LOCATION_FIELDS
 from Constants import OD_COST_MATRIX_LAYER_NAME
 from Constants import OD_COST_MATRIX_LINES
 from Constants import OD_MATRIX_ENTRIES
-from Constants import ORIGIN_ID_FIELD_NAME
-from Constants import PARTIAL_ADJACENCY_LIST_NAME
-from Constants import POLYGONS_LAYER_NAME
-from Constants import POLYGONS_SHAPEFILE_NAME
-from Constants import RASTER_NAME
+from Constants import ORIGIN_BATCHES
 from Constants import SEARCH_TOLERANCE
 from Constants import SNAP_OFFSET
 from Constants import STEP_1
-from Constants import TEMP_ADJACENCY_DBF_NAME
-from math import sqrt
+from Constants import TEMP_ADJACENCY_LIST_NAME
+from Constants import WORKER_WORKSPACE_NAME
+from functools import partial
+from Instrumentation import CELLS_PROCESSED
+from Instrumentation import count
+from Instrumentation import OD_SOLVES
 from os import mkdir
+from os import rename
 from os.path import join
+from Parallel_Adjacency_List import solve_cells_in_parallel
+from Spatial_Index import kd_batches
 from Utils import calculate_network_locations
 from Utils import delete
 from Utils import network_features
@@ -70,7 +67,7 @@ env.overwriteOutput = True # Enable overwriting
 
 def compute_adjacency_list(input_points, input_network, id_attribute,
     impedance_attribute, accumulator_attributes, search_radius, output_location,
-    adj_dbf_name):
+    adj_file_name, processes=1, compress=False):
   """
   |input_points|: point shape file marking entity (e.g. building) locations
   |input_network|: street network in which |input_points| is located
@@ -80,8 +77,10 @@ def compute_adjacency_list(input_points, input_network, id_attribute,
   |accumulator_attributes|: distance between neighboring nodes will also be
       recorded for these attributes
   |search_radius|: the maximum extent for centrality computation
-  |output_location|: adjacency list dbf will be saved here
-  |adj_dbf_name|: the name of the adjacency list dbf
+  |output_location|: adjacency list file will be saved here
+  |adj_file_name|: the name of the adjacency list file, see |Adjacency_File|
+  |processes|: number of processes to solve the cells of origins on
+  |compress|: compress the adjacency list file?
   """
 
   # Number of points in |input_points|
@@ -92,9 +91,6 @@ def compute_adjacency_list(input_points, input_network, id_attribute,
   if not Exists(auxiliary_dir):
     mkdir(auxiliary_dir)
 
-  # Record the edge and junction source names of |input_network|
-  junction_feature, edge_feature = network_features(input_network)
-
   # Calculate network locations if not already calculated
   test_input_point = UpdateCursor(input_points).next()
   locations_calculated = all(row_has_field(test_input_point, field)
@@ -141,134 +137,178 @@ def compute_adjacency_list(input_points, input_network, id_attribute,
     AddMessage(BARRIER_COST_COMPUTATION_FINISHED)
 
   # Necessary files
-  od_cost_matrix_layer = join(auxiliary_dir, OD_COST_MATRIX_LAYER_NAME)
-  od_cost_matrix_lines = join(od_cost_matrix_layer, OD_COST_MATRIX_LINES)
-  temp_adj_dbf_name = TEMP_ADJACENCY_DBF_NAME(adj_dbf_name)
-  temp_adj_dbf = join(output_location, temp_adj_dbf_name)
-  adj_dbf = join(output_location, adj_dbf_name)
-  partial_adj_dbf = join(auxiliary_dir, PARTIAL_ADJACENCY_LIST_NAME)
-  polygons = join(auxiliary_dir, POLYGONS_SHAPEFILE_NAME)
-  raster = join(auxiliary_dir, RASTER_NAME)
-  polygons_layer = join(auxiliary_dir, POLYGONS_LAYER_NAME)
-  input_points_layer = join(auxiliary_dir, INPUT_POINTS_LAYER_NAME)
+  temp_adj_file = join(output_location, TEMP_ADJACENCY_LIST_NAME(
+      adj_file_name))
+  adj_file = join(output_location, adj_file_name)
 
   # Make sure none of these files already exists
-  for path in [od_cost_matrix_layer, temp_adj_dbf, adj_dbf, partial_adj_dbf,
-      polygons, raster, polygons_layer, input_points_layer,
-      od_cost_matrix_lines]:
+  for path in [temp_adj_file, adj_file]:
     delete(path)
 
   # Cutoff radius for OD matrix computation
   cutoff_radius = 2 * BARRIER_COST + min(search_radius, BARRIER_COST / 2)
 
-  # Compute OD matrix
-  MakeODCostMatrixLayer_na(in_network_dataset=input_network,
-      out_network_analysis_layer=od_cost_matrix_layer,
+  # Cells of origins: batches of nearby input points, each small enough for the
+  #     OD matrix of a solve to stay within |OD_MATRIX_ENTRIES|, split on the
+  #     snapped locations of the points so that dense areas get small batches
+  # Points that could not be located on the network have no neighbors, they are
+  #     left out of the origins; they have a negative SourceID (their SnapX and
+  #     SnapY are 0 in a shapefile, not null)
+  fids, locations = [], []
+  for row in UpdateCursor(input_points):
+    source_id = row.getValue(trim("SourceID"))
+    if source_id is not None and source_id >= 0:
+      fids.append(row.FID)
+      locations.append((row.getValue(trim("SnapX")),
+          row.getValue(trim("SnapY"))))
+  cells = [[fids[i] for i in batch] for batch in kd_batches(locations,
+      OD_MATRIX_ENTRIES / input_point_count)]
+  batch_sizes = [len(cell) for cell in cells] or [0]
+  AddMessage(ORIGIN_BATCHES(len(cells), min(batch_sizes), max(batch_sizes),
+      float(sum(batch_sizes)) / max(1, len(cells))))
+
+  # Compute adjacency list, one cell at a time, each worker with its own OD
+  #     cost matrix layer
+  make_solver = partial(OD_Cost_Matrix_Solver, input_points=input_points,
+      input_network=input_network, id_attribute=id_attribute,
       impedance_attribute=impedance_attribute,
-      default_cutoff=str(cutoff_radius),
-      accumulate_attribute_name=accumulator_attributes,
-      UTurn_policy="ALLOW_UTURNS", hierarchy="NO_HIERARCHY",
-      output_path_shape="NO_LINES")
-
-  # Determine raster cell size
-  points_per_raster_cell = OD_MATRIX_ENTRIES / input_point_count
-  raster_cell_count = max(1, input_point_count / points_per_raster_cell)
-  input_points_extent = Describe(input_points).Extent
-  raster_cell_area = (input_points_extent.width * input_points_extent.height /
-      raster_cell_count)
-  raster_cell_size = int(sqrt(raster_cell_area))
-
-  # Construct |raster| from |input_points|
-  PointToRaster_conversion(in_features=input_points,
-      value_field=id_attribute, out_rasterdataset=raster,
-      cell_assignment="MOST_FREQUENT", priority_field="NONE",
-      cellsize=str(raster_cell_size))
-
-  # Construct |polygons| from |raster|
-  RasterToPolygon_conversion(in_raster=raster,
-      out_polygon_features=polygons, simplify="NO_SIMPLIFY",
-      raster_field="VALUE")
+      accumulator_attributes=accumulator_attributes,
+      cutoff_radius=cutoff_radius, compress=compress)
+  progress = Progress_Bar(len(cells), 1, STEP_1)
+  partial_adj_files = solve_cells_in_parallel(cells, make_solver,
+      auxiliary_dir, processes, progress.step)
+
+  # Merge the partial adjacency lists into |temp_adj_file|, in cell order
+  writer = Adjacency_Writer(temp_adj_file, value_fields(impedance_attribute,
+      accumulator_attributes), compress)
+  try:
+    for partial_adj_file in partial_adj_files:
+      writer.append_file(partial_adj_file)
+  finally:
+    writer.close()
+
+  # The adjacency list only appears once it is complete
+  rename(temp_adj_file, adj_file)
 
-  # Export empty |od_cost_matrix_lines| to |temp_dbf| to start adjacency list
-  TableToTable_conversion(in_rows=od_cost_matrix_lines,
-      out_path=output_location, out_name=temp_adj_dbf_name)
+  # Clean up
+  for path in partial_adj_files:
+    delete(path)
+  for k in xrange(max(1, min(processes, len(cells)))):
+    delete(join(auxiliary_dir, WORKER_WORKSPACE_NAME(k)))
+  delete(auxiliary_dir)
 
-  # Construct |polygons_layer| and |input_points_layer|
-  for (feature, layer) in [(polygons, polygons_layer),
-      (input_points, input_points_layer)]:
-    MakeFeatureLayer_management(in_features=feature, out_layer=layer)
+class OD_Cost_Matrix_Solver:
+  """
+  Solves cells of origins with an OD cost matrix layer of its own, see
+      |solve_cells_in_parallel|
+  The destinations and point barriers are all the input points, they are added
+      once when the solver is made
+  """
 
-  def add_locations(sub_layer, field_mappings=""):
+  def __init__(self, workspace, input_points, input_network,
+      id_attribute, impedance_attribute, accumulator_attributes,
+      cutoff_radius, compress=False):
+    """
+    |workspace|: scratch directory of the solver
+    |cutoff_radius|: cutoff of the OD cost matrix, including barrier costs
+    |compress|: compress the partial adjacency list files?
+    All other parameters are as in |compute_adjacency_list|
+    """
+    # Each process checks out its own Network Analyst license
+    CheckOutExtension("Network")
+    self.id_attribute = id_attribute
+    self.compress = compress
+    # Fields of the OD cost matrix lines, and the matching value columns of the
+    #     adjacency list
+    self.line_fields = ["Total_%s" % attribute for attribute in
+        [impedance_attribute] + [attribute for attribute in
+        accumulator_attributes.split(";") if attribute.strip() and
+        attribute != "#"]]
+    self.value_fields = value_fields(impedance_attribute,
+        accumulator_attributes)
+    self.od_cost_matrix_layer = join(workspace, OD_COST_MATRIX_LAYER_NAME)
+    self.od_cost_matrix_lines = join(self.od_cost_matrix_layer,
+        OD_COST_MATRIX_LINES)
+    self.input_points_layer = join(workspace, INPUT_POINTS_LAYER_NAME)
+    for path in [self.od_cost_matrix_layer, self.input_points_layer,
+        self.od_cost_matrix_lines]:
+      delete(path)
+    self.junction_feature, self.edge_feature = network_features(input_network)
+
+    # Compute OD matrix
+    MakeODCostMatrixLayer_na(in_network_dataset=input_network,
+        out_network_analysis_layer=self.od_cost_matrix_layer,
+        impedance_attribute=impedance_attribute,
+        default_cutoff=str(cutoff_radius),
+        accumulate_attribute_name=accumulator_attributes,
+        UTurn_policy="ALLOW_UTURNS", hierarchy="NO_HIERARCHY",
+        output_path_shape="NO_LINES")
+
+    # Construct |input_points_layer|
+    MakeFeatureLayer_management(in_features=input_points,
+        out_layer=self.input_points_layer)
+
+    # OD cost matrix destinations
+    AddMessage(ADDING_DESTINATIONS_STARTED)
+    self.add_locations("Destinations")
+    AddMessage(ADDING_DESTINATIONS_FINISHED)
+
+    # OD cost matrix point barriers
+    AddMessage(ADDING_BARRIERS_STARTED)
+    self.add_locations("Point Barriers", ("FullEdge # 0; BarrierType # 2;"
+        "Attr_%s %s #;" % (impedance_attribute, trim(BARRIER_COST_FIELD))))
+    AddMessage(ADDING_BARRIERS_FINISHED)
+
+  def add_locations(self, sub_layer, field_mappings=""):
     """
     |sub_layer|: one of "Origins", "Destinations", "Barrier Points"
     |field_mappings|: field mappings in addition to those for "Name" and
         "CurbApproach"
     """
-    AddLocations_na(in_network_analysis_layer=od_cost_matrix_layer,
-        sub_layer=sub_layer, in_table=input_points_layer,
+    AddLocations_na(in_network_analysis_layer=self.od_cost_matrix_layer,
+        sub_layer=sub_layer, in_table=self.input_points_layer,
         field_mappings=("Name %s #; CurbApproach # 0; %s" %
-            (id_attribute, field_mappings)),
+            (self.id_attribute, field_mappings)),
         search_tolerance=SEARCH_TOLERANCE,
         search_criteria=("%s SHAPE; %s SHAPE;" %
-            (junction_feature, edge_feature)),
+            (self.junction_feature, self.edge_feature)),
         append="CLEAR", snap_to_position_along_network="SNAP",
         snap_offset=SNAP_OFFSET)
 
-  # OD cost matrix destinations
-  AddMessage(ADDING_DESTINATIONS_STARTED)
-  SelectLayerByLocation_management(in_layer=input_points_layer)
-  add_locations("Destinations")
-  AddMessage(ADDING_DESTINATIONS_FINISHED)
-
-  # OD cost matrix point barriers
-  AddMessage(ADDING_BARRIERS_STARTED)
-  add_locations("Point Barriers", ("FullEdge # 0; BarrierType # 2;"
-      "Attr_%s %s #;" % (impedance_attribute, trim(BARRIER_COST_FIELD))))
-  AddMessage(ADDING_BARRIERS_FINISHED)
-
-  # Compute adjacency list, one raster cell at a time
-  progress = Progress_Bar(raster_cell_count, 1, STEP_1)
-  rows = UpdateCursor(polygons)
-  for row in rows:
-    # Select the current polygon
-    SelectLayerByAttribute_management(in_layer_or_view=polygons_layer,
-        selection_type="NEW_SELECTION", where_clause="FID = %s" % str(row.FID))
-
+  def solve(self, cell, path):
+    """
+    Solves the OD cost matrix from the origins with the FIDs in |cell| and
+        streams the lines into the adjacency list file at |path|
+    Returns |path|
+    """
     # Origins
-    SelectLayerByLocation_management(in_layer=input_points_layer,
-        select_features=polygons_layer)
-    add_locations("Origins")
+    SelectLayerByAttribute_management(in_layer_or_view=self.input_points_layer,
+        selection_type="NEW_SELECTION", where_clause="FID IN (%s)" % ", ".join(
+        str(fid) for fid in cell))
+    self.add_locations("Origins")
 
     # Solve OD Cost matrix
-    Solve_na(in_network_analysis_layer=od_cost_matrix_layer,
+    Solve_na(in_network_analysis_layer=self.od_cost_matrix_layer,
         ignore_invalids="SKIP")
-
-    # Add origin and destination fields to the adjacency list dbf
-    for (index, field) in [(0, ORIGIN_ID_FIELD_NAME),
-        (1, DESTINATION_ID_FIELD_NAME)]:
-      CalculateField_management(in_table=od_cost_matrix_lines,
-          field=field, expression="!Name!.split(' - ')[%d]" % index,
-          expression_type="PYTHON")
-
-    # Record actual distance between neighboring nodes
-    distance_field = "Total_%s" % impedance_attribute
-    CalculateField_management(in_table=od_cost_matrix_lines,
-        field=distance_field,
-        expression="!%s! - 2 * %d" % (distance_field, BARRIER_COST),
-        expression_type="PYTHON")
-
-    # Append result to |temp_adj_dbf|
-    TableToTable_conversion(in_rows=od_cost_matrix_lines,
-        out_path=auxiliary_dir, out_name=PARTIAL_ADJACENCY_LIST_NAME)
-    Append_management(inputs=partial_adj_dbf, target=temp_adj_dbf,
-        schema_type="TEST")
-
-    progress.step()
-
-  # Copy data from |temp_adj_dbf| to |adj_dbf|
-  Rename_management(in_data=temp_adj_dbf, out_data=adj_dbf)
-
-  # Clean up
-  for path in [od_cost_matrix_layer, partial_adj_dbf, polygons, raster,
-      polygons_layer, input_points_layer, auxiliary_dir]:
-    delete(path)
+    count(OD_SOLVES)
+
+    # Origin and destination ids are read from the names of the lines, and the
+    #     actual distance between neighboring nodes leaves out the barriers
+    writer = Adjacency_Writer(path, self.value_fields, self.compress)
+    try:
+      for row in UpdateCursor(self.od_cost_matrix_lines):
+        origin_id, destination_id = row.getValue("Name").split(" - ")
+        values = [float(row.getValue(field)) for field in self.line_fields]
+        values[0] -= 2 * BARRIER_COST
+        writer.write(int(origin_id), int(destination_id), values)
+    finally:
+      writer.close()
+    count(CELLS_PROCESSED)
+    return path
+
+  def close(self):
+    """
+    Removes the layers of the solver
+    """
+    for path in [self.od_cost_matrix_layer, self.input_points_layer]:
+      delete(path)
@@ -0,0 +1,209 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Script for estimating the centrality metrics from a sample of the nodes.
+Shortest path trees are only computed for a sample of pivot nodes. Each tree
+    gives one term of the metrics of every node it reaches, and the sums of the
+    terms are scaled up to all nodes. The variance of the terms gives a
+    confidence interval for every estimate.
+"""
+
+from Centrality_Kernels import compute_pivots
+from Centrality_Kernels import pivot_quantities
+from Centrality_Kernels import REACH_COUNT
+from Centrality_Kernels import WEIGHTED_REACH
+from Constants import BETWEENNESS
+from Constants import CLOSENESS
+from Constants import CONFIDENCE_Z
+from Constants import GRAVITY
+from Constants import REACH
+from Constants import STRAIGHTNESS
+from math import ceil
+from math import sqrt
+from numpy import maximum
+from numpy import minimum
+from numpy import sqrt as sqrt_array
+from numpy import zeros
+from random import Random
+from Utils import Invalid_Parameters_Exception
+
+# Number of pivots in the first batch when sampling up to a target error
+MIN_PIVOTS = 32
+
+def pivot_order(origins, locations, stratified, seed):
+  """
+  Returns the |origins| in random order, a sample of k pivots is the first k
+      origins in the order
+  |locations|: N by 2 array of node locations, or None
+  |stratified|: if True, the origins are split into strata (cells of a grid
+      over their locations, or runs of consecutive origins without locations)
+      and the order is such that every prefix takes from each stratum in
+      proportion to its size
+  |seed|: seed of the random number generator, the same seed gives the same
+      order
+  """
+  random = Random(seed)
+  order = list(origins)
+  random.shuffle(order)
+  O = len(order)
+  if not stratified or O < 2:
+    return order
+  strata_count = max(1, int(round(sqrt(O))))
+  if locations is not None:
+    side = int(ceil(sqrt(strata_count)))
+    xy = locations[origins]
+    low = xy.min(axis=0)
+    span = xy.max(axis=0) - low
+    span[span == 0] = 1.0
+    cells = minimum(((xy - low) / span * side).astype(int), side - 1)
+    stratum = dict(zip(origins, (cells[:, 0] * side + cells[:, 1]).tolist()))
+  else:
+    stratum = dict((s, i * strata_count // O) for (i, s) in enumerate(origins))
+  sizes = {}
+  for s in order:
+    sizes[stratum[s]] = sizes.get(stratum[s], 0) + 1
+  # The j-th origin of a stratum of n origins is placed at (j + u) / n, where u
+  #     is uniform in [0, 1)
+  ranks = {}
+  keys = {}
+  for s in order:
+    j = ranks.get(stratum[s], 0)
+    ranks[stratum[s]] = j + 1
+    keys[s] = (j + random.random()) / sizes[stratum[s]]
+  return sorted(order, key=lambda s: keys[s])
+
+def estimates(sums, pivots, population):
+  """
+  Returns (estimates, half_widths) for the quantities in |sums|, both
+      dictionaries mapping each quantity to an array of values per node
+  |sums|: as filled by |compute_pivots|
+  |pivots|: number of pivots the terms were summed over
+  |population|: number of nodes the pivots were sampled from
+  The estimates are the sums scaled to the |population|, the half widths are
+      those of the 95% confidence intervals of a sample drawn without
+      replacement
+  """
+  scale = float(population) / pivots
+  correction = 1.0 - float(pivots) / population
+  values, half_widths = {}, {}
+  for (key, (total, squares)) in sums.items():
+    values[key] = scale * total
+    if pivots < 2:
+      half_widths[key] = zeros(len(total)) + float("inf")
+      continue
+    variance = maximum(squares - total * total / pivots, 0.0) / (pivots - 1)
+    half_widths[key] = CONFIDENCE_Z * population * sqrt_array(correction *
+        variance / pivots)
+  return values, half_widths
+
+def mean_relative_error(values, half_widths, checked):
+  """
+  Returns the largest, over the (key, indices) pairs in |checked|, of the sum
+      of the half widths over the sum of the estimates of the quantity |key| at
+      the nodes |indices|
+  """
+  errors = [0.0]
+  for (key, indices) in checked:
+    total = abs(values[key][indices]).sum()
+    if total > 0:
+      errors.append(float(half_widths[key][indices].sum() / total))
+  return max(errors)
+
+def sample_limit(N, sample_size):
+  """
+  Returns the largest number of pivots sampled from |N| nodes for
+      |sample_size|, as in |compute_approximate|
+  """
+  return N if sample_size is None else max(1, min(int(sample_size), N))
+
+def compute_approximate(sequences, origins, compute_r, compute_g, compute_b,
+    compute_c, compute_s, radius, network_radius, beta, accumulator_fields,
+    locations, sample_size, relative_error, stratified, seed, step):
+  """
+  Estimates the metrics of the |origins| from the shortest path trees of a
+      sample of the nodes
+  |locations|: N by 2 array of node locations, or None
+  |sample_size|: number of pivots, or None to sample until |relative_error| is
+      met
+  |relative_error|: target mean relative error of the estimates, or None to
+      use exactly |sample_size| pivots; pivots are added in batches of doubling
+      size until the target is met
+  |stratified|, |seed|: as in |pivot_order|
+  All other parameters are as in |compute_origins|
+  Returns (values, betweenness, errors, node_values, pivots, error):
+      |values| maps metric names to lists of values for the |origins|, as
+          returned by |compute_origins|
+      |betweenness| is the array of estimated betweenness values per node
+      |errors| maps metric names to the half widths of the confidence
+          intervals, per origin (per node for betweenness)
+      |node_values| maps REACH_COUNT and WEIGHTED_REACH to arrays of estimates
+          for all nodes
+      |pivots| is the number of pivots used and |error| the mean relative error
+  The pivots are sampled from all nodes, since every node is a destination of
+      the origins; only the pivots that are origins add betweenness terms, as
+      betweenness only counts the paths from the origins
+  A euclidean radius cannot be sampled with accumulations: a run accumulates
+      over its whole shortest path tree, which the trees of the pivots do not
+      tell
+  """
+  N = len(sequences[3])
+  if accumulator_fields and not network_radius:
+    raise Invalid_Parameters_Exception("accumulations cannot be estimated "
+        "with a birds-eye radius")
+  order = pivot_order(range(N), locations, stratified, seed)
+  sources = None if len(origins) == N else set(origins)
+  quantities = pivot_quantities(compute_r, compute_g, compute_b, compute_c,
+      compute_s, accumulator_fields)
+  sums = dict((key, zeros((2, N))) for key in quantities)
+  limit = sample_limit(N, sample_size)
+  pivots = limit if relative_error is None else min(limit, MIN_PIVOTS)
+  # Quantities checked against |relative_error|, with the nodes they are for
+  checked = [(key, origins) for (key, compute) in [(WEIGHTED_REACH,
+      compute_r), (GRAVITY, compute_g), (CLOSENESS, compute_c),
+      (STRAIGHTNESS, compute_s)] if compute and key in quantities]
+  checked += [(field, origins) for field in accumulator_fields]
+  if compute_b:
+    checked.append((BETWEENNESS, slice(None)))
+  done = 0
+  while True:
+    compute_pivots(sequences, order[done:pivots], compute_r, compute_g,
+        compute_b, compute_c, compute_s, radius, network_radius, beta,
+        accumulator_fields, sums, step, sources)
+    done = pivots
+    node_values, half_widths = estimates(sums, pivots, N)
+    error = mean_relative_error(node_values, half_widths, checked)
+    if relative_error is None or error <= relative_error or pivots == limit:
+      break
+    pivots = min(limit, 2 * pivots)
+
+  # Metric values for each of the |origins|
+  values = {REACH_COUNT: node_values[REACH_COUNT][origins].tolist(),
+      WEIGHTED_REACH: node_values[WEIGHTED_REACH][origins].tolist()}
+  errors = {}
+  for (metric, key, compute) in [(REACH, WEIGHTED_REACH, compute_r),
+      (GRAVITY, GRAVITY, compute_g), (STRAIGHTNESS, STRAIGHTNESS,
+      compute_s)] + [(field, field, True) for field in accumulator_fields]:
+    if compute:
+      values[metric] = node_values[key][origins].tolist()
+      errors[metric] = half_widths[key][origins]
+  if compute_c:
+    # Closeness is the inverse of the estimated sum of distances
+    d_sums = node_values[CLOSENESS][origins]
+    d_sum_errors = half_widths[CLOSENESS][origins]
+    closeness = [1.0 / d_sum if d_sum > 0 else 0.0 for d_sum in
+        d_sums.tolist()]
+    values[CLOSENESS] = closeness
+    errors[CLOSENESS] = d_sum_errors * [c / d_sum if d_sum > 0 else 0.0 for
+        (c, d_sum) in zip(closeness, d_sums.tolist())]
+  betweenness = node_values[BETWEENNESS] if compute_b else zeros(N)
+  if compute_b:
+    errors[BETWEENNESS] = half_widths[BETWEENNESS]
+  return (values, betweenness, errors, dict((key, node_values[key]) for key in
+      (REACH_COUNT, WEIGHTED_REACH)), pivots, error)
@@ -0,0 +1,531 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Benchmark suite for the centrality computation (Step 4) on synthetic graphs,
+    and differential oracle that compares the optimized ways of running the
+    computation against the reference computation of Reference_Centrality.py,
+    see |reference_centrality|.
+Graphs are generated from arrays, so graphs of a million nodes are built in
+    seconds: street grids with buildings along the blocks, random geometric
+    graphs, and unit lattices with many ties between shortest paths.
+Runs headless, outside of ArcGIS, see |Headless|.
+Usage: python Centrality_Benchmark.py [generator] [nodes] [radii] [origins]
+           [processes]
+       python Centrality_Benchmark.py check [generator] [nodes] [radius]
+"""
+
+# The computation only needs the messages and progressors of arcpy, outside of
+#     ArcGIS they are replaced by console stand-ins
+from Headless import install
+install(quiet=True)
+
+from Centrality_Computation import compute_centrality
+from Chunked_Centrality import fixed_bytes
+from Chunked_Centrality import origin_bytes
+from Constants import BETWEENNESS
+from Constants import CLOSENESS
+from Constants import FINAL_ATTRIBUTES
+from Constants import GRAVITY
+from Constants import LOCATION
+from Constants import REACH
+from Constants import STRAIGHTNESS
+from Constants import TOLERANCE
+from Constants import WEIGHT
+from Graph import Graph
+from itertools import product
+from math import pi
+from multiprocessing import Process
+from multiprocessing import Queue
+from Node import Node
+from numpy import abs as abs_array
+from numpy import arange
+from numpy import argsort
+from numpy import bincount
+from numpy import concatenate
+from numpy import cumsum
+from numpy import float64
+from numpy import flatnonzero
+from numpy import floor
+from numpy import indices
+from numpy import int32
+from numpy import int64
+from numpy import lexsort
+from numpy import minimum
+from numpy import ones
+from numpy import repeat
+from numpy import searchsorted
+from numpy import sqrt
+from numpy import zeros
+from numpy.random import RandomState
+from Reference_Centrality import compute_centrality as compute_reference
+from shutil import rmtree
+from sys import argv
+from tempfile import mkdtemp
+from time import time
+from traceback import format_exc
+from Utils import peak_memory
+
+# Metrics in the order of the flags of |compute_centrality|
+METRICS = (REACH, GRAVITY, BETWEENNESS, CLOSENESS, STRAIGHTNESS)
+# Gravity beta used by the benchmarks
+BENCHMARK_BETA = 0.01
+# Radii timed by default, as multiples of the mean edge weight
+RADIUS_MULTIPLES = (5, 10, 20)
+# Accumulator field of the graphs checked by |check|, each edge adds 1
+BENCHMARK_ACCUMULATOR = "Total_Edges"
+
+def graph_from_edges(N, sources, targets, weights, locations, node_weights):
+  """
+  Returns the |Graph| with nodes 0, 1, ..., |N| - 1 and an undirected edge of
+      weight |weights|[i] between |sources|[i] and |targets|[i] for each i
+  |locations|: array with the (x, y) location of each node
+  |node_weights|: array with the weight of each node
+  """
+  u = concatenate((sources, targets)).astype(int64)
+  v = concatenate((targets, sources)).astype(int64)
+  w = concatenate((weights, weights))
+  order = lexsort((v, u))
+  indptr = zeros(N + 1, dtype=int32)
+  indptr[1:] = cumsum(bincount(u, minlength=N))
+  graph = Graph(range(N), indptr, v[order], w[order])
+  graph.node_weights = node_weights.astype(float64)
+  graph.locations = locations.astype(float64)
+  return graph
+
+def street_grid(nodes, buildings=4, block_length=100.0, seed=0):
+  """
+  Returns a street grid with about |nodes| buildings: |buildings| buildings are
+      spread along each street between two intersections, and each building is
+      connected to its neighbors along the street and, at the ends of the
+      street, to the buildings at the ends of the other streets of the
+      intersection
+  Blocks are |block_length| long on average, with random widths and heights,
+      and buildings have random weights from 1 to 10
+  """
+  random = RandomState(seed)
+  k = buildings
+  G = max(2, int(round(sqrt(nodes / (2.0 * k)))) + 1)
+  # Coordinates of the intersections along each axis
+  x_lines = concatenate(([0.0], cumsum(block_length * random.uniform(0.5, 1.5,
+      G - 1))))
+  y_lines = concatenate(([0.0], cumsum(block_length * random.uniform(0.5, 1.5,
+      G - 1))))
+  widths, heights = x_lines[1:] - x_lines[:-1], y_lines[1:] - y_lines[:-1]
+  positions = (arange(k) + 0.5) / k
+  # Horizontal streets, indexed by (row y, street x, building p)
+  y, x, p = [a.ravel() for a in indices((G, G - 1, k))]
+  horizontal = concatenate(((x_lines[x] + widths[x] * positions[p])[:, None],
+      y_lines[y][:, None]), axis=1)
+  # Vertical streets, indexed by (column y, street x, building p)
+  vertical = concatenate((x_lines[y][:, None], (y_lines[x] + heights[x] *
+      positions[p])[:, None]), axis=1)
+  H = G * (G - 1) * k
+  N = 2 * H
+  h_id = lambda row, street, p: (row * (G - 1) + street) * k + p
+  v_id = lambda column, street, p: H + (column * (G - 1) + street) * k + p
+  sources, targets, weights = [], [], []
+  # Neighbors along each street
+  along = p < k - 1
+  for (ids, lengths) in [(h_id(y, x, p), widths[x]), (v_id(y, x, p),
+      heights[x])]:
+    sources.append(ids[along])
+    targets.append(ids[along] + 1)
+    weights.append(lengths[along] / k)
+  # Buildings at the ends of the four streets of each intersection: whether the
+  #     street exists, their ids, and their distances to the intersection
+  ix, iy = [a.ravel() for a in indices((G, G))]
+  last = minimum(ix, G - 2), minimum(iy, G - 2)
+  ends = [(ix > 0, h_id(iy, ix - 1, k - 1), widths[ix - 1] / (2 * k)),
+      (ix < G - 1, h_id(iy, ix, 0), widths[last[0]] / (2 * k)),
+      (iy > 0, v_id(ix, iy - 1, k - 1), heights[iy - 1] / (2 * k)),
+      (iy < G - 1, v_id(ix, iy, 0), heights[last[1]] / (2 * k))]
+  for i in xrange(len(ends)):
+    for j in xrange(i + 1, len(ends)):
+      both = ends[i][0] & ends[j][0]
+      sources.append(ends[i][1][both])
+      targets.append(ends[j][1][both])
+      weights.append(ends[i][2][both] + ends[j][2][both])
+  return graph_from_edges(N, concatenate(sources), concatenate(targets),
+      concatenate(weights), concatenate((horizontal, vertical)),
+      random.randint(1, 11, N))
+
+def cell_pairs(locations, radius):
+  """
+  Returns (sources, targets), the pairs of nodes closer than |radius| to each
+      other, each pair once
+  Nodes are filed in square cells |radius| wide, so only nodes in the same or
+      in neighboring cells are compared
+  """
+  N = len(locations)
+  cells_xy = floor((locations - locations.min(axis=0)) / radius).astype(int64)
+  columns = cells_xy[:, 1].max() + 1
+  rows = cells_xy[:, 0].max() + 1
+  cells = cells_xy[:, 0] * columns + cells_xy[:, 1]
+  order = argsort(cells, kind="mergesort")
+  sorted_cells = cells[order]
+  starts = searchsorted(sorted_cells, arange(rows * columns))
+  counts = bincount(sorted_cells, minlength=rows * columns)
+  sources, targets = [], []
+  for (dx, dy) in [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]:
+    neighbor_x = cells_xy[order, 0] + dx
+    neighbor_y = cells_xy[order, 1] + dy
+    valid = ((neighbor_x < rows) & (neighbor_y >= 0) & (neighbor_y <
+        columns))
+    neighbor = neighbor_x * columns + neighbor_y
+    m = zeros(N, dtype=int64)
+    m[valid] = counts[neighbor[valid]]
+    a = repeat(arange(N), m)
+    b = repeat(starts[neighbor * valid], m) + (arange(m.sum()) -
+        repeat(cumsum(m) - m, m))
+    keep = a < b if (dx, dy) == (0, 0) else a >= 0
+    a, b = order[a[keep]], order[b[keep]]
+    close = ((locations[a] - locations[b])**2).sum(axis=1) < radius**2
+    sources.append(a[close])
+    targets.append(b[close])
+  return concatenate(sources), concatenate(targets)
+
+def random_geometric(nodes, mean_degree=6, spacing=10.0, seed=0):
+  """
+  Returns a random geometric graph: |nodes| nodes placed uniformly at random,
+      |spacing| apart on average, with an edge between each two nodes close
+      enough that nodes have |mean_degree| neighbors on average
+  Edges are up to 30% longer than the straight line, and nodes have random
+      weights from 1 to 10
+  """
+  random = RandomState(seed)
+  side = spacing * sqrt(nodes)
+  locations = random.uniform(0.0, side, (nodes, 2))
+  radius = spacing * sqrt(mean_degree / pi)
+  sources, targets = cell_pairs(locations, radius)
+  lengths = sqrt(((locations[sources] - locations[targets])**2).sum(axis=1))
+  weights = lengths * random.uniform(1.0, 1.3, len(lengths))
+  return graph_from_edges(nodes, sources, targets, weights, locations,
+      random.randint(1, 11, nodes))
+
+def tie_lattice(nodes):
+  """
+  Returns a square lattice of about |nodes| nodes with unit edge weights and
+      unit node weights, where the number of shortest paths between two nodes
+      grows exponentially with their distance
+  """
+  side = max(2, int(round(sqrt(nodes))))
+  N = side * side
+  x, y = arange(N) // side, arange(N) % side
+  right, up = x < side - 1, y < side - 1
+  sources = concatenate((arange(N)[right], arange(N)[up]))
+  targets = concatenate((arange(N)[right] + side, arange(N)[up] + 1))
+  locations = concatenate((x[:, None], y[:, None]), axis=1)
+  return graph_from_edges(N, sources, targets, zeros(len(sources)) + 1.0,
+      locations, zeros(N) + 1.0)
+
+# Graph generators by name
+GENERATORS = {"grid": street_grid, "geometric": random_geometric,
+    "ties": tie_lattice}
+
+def metric_combinations():
+  """
+  Returns every non-empty combination of the metrics, as tuples of the five
+      compute flags of |compute_centrality|
+  """
+  return [flags for flags in product((True, False), repeat=len(METRICS)) if
+      any(flags)]
+
+def combination_name(flags):
+  """
+  Returns the names of the metrics computed with |flags|, joined by "+"
+  """
+  return "+".join(metric for (metric, flag) in zip(METRICS, flags) if flag)
+
+def _timed_run(graph, origins, arguments, results):
+  """
+  Runs |compute_centrality| on |graph| from |origins| with the rest of the
+      |arguments|, and puts (seconds, peak memory of the process) on the queue
+      |results|, or (None, traceback) if the run fails
+  """
+  try:
+    start = time()
+    compute_centrality(graph, origins, *arguments)
+    results.put((time() - start, peak_memory()))
+  except:
+    results.put((None, format_exc()))
+
+def benchmark(graph, origins, radius, flags, processes=1):
+  """
+  Times one run of |compute_centrality| on |graph| from |origins| with the
+      metrics of |flags| within |radius|
+  The run is made in a fresh process, since the peak memory of a process only
+      grows: the peak memory is that of the run alone, with the graph it is
+      given
+  Returns (seconds, origins per second, peak memory of the run)
+  """
+  graph.metrics = {}
+  graph.reach_values = {}
+  results = Queue()
+  run = Process(target=_timed_run, args=(graph, origins, flags + (radius,
+      True, BENCHMARK_BETA, [], [], processes), results))
+  run.start()
+  seconds, peak = results.get()
+  run.join()
+  if seconds is None:
+    raise Exception("Benchmark run failed:\n%s" % peak)
+  return seconds, len(origins) / max(seconds, 1e-9), peak
+
+def with_accumulator(graph):
+  """
+  Returns a copy of |graph| whose edges have the accumulator field
+      |BENCHMARK_ACCUMULATOR|, 1 for every edge
+  """
+  result = Graph(graph.ids, graph.indptr, graph.indices, graph.weights,
+      ones((graph.edge_count(), 1)), [BENCHMARK_ACCUMULATOR])
+  result.node_weights = graph.node_weights
+  result.locations = graph.locations
+  return result
+
+def copy_graph(graph):
+  """
+  Returns a copy of |graph| without its metrics
+  """
+  return graph.subgraph(arange(len(graph)))
+
+def nodes_from_graph(graph):
+  """
+  Returns the dictionary mapping node id's to |Node| objects equivalent to
+      |graph|
+  """
+  nodes = dict((id, Node()) for id in graph.ids)
+  for (i, id) in enumerate(graph.ids):
+    setattr(nodes[id], WEIGHT, float(graph.node_weights[i]))
+    if graph.locations is not None:
+      setattr(nodes[id], LOCATION, tuple(graph.locations[i].tolist()))
+    for j in xrange(graph.indptr[i], graph.indptr[i + 1]):
+      nodes[id].add_neighbor(graph.ids[graph.indices[j]],
+          float(graph.weights[j]), dict(zip(graph.accumulator_fields,
+          graph.accumulations[j].tolist())))
+  return nodes
+
+def reference_centrality(graph, origins, *arguments):
+  """
+  Runs the reference computation of Reference_Centrality.py on the |Node|
+      objects equivalent to |graph|, with the first ten |arguments| of
+      |compute_centrality|, and stores the results in the metrics of |graph|
+      as |compute_centrality| does
+  """
+  nodes = nodes_from_graph(graph)
+  # The reference computation takes measures out of the list it is given
+  compute_reference(nodes, origins, *(arguments[:8] + (list(arguments[8]),) +
+      arguments[9:]))
+  for name in list(FINAL_ATTRIBUTES) + list(arguments[9]):
+    ids = [id for id in graph.ids if hasattr(nodes[id], name)]
+    if ids:
+      values = graph.metric(name)
+      for id in ids:
+        values[graph.index[id]] = getattr(nodes[id], name)
+
+def edge_rows(graph):
+  """
+  Returns a function that returns a new iterator over the edges of |graph| as
+      rows of an adjacency list, see |Edge_Buckets|
+  """
+  def rows():
+    sources = repeat(arange(len(graph)), graph.indptr[1:] -
+        graph.indptr[:-1]).tolist()
+    for (u, v, weight, accumulations) in zip(sources,
+        graph.indices.tolist(), graph.weights.tolist(),
+        graph.accumulations.tolist()):
+      yield (graph.ids[u], graph.ids[v], weight, dict(zip(
+          graph.accumulator_fields, accumulations)))
+  return rows
+
+def serial_engine(graph, origins, *arguments):
+  """
+  Runs the computation on one process, as the tool runs it by default
+  """
+  compute_centrality(graph, origins, *arguments)
+
+def parallel_engine(graph, origins, *arguments):
+  """
+  Runs the computation on two processes
+  """
+  compute_centrality(graph, origins, *arguments, **{"processes": 2})
+
+def bucket_queue_engine(graph, origins, *arguments):
+  """
+  Runs the computation with a bucket queue as wide as the mean edge weight
+  """
+  compute_centrality(graph, origins, *arguments, **{"queue_quantum":
+      float(graph.weights.mean())})
+
+def chunked_engine(graph, origins, *arguments):
+  """
+  Runs the computation in about four chunks of origins
+  """
+  compute_b = arguments[2]
+  radius = arguments[5]
+  K = len(arguments[9])
+  R = len(radius) if isinstance(radius, list) else 1
+  # At most 6 values per origin and radius, and the accumulations
+  value_count = (6 + K) * R
+  max_memory = fixed_bytes(len(graph), graph.edge_count(), K, compute_b, R,
+      value_count, 1) + (len(origins) // 4 + 1) * origin_bytes(value_count)
+  compute_centrality(graph, origins, *arguments, **{"max_memory":
+      max_memory})
+
+def tiled_engine(graph, origins, *arguments):
+  """
+  Runs the computation in tiles four times as wide as the largest radius, on
+      the nodes of |graph| without their edges
+  """
+  radius = arguments[5]
+  radius = max(radius) if isinstance(radius, list) else radius
+  nodes = Graph(graph.ids, zeros(len(graph) + 1, dtype=int32), [], [],
+      accumulator_fields=graph.accumulator_fields)
+  nodes.node_weights = graph.node_weights
+  nodes.locations = graph.locations
+  compute_centrality(nodes, origins, *arguments, **{"tile_size": 4 * radius,
+      "edge_rows": edge_rows(graph)})
+  graph.metrics = nodes.metrics
+  graph.reach_values = nodes.reach_values
+
+def distance_cache_engine(graph, origins, *arguments):
+  """
+  Runs the computation with a distance cache, built by the same run
+  """
+  directory = mkdtemp()
+  try:
+    compute_centrality(graph, origins, *arguments, **{"distance_cache":
+        directory})
+  finally:
+    rmtree(directory, ignore_errors=True)
+
+# Optimized ways of running the computation, by name, each is called as
+#     |compute_centrality| on a |Graph| with its first ten arguments
+ENGINES = {"serial": serial_engine, "parallel": parallel_engine,
+    "bucket queue": bucket_queue_engine, "chunks": chunked_engine,
+    "tiles": tiled_engine, "distance cache": distance_cache_engine}
+# Engines that only take a network radius
+NETWORK_RADIUS_ENGINES = ("tiles",)
+
+def run_on_copy(graph, origins, arguments, run):
+  """
+  Returns a copy of |graph| with the metrics computed by |run| from |origins|
+      with the rest of the |arguments| of |compute_centrality|
+  """
+  result = copy_graph(graph)
+  run(result, origins, *arguments)
+  return result
+
+def compare_metrics(expected, actual):
+  """
+  Returns the list of mismatches between the metrics of the graphs |expected|
+      and |actual|, as (column, node id, expected value, actual value), values
+      differ by more than |TOLERANCE|; a column computed for only one of them
+      is a mismatch with node id None
+  """
+  mismatches = []
+  for column in sorted(set(expected.metrics) | set(actual.metrics)):
+    if column not in expected.metrics or column not in actual.metrics:
+      mismatches.append((column, None, expected.metrics.get(column),
+          actual.metrics.get(column)))
+      continue
+    expected_values = expected.metrics[column]
+    actual_values = actual.metrics[column]
+    for i in flatnonzero(abs_array(expected_values - actual_values) >
+        TOLERANCE).tolist():
+      mismatches.append((column, expected.ids[i], expected_values[i],
+          actual_values[i]))
+  return mismatches
+
+def compare(graph, origins, arguments, engine, reference=reference_centrality):
+  """
+  Runs |reference| and |engine| on copies of |graph| from |origins| with the
+      rest of the |arguments| of |compute_centrality|, and compares their
+      results
+  Returns the list of mismatches, as returned by |compare_metrics|, with the
+      values of |reference| first
+  """
+  return compare_metrics(run_on_copy(graph, origins, arguments, reference),
+      run_on_copy(graph, origins, arguments, engine))
+
+def run_name(flags, network_radius, accumulator_fields):
+  """
+  Returns the name of a run with the metrics of |flags|, a network or
+      birds-eye radius, and the |accumulator_fields|
+  """
+  return ", ".join([combination_name(flags), "network radius" if
+      network_radius else "birds-eye radius"] + list(accumulator_fields))
+
+def check(graph, radius, engines=ENGINES):
+  """
+  Compares every engine in |engines| against the reference computation for
+      every metric combination, with a network and a birds-eye radius, with
+      and without accumulations, from every node of |graph| within |radius|
+  Returns a dictionary mapping (engine name, run name) to the mismatches
+      found, for those that had any, see |run_name|
+  """
+  graph = with_accumulator(graph)
+  failures = {}
+  for (network_radius, accumulator_fields) in product((True, False), ([],
+      [BENCHMARK_ACCUMULATOR])):
+    for flags in metric_combinations():
+      arguments = flags + (radius, network_radius, BENCHMARK_BETA,
+          list(METRICS), accumulator_fields)
+      # The reference computation is run once for all engines
+      expected = run_on_copy(graph, graph.ids, arguments,
+          reference_centrality)
+      for (name, engine) in sorted(engines.items()):
+        if name in NETWORK_RADIUS_ENGINES and not network_radius:
+          continue
+        mismatches = compare_metrics(expected, run_on_copy(graph, graph.ids,
+            arguments, engine))
+        if mismatches:
+          failures[(name, run_name(flags, network_radius,
+              accumulator_fields))] = mismatches
+  return failures
+
+def format_memory(peak):
+  """
+  Returns |peak| bytes as text
+  """
+  return "unknown" if peak is None else "%.1f MB" % (peak / 2.0**20)
+
+if __name__ == "__main__":
+  if len(argv) > 1 and argv[1] == "check":
+    generator = argv[2] if len(argv) > 2 else "grid"
+    nodes = int(argv[3]) if len(argv) > 3 else 1000
+    graph = GENERATORS[generator](nodes)
+    radius = (float(argv[4]) if len(argv) > 4 else RADIUS_MULTIPLES[0] *
+        graph.weights.mean())
+    failures = check(graph, radius)
+    for ((name, run), mismatches) in sorted(failures.items()):
+      print("%s, %s: %d mismatches, first %s" % (name, run,
+          len(mismatches), mismatches[0]))
+    print("%d nodes, radius %g: %s" % (len(graph), radius, "mismatches found"
+        if failures else "all engines match the reference"))
+  else:
+    generator = argv[1] if len(argv) > 1 else "grid"
+    nodes = int(argv[2]) if len(argv) > 2 else 1000
+    start = time()
+    graph = GENERATORS[generator](nodes)
+    print("%s graph with %d nodes and %d edges, built in %.1fs" % (generator,
+        len(graph), graph.edge_count() // 2, time() - start))
+    radii = ([float(radius) for radius in argv[3].split(",")] if len(argv) > 3
+        else [multiple * graph.weights.mean() for multiple in
+        RADIUS_MULTIPLES])
+    origin_count = min(len(graph), int(argv[4]) if len(argv) > 4 else 1000)
+    processes = int(argv[5]) if len(argv) > 5 else 1
+    # Origins spread over the whole graph
+    origins = [graph.ids[i] for i in RandomState(0).permutation(len(graph))[
+        :origin_count].tolist()]
+    for radius in radii:
+      for flags in metric_combinations():
+        seconds, rate, peak = benchmark(graph, origins, radius, flags,
+            processes)
+        print("radius %g, %s: %.3fs, %.1f origins/s, peak memory %s" % (radius,
+            combination_name(flags), seconds, rate, format_memory(peak)))
@@ -11,41 +11,60 @@
 Script for the computation of the five centrality metrics.
 """
 
+from arcpy import AddMessage
 from arcpy import AddWarning
+from Approximate_Centrality import compute_approximate
+from Approximate_Centrality import sample_limit
+from Centrality_Kernels import compute_distances
+from Centrality_Kernels import graph_arrays
+from Centrality_Kernels import REACH_COUNT
+from Centrality_Kernels import scratch_bytes
+from Centrality_Kernels import sweep_columns
+from Centrality_Kernels import WEIGHTED_REACH
+from Chunked_Centrality import compute_origins_in_chunks
+from Chunked_Centrality import plan_chunks
+from Component_Centrality import compute_origins_by_component
+from Constants import APPROXIMATE_CENTRALITY
 from Constants import BETWEENNESS
+from Constants import BUILDING_DISTANCE_CACHE
 from Constants import CLOSENESS
+from Constants import CONFIDENCE_PREFIX
+from Constants import DISTANCE_CACHE_USED
 from Constants import GRAVITY
-from Constants import LOCATION
-from Constants import NEIGHBORS
+from Constants import INFINITE_RADIUS
 from Constants import NORM_BETWEENNESS
-from Constants import NORM_CLOSENESS
-from Constants import NORM_GRAVITY
-from Constants import NORM_REACH
-from Constants import NORM_STRAIGHTNESS
 from Constants import PROGRESS_NORMALIZATION
+from Constants import radius_labels
 from Constants import REACH
+from Constants import SCRATCH_MEMORY
 from Constants import STEP_4
 from Constants import STRAIGHTNESS
+from Constants import SWEEP_COLUMNS
+from Constants import WARNING_ACCUMULATIONS_DROPPED
 from Constants import WARNING_NO_BETWEENNESS_NORMALIZATION
-from Constants import WEIGHT
-from heapq import heapify
-from heapq import heappop
-from heapq import heappush
+from Distance_Cache import Distance_Matrix_Writer
+from Distance_Cache import graph_key
+from Distance_Cache import load_distance_matrix
+from functools import partial
+from Graph import Graph
+from Graph import graph_from_nodes
+from Graph import metrics_to_nodes
 from math import exp
-from operator import add
-from Utils import dist
-from Utils import eq_tol
+from numpy import asarray
+from numpy import zeros
+from Tiled_Centrality import compute_tiles
 from Utils import Invalid_Parameters_Exception
-from Utils import lt_tol
-from Utils import merge_maps
 from Utils import Progress_Bar
 
 def compute_centrality(nodes, origins, compute_r, compute_g, compute_b,
     compute_c, compute_s, radius, network_radius, beta, measures_to_normalize,
-    accumulator_fields):
+    accumulator_fields, processes=1, sample_size=None, relative_error=None,
+    stratified=False, seed=0, distance_cache=None, queue_quantum=None,
+    max_memory=None, tile_size=None, edge_rows=None):
   """
   Computes reach, gravity, betweenness, closeness, and straightness on a graph.
-  |nodes|: graph representation; dictionary mapping node id's to |Node| objects
+  |nodes|: graph representation; a |Graph|, or a dictionary mapping node id's
+      to |Node| objects
   |origins|: subset of nodes that will be used as sources of shortest path trees
   |compute_r|: compute reach?
   |compute_g|: compute gravity type index?
@@ -53,11 +72,39 @@ def compute_centrality(nodes, origins, compute_r, compute_g, compute_b,
   |compute_c|: compute closeness?
   |compute_s|: compute straightness?
   |radius|: for each node, only consider other nodes that can be reached within
-      this distance
+      this distance, or a list of radii to compute the metrics for
   |network_radius|: use network radius or birds-eye radius?
-  |beta|: parameter for gravity type index
+  |beta|: parameter for gravity type index, or a list of betas to compute
+      gravity for
   |measures_to_normalize|: a list of measures to normalize
   |accumulator_fields|: a list of cost attributes to accumulate
+  |processes|: number of processes to split the origins among
+  |sample_size|, |relative_error|: if either is given, the metrics are
+      estimated from the shortest path trees of a sample of the nodes, see
+      |compute_approximate|; the half widths of the confidence intervals of
+      the estimates are stored in metrics named with |CONFIDENCE_PREFIX|
+  |stratified|, |seed|: how the sample is drawn, as in |pivot_order|
+  |distance_cache|: directory of a |Distance_Matrix| cache, if given, reach,
+      gravity, closeness and straightness are evaluated from the cached
+      distances, which are computed first if the cache does not fit the graph,
+      the origins or the radius
+  |queue_quantum|: if given, Dijkstra uses a |Bucket_Queue| with buckets this
+      wide instead of a binary heap, the results are the same; a quantum close
+      to the typical edge weight works well
+  |max_memory|: if given, the bytes that the graph, its metric columns, the
+      shortest path trees and their values may take; origins are run in
+      chunks that fit, see |compute_origins_in_chunks|, and accumulations are
+      left out if they do not fit; not taken with sampling
+  |tile_size|, |edge_rows|: if given, origins are run one tile of |tile_size|
+      by |tile_size| at a time, on the edges of the adjacency list |edge_rows|
+      that the tile needs, see |compute_tiles|; |nodes| then only has to hold
+      the nodes, with their weights and locations, and the radius has to be a
+      finite network radius
+  If |nodes| is a |Graph|, the results are stored in its |metrics|, otherwise
+      they are stored as attributes of the |Node| objects
+  With several radii or betas, all metrics are computed from one shortest path
+      tree per origin and are stored in one column per radius (and per beta
+      for gravity), named as in |sweep_columns|
   """
 
   # Number of nodes in the graph
@@ -68,202 +115,238 @@ def compute_centrality(nodes, origins, compute_r, compute_g, compute_b,
   elif O == 0:
     return
 
+  # Several radii or betas are computed in a single sweep
+  radii = sorted(set(radius)) if isinstance(radius, (list, tuple)) else [radius]
+  betas = list(beta) if isinstance(beta, (list, tuple)) else [beta]
+  sweep = len(radii) > 1 or len(betas) > 1
+  approximate = sample_size is not None or relative_error is not None
+  if sweep and approximate:
+    raise Invalid_Parameters_Exception("sampling takes a single radius and "
+        "beta")
+  if not sweep:
+    radius, beta = radii[0], betas[0]
+  if max_memory is not None and approximate:
+    raise Invalid_Parameters_Exception("sampling does not take a memory limit")
+  if tile_size is not None and (approximate or distance_cache is not None or
+      max_memory is not None or not network_radius or radii[-1] ==
+      INFINITE_RADIUS):
+    raise Invalid_Parameters_Exception("tiles take a finite network radius, "
+        "without sampling, a distance cache or a memory limit")
+  all_node_columns = [column for (reach_key, weighted_reach_key, metrics,
+      accumulators) in sweep_columns(radii, betas, False, False, compute_b,
+      False, False, []) for (metric, column, norm_column, beta_i) in metrics]
+  if approximate and compute_b:
+    # Estimates of betweenness and of its normalization cover all nodes
+    all_node_columns += [CONFIDENCE_PREFIX + BETWEENNESS, NORM_BETWEENNESS]
+
+  if not isinstance(nodes, Graph):
+    # Run the computation on the equivalent |Graph| and record the results on
+    #     the |Node| objects
+    graph = graph_from_nodes(nodes, list(accumulator_fields))
+    compute_centrality(graph, origins, compute_r, compute_g, compute_b,
+        compute_c, compute_s, radius, network_radius, beta,
+        measures_to_normalize, accumulator_fields, processes, sample_size,
+        relative_error, stratified, seed, distance_cache, queue_quantum,
+        max_memory, tile_size, edge_rows)
+    metrics_to_nodes(graph, nodes, origins, all_node_columns)
+    return
+  graph = nodes
+  if sweep:
+    AddMessage(SWEEP_COLUMNS(radii, radius_labels(radii), betas))
+
   # Preprocessing
-  have_accumulations = len(accumulator_fields) > 0
-  if have_accumulations:
-    empty_accumulations = lambda: dict((field, 0.0) for field in
-        accumulator_fields)
-  have_locations = hasattr(nodes.values()[0], LOCATION)
-  if compute_s and not have_locations:
+  accumulator_fields = [field for field in graph.accumulator_fields if field in
+      accumulator_fields]
+  if compute_s and graph.locations is None:
     # We cannot compute straightness without node locations
     compute_s = False
-  if compute_b:
-    # Initialize betweenness values
-    for id in nodes:
-      setattr(nodes[id], BETWEENNESS, 0.0)
-
-  # Initialize the sum of all node weights (normalization)
-  sum_weights = 0.0
+  chunk_origins = None
+  if max_memory is not None:
+    # Number of origins to run at once within the memory limit
+    columns = sweep_columns(radii, betas, compute_r, compute_g, compute_b,
+        compute_c, compute_s, accumulator_fields)
+    value_count = sum(2 + len([metric for (metric, column, norm_column,
+        beta_i) in metrics if metric != BETWEENNESS]) + len(accumulators) for (
+        reach_key, weighted_reach_key, metrics, accumulators) in columns)
+    chunk_origins, keep_accumulations = plan_chunks(max_memory, N,
+        graph.edge_count(), len(accumulator_fields), compute_b, len(radii),
+        value_count, len(accumulator_fields) * len(radii), max(1,
+        min(processes, O)))
+    if not keep_accumulations and accumulator_fields:
+      AddWarning(WARNING_ACCUMULATIONS_DROPPED)
+      accumulator_fields = []
+  # Origins are run in order of node index, which follows the order the nodes
+  #     were numbered in (see |renumbered|)
+  origin_indices = sorted(graph.index[id] for id in origins if id in
+      graph.index)
+  arrays = graph_arrays(graph, accumulator_fields)
+  arguments = (compute_r, compute_g, compute_b, compute_c, compute_s,
+      radii if sweep else radius, network_radius, betas if sweep else beta,
+      accumulator_fields)
+  columns = sweep_columns(radii, betas, compute_r, compute_g, compute_b,
+      compute_c, compute_s, accumulator_fields)
+
+  # Evaluate reach, gravity, closeness and straightness from cached distances
+  cached_values = None
+  if distance_cache is not None and not (sweep or approximate) and (compute_r
+      or compute_g or compute_c or compute_s):
+    key = graph_key(graph, network_radius)
+    matrix = load_distance_matrix(distance_cache, key, radius, network_radius)
+    if matrix is None or not matrix.covers(origin_indices):
+      writer = Distance_Matrix_Writer(distance_cache, key, N, radius,
+          network_radius)
+      cache_progress = Progress_Bar(O, 1, BUILDING_DISTANCE_CACHE)
+      compute_distances(tuple(None if a is None else a.tolist() for a in
+          arrays), origin_indices, radius, network_radius, writer.add_row,
+          cache_progress.step)
+      matrix = writer.close()
+    else:
+      AddMessage(DISTANCE_CACHE_USED)
+    cached_values = matrix.evaluate(origin_indices, graph.node_weights,
+        graph.locations, compute_r, compute_g, compute_c, compute_s, radius,
+        beta)
+    # Only betweenness and accumulations still need shortest path trees
+    arguments = (False, False, compute_b, False, False, radius,
+        network_radius, beta, accumulator_fields)
 
   # Computation
-  progress = Progress_Bar(O, 1, STEP_4)
-  for s in origins:
-    if s not in nodes:
-      continue
-    weight_s = getattr(nodes[s], WEIGHT)
-    if have_locations: location_s = getattr(nodes[s], LOCATION)
-
-    sum_weights += weight_s
-
-    # Initialize reach (weighted and unweighted) computation for |s|
-    #     (normalization)
-    reach_s = -1
-    weighted_reach_s = -weight_s
-
-    # Initialize measures
-    if compute_g: gravity_s = 0.0
-    if compute_b:
-      P = {s: []} # Predecessors
-      S = [] # Stack containing nodes in the order they are extended
-      sigma = {s: 1.0} # Number of shortest paths from |s| to other nodes
-      delta = {} # Dependency of |s| on other nodes
-    if compute_c: d_sum_s = 0.0
-    if compute_s: straightness_s = 0.0
-    if have_accumulations:
-      accumulations_s = {s: empty_accumulations()}
-
-    d = {s: 0.0} # Shortest distance from |s| to other nodes
-    # Queue for Dijkstra
-    Q = [(0.0, s)] if network_radius else [(0.0, s, 0.0)]
-
-    # If we use euclidean radius, make a list of all reachable nodes
-    if not network_radius:
-      reachable_s = set()
-      for t in nodes:
-        location_t = getattr(nodes[t], LOCATION)
-        if dist(location_s, location_t) <= radius:
-          reachable_s.add(t)
-
-    # Dijkstra
-    while Q and (True if network_radius else reachable_s):
-      # Pop the closest node to |s| from |Q|
-      if network_radius:
-        d_sv, v = heappop(Q)
+  # A sample is drawn from all nodes, see |compute_approximate|
+  progress = Progress_Bar(sample_limit(N, sample_size) if approximate else O,
+      1, STEP_4)
+  if cached_values is not None and not (compute_b or accumulator_fields):
+    values, betweenness = cached_values, [0.0] * N
+  elif approximate:
+    sequences = tuple(None if a is None else a.tolist() for a in arrays)
+    (values, betweenness, errors, node_values, pivots,
+        error) = compute_approximate(sequences, origin_indices, *(arguments +
+        (graph.locations, sample_size, relative_error, stratified, seed,
+        progress.step)))
+    AddMessage(APPROXIMATE_CENTRALITY(pivots, N, error))
+    for (metric, half_widths) in errors.items():
+      if metric == BETWEENNESS:
+        graph.metric(CONFIDENCE_PREFIX + metric)[:] = half_widths
       else:
-        d_sv, v, dist_sv = heappop(Q)
-        if v in reachable_s:
-          reachable_s.remove(v)
-      weight_v = getattr(nodes[v], WEIGHT)
-      if have_locations: location_v = getattr(nodes[v], LOCATION)
-
-      compute = network_radius or dist_sv <= radius
-      if compute:
-        reach_s += 1
-        weighted_reach_s += weight_v
-        if d_sv > 0:
-          if compute_g: gravity_s += weight_v * exp(-d_sv * beta)
-          if compute_c: d_sum_s += weight_v * d_sv
-          if compute_s: straightness_s += (weight_v *
-              dist(location_s, location_v) / d_sv)
-        if compute_b: S.append(v)
-
-      for w, d_vw, accumulations_vw in getattr(nodes[v], NEIGHBORS):
-        # s ~ ... ~ v ~ w
-        d_sw = d_sv + d_vw
-        if not network_radius:
-            # Use Euclidean distance
-            location_w = getattr(nodes[w], LOCATION)
-            dist_sw = dist(location_s, location_w)
-
-        if compute_b: b_refresh = False
-
-        add_w_to_Q = False
-
-        if not w in d: # Found a path from |s| to |w| for the first time
-          if d_sw <= radius or not network_radius:
-            add_w_to_Q = True
-          d[w] = d_sw
-          if compute_b: b_refresh = True
-
-        elif lt_tol(d_sw, d[w]): # Found a better path from |s| to |w|
-          if d_sw <= radius or not network_radius:
-            if d[w] <= radius or not network_radius:
-              longer_path_node = (d[w], w) if network_radius else (d[w], w,
-                  dist_sw)
-              Q.remove(longer_path_node)
-              heapify(Q)
-            add_w_to_Q = True
-          d[w] = d_sw
-          if compute_b: b_refresh = True
+        graph.metric(CONFIDENCE_PREFIX + metric)[origin_indices] = half_widths
+  else:
+    # Buffers are sized to the graph, not to the number of origins
+    AddMessage(SCRATCH_MEMORY(scratch_bytes(N, graph.edge_count(),
+        arguments[2]), max(1, min(processes, O))))
+    if tile_size is not None:
+      values, betweenness = compute_tiles(graph, origin_indices, edge_rows,
+          tile_size, arguments, processes, len(radii), progress.step,
+          queue_quantum)
+    elif chunk_origins is None:
+      values, betweenness = compute_origins_by_component(graph,
+          origin_indices, arguments, processes, len(radii), progress.step,
+          queue_quantum)
+    else:
+      # Each chunk is recorded as soon as it is done, so that the values of
+      #     all origins are never held at once
+      values = {}
+      betweenness = compute_origins_in_chunks(graph, origin_indices,
+          arguments, processes, len(radii), progress.step, queue_quantum,
+          chunk_origins, partial(record_values, graph, columns))
+
+  if cached_values is not None:
+    values.update(cached_values)
+
+  # Record the results
+  record_values(graph, columns, origin_indices, values)
+  for (r, (reach_key, weighted_reach_key, metrics, accumulators)) in enumerate(
+      columns):
+    for (metric, column, norm_column, beta_i) in metrics:
+      if metric == BETWEENNESS:
+        graph.metric(column)[:] = betweenness[r * N:(r + 1) * N]
 
-        if add_w_to_Q:
-          new_node = (d_sw, w) if network_radius else (d_sw, w, dist_sw)
-          heappush(Q, new_node)
-          if have_accumulations:
-            accumulations_s[w] = merge_maps(accumulations_s[v],
-                dict(accumulations_vw), add)
-
-        if compute_b:
-          if b_refresh:
-            sigma[w] = 0.0
-            P[w] = []
-          if eq_tol(d_sw, d[w]): # Count all shortest paths from |s| to |w|
-            sigma[w] += sigma[v] # Update the number of shortest paths
-            P[w].append(v) # |v| is a predecessor of |w|
-            delta[v] = 0.0 # Recognize |v| as a predecessor
-
-    if compute_r: setattr(nodes[s], REACH, weighted_reach_s)
-    if compute_g: setattr(nodes[s], GRAVITY, gravity_s)
+  # Normalization
+  if approximate and BETWEENNESS in measures_to_normalize:
+    # Reach is estimated for every node, not only for the origins, so
+    #     betweenness can be normalized at every node
+    measures_to_normalize = [measure for measure in measures_to_normalize if
+        measure != BETWEENNESS]
     if compute_b:
-      while S: # Revisit nodes in reverse order of distance from |s|
-        w = S.pop()
-        delta_w = delta[w] if w in delta else 0.0 # Dependency of |s| on |w|
-        for v in P[w]:
-          weight_w = getattr(nodes[w], WEIGHT)
-          delta[v] += sigma[v] / sigma[w] * (weight_w + delta_w)
-        if w != s:
-          between_w = getattr(nodes[w], BETWEENNESS)
-          setattr(nodes[w], BETWEENNESS, between_w + delta_w)
-    if compute_c: setattr(nodes[s], CLOSENESS, (1.0 / d_sum_s if d_sum_s > 0
-        else 0.0))
-    if compute_s: setattr(nodes[s], STRAIGHTNESS, straightness_s)
+      pairs = node_values[WEIGHTED_REACH] * (node_values[REACH_COUNT] - 1)
+      normalized = pairs > 0
+      graph.metric(NORM_BETWEENNESS)[normalized] = (betweenness[normalized] /
+          pairs[normalized])
+  normalize_metrics(graph, origin_indices, O, columns, measures_to_normalize)
 
-    nodes[s].reach = reach_s
-    nodes[s].weighted_reach = weighted_reach_s
+def record_values(graph, columns, origin_indices, values):
+  """
+  Records the |values| of the origins with node indices |origin_indices| in the
+      metric columns and reach values of |graph|
+  |columns|: the metric columns, as returned by |sweep_columns|
+  |values|: maps the keys of the values to lists of values for the origins, in
+      order, the keys that are missing are left as they are
+  """
+  for (reach_key, weighted_reach_key, metrics, accumulators) in columns:
+    for column in [column for (metric, column, norm_column, beta_i) in metrics
+        if metric != BETWEENNESS] + accumulators:
+      if column in values:
+        graph.metric(column)[origin_indices] = values[column]
+    for key in (reach_key, weighted_reach_key):
+      if key in values:
+        graph.reach(key)[origin_indices] = values[key]
+
+def _divide(numerators, denominators):
+  """
+  Returns the array of |numerators| / |denominators|, 0 where a denominator is 0
+  """
+  quotients = zeros(len(numerators))
+  nonzero = denominators != 0
+  quotients[nonzero] = numerators[nonzero] / denominators[nonzero]
+  return quotients
 
-    if have_accumulations:
-      total_accumulations_s = empty_accumulations()
-      for v in accumulations_s:
-        total_accumulations_s = merge_maps(total_accumulations_s,
-            accumulations_s[v], add)
-      for field in accumulator_fields:
-        setattr(nodes[s], field, total_accumulations_s[field])
+def normalize_metrics(graph, origin_indices, O, columns, measures_to_normalize):
+  """
+  Normalizes the metrics of the origins recorded in |graph|, one whole column at
+      a time
+  |origin_indices|: node indices of the origins
+  |O|: number of origins
+  |columns|: the metric columns, as returned by |sweep_columns|
+  |measures_to_normalize|: a list of measures to normalize
+  """
+  N = len(graph)
 
-    progress.step()
+  # Initialize the sum of all node weights (normalization)
+  origin_indices = asarray(origin_indices, dtype=int)
+  weights = graph.node_weights[origin_indices]
+  sum_weights = weights.sum()
 
-  # Normalization
   if BETWEENNESS in measures_to_normalize and O < N:
       measures_to_normalize.remove(BETWEENNESS)
       AddWarning(WARNING_NO_BETWEENNESS_NORMALIZATION)
   if measures_to_normalize:
-    norm_progress = Progress_Bar(O, 1, PROGRESS_NORMALIZATION)
-    for s in origins:
-      if s not in nodes:
-        continue
-      reach_s = nodes[s].reach
-      weighted_reach_s = nodes[s].weighted_reach
-
-      # Normalize reach
-      if compute_r and REACH in measures_to_normalize:
-        weight_s = getattr(nodes[s], WEIGHT)
-        try: setattr(nodes[s], NORM_REACH, reach_s / (sum_weights - weight_s))
-        except: setattr(nodes[s], NORM_REACH, 0.0)
-
-      # Normalize gravity
-      if compute_g and GRAVITY in measures_to_normalize:
-        gravity_s = getattr(nodes[s], GRAVITY)
-        try: setattr(nodes[s], NORM_GRAVITY, (exp(beta) * gravity_s /
-            weighted_reach_s))
-        except: setattr(nodes[s], NORM_GRAVITY, 0.0)
-
-      # Normalize betweenness
-      if compute_b and BETWEENNESS in measures_to_normalize:
-        betweenness_s = getattr(nodes[s], BETWEENNESS)
-        try: setattr(nodes[s], NORM_BETWEENNESS, (betweenness_s /
-            (weighted_reach_s * (reach_s - 1))))
-        except: setattr(nodes[s], NORM_BETWEENNESS, 0.0)
-
-      # Normalize closeness
-      if compute_c and CLOSENESS in measures_to_normalize:
-        closeness_s = getattr(nodes[s], CLOSENESS)
-        try: setattr(nodes[s], NORM_CLOSENESS, closeness_s * weighted_reach_s)
-        except: setattr(nodes[s], NORM_CLOSENESS, 0.0)
-
-      # Normalize straightness
-      if compute_s and STRAIGHTNESS in measures_to_normalize:
-        straightness_s = getattr(nodes[s], STRAIGHTNESS)
-        try: setattr(nodes[s], NORM_STRAIGHTNESS, (straightness_s /
-            weighted_reach_s))
-        except: setattr(nodes[s], NORM_STRAIGHTNESS, 0.0)
+    norm_progress = Progress_Bar(len(columns), 1, PROGRESS_NORMALIZATION)
+    for (reach_key, weighted_reach_key, metrics, accumulators) in columns:
+      reach = graph.reach(reach_key)[origin_indices]
+      weighted_reach = graph.reach(weighted_reach_key)[origin_indices]
+      for (metric, column, norm_column, beta_i) in metrics:
+        if metric not in measures_to_normalize:
+          continue
+        values = graph.metric(column)[origin_indices]
+
+        # Normalize reach
+        if metric == REACH:
+          norm_values = _divide(reach, sum_weights - weights)
+
+        # Normalize gravity
+        elif metric == GRAVITY:
+          try: norm_values = exp(beta_i) * _divide(values, weighted_reach)
+          except OverflowError: norm_values = zeros(len(origin_indices))
+
+        # Normalize betweenness
+        elif metric == BETWEENNESS:
+          norm_values = _divide(values, weighted_reach * (reach - 1))
+
+        # Normalize closeness
+        elif metric == CLOSENESS:
+          norm_values = values * weighted_reach
+
+        # Normalize straightness
+        elif metric == STRAIGHTNESS:
+          norm_values = _divide(values, weighted_reach)
+
+        graph.metric(norm_column)[origin_indices] = norm_values
 
       norm_progress.step()
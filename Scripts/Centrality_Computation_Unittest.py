@@ -14,19 +14,105 @@ These are very basic sanity checks, they do not fully test the centrality
 """
 # TODO(mikemeko): add more tests
 
+from Adjacency_File import Adjacency_Writer
+from Adjacency_File import export_dbf
+from Adjacency_File import read_fields
+from Adjacency_File import read_rows
+from Adjacency_File import row_count
+from Adjacency_File import value_fields
+from Approximate_Centrality import pivot_order
+from Centrality_Benchmark import check
+from Centrality_Benchmark import compare
+from Centrality_Benchmark import ENGINES
+from Centrality_Benchmark import GENERATORS
 from Centrality_Computation import compute_centrality
+from Centrality_Kernels import compute_origins
+from Centrality_Kernels import graph_arrays
+from Centrality_Kernels import select_kernel
+from Centrality_Kernels import sweep_columns
+from Chunked_Centrality import fixed_bytes
+from Chunked_Centrality import origin_bytes
+from Component_Centrality import compute_origins_by_component
+from Component_Centrality import TINY_COMPONENT
 from Constants import INFINITE_RADIUS
 from Constants import BETWEENNESS
 from Constants import CLOSENESS
+from Constants import CONFIDENCE_PREFIX
 from Constants import GRAVITY
+from Constants import HILBERT_ORDERING
 from Constants import LOCATION
+from Constants import NORM_BETWEENNESS
+from Constants import NORM_CLOSENESS
+from Constants import NORM_GRAVITY
+from Constants import NORM_REACH
+from Constants import NORM_STRAIGHTNESS
+from Constants import radius_labels
+from Constants import RCM_ORDERING
 from Constants import REACH
+from Constants import STEP_4
 from Constants import STRAIGHTNESS
+from Constants import SWEEP_ACCUMULATOR_NAME
+from Constants import SWEEP_METRIC_NAME
+from Constants import SWEEP_NORM_METRIC_NAME
+from Distance_Cache import graph_key
+from Distance_Cache import load_distance_matrix
+from functools import partial
+from Graph import connected_components
+from Graph import Graph_Builder
+from Graph import hilbert_order
+from Graph import load_graph
+from Graph import load_metrics
+from Graph import rcm_order
+from Graph import renumbered
+from Graph import save_metrics
+from Incremental_Centrality import update_centrality
+from Incremental_Centrality import update_previous_results
+import Instrumentation
+from Instrumentation import EDGES_RELAXED
+from Instrumentation import NODES_SETTLED
+from Instrumentation import PREDECESSOR_ENTRIES
+from itertools import product
+from json import load
 from math import log
 from math import sqrt
+from multiprocessing import Process
+from Native_Adjacency_List import compute_native_adjacency_list
 from Node import Node
+from Parallel_Adjacency_List import solve_cells_in_parallel
+from Parallel_Centrality import standalone_python
+from Parallel_Centrality import worker_processes
+from os import _exit
+from os.path import dirname
+from os.path import getsize
+from os.path import join
+from os.path import splitext
+from pickle import dumps
+from pickle import HIGHEST_PROTOCOL
+from pickle import loads
+from Priority_Queue import Bucket_Queue
+from Priority_Queue import Priority_Queue
+from random import Random
+from Sharded_Centrality import compute_shard
+from Sharded_Centrality import merge_partial_results
+from Sharded_Centrality import parse_shard
+from Shapefile_IO import DBF_Writer
+from Shapefile_IO import DOUBLE_FIELD
+from Shapefile_IO import INTEGER_FIELD
+from Shapefile_IO import POINT_SHAPES
+from Shapefile_IO import POLYLINE_SHAPES
+from Shapefile_IO import read_dbf
+from Shapefile_IO import read_shapefile
+from Shapefile_IO import SHAPEFILE_CODE
+from Shapefile_IO import SHAPEFILE_HEADER_LENGTH
+from shutil import rmtree
+from Spatial_Index import Grid_Index
+from Spatial_Index import kd_batches
+from struct import pack
+from tempfile import mkdtemp
+from Tiled_Centrality import tile_origins
 import unittest
 from Utils import eq_tol
+from Utils import Invalid_Parameters_Exception
 
 def construct_graph(node_ids, edges):
   """
@@ -42,6 +128,140 @@ def construct_graph(node_ids, edges):
     graph[v].add_neighbor(u, weight)
   return graph
 
+def construct_array_graph(node_ids, edges):
+  """
+  Constructs a weighted, undirected, array-backed graph.
+  """
+  builder = Graph_Builder()
+  # Nodes
+  for id in node_ids:
+    builder.add_node(id)
+  # Edges
+  for (u, v, weight) in edges:
+    builder.add_edge(u, v, weight)
+  return builder.build()
+
+def diagonal_grid_graph():
+  """
+  Constructs a 5 by 5 grid with a few diagonals, with locations and weights.
+  """
+  builder = Graph_Builder(["Total_Time"])
+  for x in range(5):
+    for y in range(5):
+      if x < 4:
+        builder.add_edge((x, y), (x + 1, y), 1, {"Total_Time": x + y})
+      if y < 4:
+        builder.add_edge((x, y), (x, y + 1), 1, {"Total_Time": 1})
+      if x < 4 and y < 4 and (x + y) % 3 == 0:
+        builder.add_edge((x, y), (x + 1, y + 1), 1.5, {"Total_Time": 2})
+  graph = builder.build()
+  for id in graph.ids:
+    graph.set_location(id, id)
+    graph.set_weight(id, 1 + sum(id) % 3)
+  return graph
+
+def grid_graph(removed_edges=(), added_edges=(), weights={}):
+  """
+  Constructs a 10 by 10 grid with locations and weights, without the
+      |removed_edges|, with the |added_edges| and with the node |weights| that
+      replace the default ones.
+  """
+  builder = Graph_Builder(["Total_Time"])
+  for x in range(10):
+    for y in range(10):
+      if x < 9 and ((x, y), (x + 1, y)) not in removed_edges:
+        builder.add_edge((x, y), (x + 1, y), 1 + (x * y) % 2,
+            {"Total_Time": 1})
+      if y < 9 and ((x, y), (x, y + 1)) not in removed_edges:
+        builder.add_edge((x, y), (x, y + 1), 1, {"Total_Time": 2})
+  for (u, v, weight) in added_edges:
+    builder.add_edge(u, v, weight, {"Total_Time": 3})
+  graph = builder.build()
+  for id in graph.ids:
+    graph.set_location(id, id)
+    graph.set_weight(id, weights.get(id, 1 + sum(id) % 3))
+  return graph
+
+def assert_same_metrics(graph, other_graph, skipped_columns=()):
+  """
+  Asserts that the two array-backed graphs have the same metric columns, and
+      the same values for each node id in every column but the
+      |skipped_columns|.
+  """
+  assert sorted(graph.metrics) == sorted(other_graph.metrics)
+  for (name, values) in graph.metrics.items():
+    if name in skipped_columns:
+      continue
+    other_values = other_graph.metrics[name]
+    for id in graph.ids:
+      assert eq_tol(values[graph.index[id]], other_values[
+          other_graph.index[id]])
+
+def write_dbf(path, fields, rows):
+  """
+  Writes the DBF table at |path| with |fields| and one record for each item of
+      |rows|, see |DBF_Writer|
+  Returns the number of records written
+  """
+  writer = DBF_Writer(path, fields)
+  try:
+    for values in rows:
+      writer.write(values)
+  finally:
+    writer.close()
+  return writer.record_count
+
+def bounding_box(points):
+  """
+  Returns (x_min, y_min, x_max, y_max) of |points|
+  """
+  xs = [x for (x, y) in points] or [0.0]
+  ys = [y for (x, y) in points] or [0.0]
+  return min(xs), min(ys), max(xs), max(ys)
+
+def write_shapefile(path, shapes, fields, rows):
+  """
+  Writes the shapefile at |path|, with its index and table, holding |shapes|,
+      either all points or all polylines as returned by |read_shapes|, and
+      their attributes |rows| in |fields|, see |write_dbf|
+  """
+  point_type = bool(shapes) and isinstance(shapes[0], tuple)
+  contents = []
+  for shape in shapes:
+    if point_type:
+      contents.append(pack("<idd", POINT_SHAPES[0], shape[0], shape[1]))
+    else:
+      points = [point for part in shape for point in part]
+      starts = [sum(len(part) for part in shape[:i]) for i in xrange(len(
+          shape))]
+      contents.append(pack("<i4d2i", POLYLINE_SHAPES[0], *(bounding_box(
+          points) + (len(shape), len(points)))) + pack("<%di" % len(shape),
+          *starts) + pack("<%dd" % (2 * len(points)), *[coordinate for point in
+          points for coordinate in point]))
+  all_points = ([shape for shape in shapes] if point_type else [point for
+      shape in shapes for part in shape for point in part])
+  base = splitext(path)[0]
+  for (extension, record_length) in [(".shp", lambda content: 8 + len(
+      content)), (".shx", lambda content: 8)]:
+    file_length = SHAPEFILE_HEADER_LENGTH + sum(record_length(content) for
+        content in contents)
+    shape_file = open(base + extension, "wb")
+    try:
+      shape_file.write(pack(">i20xi", SHAPEFILE_CODE, file_length // 2) +
+          pack("<ii4d32x", 1000, POINT_SHAPES[0] if point_type else
+          POLYLINE_SHAPES[0], *bounding_box(all_points)))
+      offset = SHAPEFILE_HEADER_LENGTH
+      for (number, content) in enumerate(contents):
+        if extension == ".shp":
+          shape_file.write(pack(">ii", number + 1, len(content) // 2) +
+              content)
+        else:
+          shape_file.write(pack(">ii", offset // 2, len(content) // 2))
+        offset += 8 + len(content)
+    finally:
+      shape_file.close()
+  write_dbf(base + ".dbf", fields, rows)
+
 class TestReach(unittest.TestCase):
   """
   Reach
@@ -78,6 +298,15 @@ class TestReach(unittest.TestCase):
     assert eq_tol(getattr(self.graph["B"], REACH), 2)
     assert eq_tol(getattr(self.graph["C"], REACH), 3)
     assert eq_tol(getattr(self.graph["D"], REACH), 1)
+  def test_Array_Graph_Reach(self):
+    """
+    Test reach at radius 1 on the array-backed graph representation
+    """
+    graph = construct_array_graph(self.nodes, self.edges)
+    compute_centrality(graph, self.nodes, True, False, False, False, False,
+        1, True, 1, [], [])
+    reach = graph.metrics[REACH]
+    assert [reach[graph.index[id]] for id in self.nodes] == [2, 2, 3, 1]
 
 class TestGravity(unittest.TestCase):
   """
@@ -133,6 +362,23 @@ class TestBetweenness(unittest.TestCase):
     assert eq_tol(getattr(self.graph["B"], BETWEENNESS), 0)
     assert eq_tol(getattr(self.graph["C"], BETWEENNESS), 6)
     assert eq_tol(getattr(self.graph["D"], BETWEENNESS), 0)
+  def test_Parallel_Betweenness(self):
+    """
+    Test betweenness at infinite radius with the origins split among processes
+    """
+    compute_centrality(self.graph, self.nodes, False, False, True, False, False,
+        INFINITE_RADIUS, True, 1, [], [], 2)
+    assert eq_tol(getattr(self.graph["A"], BETWEENNESS), 0)
+    assert eq_tol(getattr(self.graph["B"], BETWEENNESS), 0)
+    assert eq_tol(getattr(self.graph["C"], BETWEENNESS), 6)
+    assert eq_tol(getattr(self.graph["D"], BETWEENNESS), 0)
+  def test_Worker_Processes(self):
+    """
+    Test that worker processes are started with a standalone interpreter
+    """
+    assert standalone_python() is not None
+    assert worker_processes(1) == 1
+    assert worker_processes(2) == 2
 
 class TestCloseness(unittest.TestCase):
   """
@@ -199,5 +445,1253 @@ class TestStraightness(unittest.TestCase):
     assert eq_tol(getattr(self.graph["D"], STRAIGHTNESS),
         1 + 2 * sqrt(5) / (1 + sqrt(2)))
 
+class TestEuclideanRadius(unittest.TestCase):
+  """
+  Reach with a birds-eye radius
+    |
+   1| A
+    | |\
+   0| | C--D
+    | |/
+  -1| B
+     --------
+     -1 0  1
+  """
+  def setUp(self):
+    """
+    Setup
+    """
+    self.nodes = ["A", "B", "C", "D"]
+    self.edges = [("A", "B", 2), ("A", "C", sqrt(2)), ("B", "C", sqrt(2)),
+        ("C", "D", 1)]
+    self.graph = construct_graph(self.nodes, self.edges)
+    self.locations = [(-1, 1), (-1, -1), (0, 0), (1, 0)]
+    for (id, location) in zip(self.nodes, self.locations):
+      setattr(self.graph[id], LOCATION, location)
+  def test_Euclidean_Reach(self):
+    """
+    Test reach at a birds-eye radius of 2
+    """
+    compute_centrality(self.graph, self.nodes, True, False, False, False, False,
+        2, False, 1, [], [])
+    assert eq_tol(getattr(self.graph["A"], REACH), 2)
+    assert eq_tol(getattr(self.graph["B"], REACH), 2)
+    assert eq_tol(getattr(self.graph["C"], REACH), 3)
+    assert eq_tol(getattr(self.graph["D"], REACH), 1)
+  def test_Grid_Index(self):
+    """
+    Test radius queries on the spatial index against all pairwise distances
+    """
+    flat_locations = [coordinate for location in self.locations for
+        coordinate in location]
+    for cell_size in [0.5, 1, 2, 10]:
+      index = Grid_Index(flat_locations, cell_size)
+      for (x, y) in self.locations:
+        for radius in [0, 1, sqrt(2), 2, 3]:
+          expected = [i for (i, location) in enumerate(self.locations) if
+              sqrt((x - location[0])**2 + (y - location[1])**2) <= radius]
+          assert sorted(index.within(x, y, radius).tolist()) == expected
+
+class TestAccumulations(unittest.TestCase):
+  """
+  Accumulations
+  A--B--C
+   \   /
+    \ /
+     D
+  """
+  def setUp(self):
+    """
+    Setup
+    """
+    self.nodes = ["A", "B", "C", "D"]
+    self.graph = construct_graph(self.nodes, [])
+    for (u, v, weight, time) in [("A", "B", 1, 2), ("B", "C", 1, 2),
+        ("A", "D", 3, 1), ("C", "D", 3, 1)]:
+      self.graph[u].add_neighbor(v, weight, {"Total_Time": time})
+      self.graph[v].add_neighbor(u, weight, {"Total_Time": time})
+  def test_Accumulations(self):
+    """
+    Test that accumulations are summed along shortest paths
+    """
+    compute_centrality(self.graph, self.nodes, True, False, False, False, False,
+        INFINITE_RADIUS, True, 1, [], ["Total_Time"])
+    assert eq_tol(getattr(self.graph["A"], "Total_Time"), 2 + 4 + 1)
+    assert eq_tol(getattr(self.graph["B"], "Total_Time"), 2 + 2 + 3)
+    assert eq_tol(getattr(self.graph["D"], "Total_Time"), 1 + 1 + 3)
+
+class TestDecreaseKey(unittest.TestCase):
+  """
+  Shortest paths that are improved after they are first found
+  A--C
+  | /
+  B--D
+  """
+  def setUp(self):
+    """
+    Setup
+    """
+    self.nodes = ["A", "B", "C", "D"]
+    self.edges = [("A", "B", 10), ("A", "C", 1), ("B", "C", 1), ("B", "D", 1)]
+    self.graph = construct_graph(self.nodes, self.edges)
+  def test_Closeness(self):
+    """
+    Test closeness at infinite radius
+    """
+    compute_centrality(self.graph, self.nodes, False, False, False, True, False,
+        INFINITE_RADIUS, True, 1, [], [])
+    assert eq_tol(getattr(self.graph["A"], CLOSENESS), 1.0 / 6)
+    assert eq_tol(getattr(self.graph["D"], CLOSENESS), 1.0 / 6)
+  def test_Betweenness(self):
+    """
+    Test betweenness at infinite radius
+    """
+    compute_centrality(self.graph, self.nodes, False, False, True, False, False,
+        INFINITE_RADIUS, True, 1, [], [])
+    assert eq_tol(getattr(self.graph["A"], BETWEENNESS), 0)
+    assert eq_tol(getattr(self.graph["B"], BETWEENNESS), 4)
+    assert eq_tol(getattr(self.graph["C"], BETWEENNESS), 4)
+    assert eq_tol(getattr(self.graph["D"], BETWEENNESS), 0)
+  def test_Priority_Queue(self):
+    """
+    Test that stale entries are skipped by the priority queue
+    """
+    Q = Priority_Queue([(3.0, "A"), (2.0, "B")])
+    Q.decrease_key((1.0, "A"))
+    assert len(Q) == 2
+    assert Q.pop() == (1.0, "A")
+    assert Q.pop() == (2.0, "B")
+    assert not Q
+  def test_Bucket_Queue(self):
+    """
+    Test that the bucket queue pops entries in the same order as the priority
+        queue, ties included
+    """
+    for quantum in [0.3, 1.0, 4.0]:
+      random = Random(quantum)
+      Q = Priority_Queue()
+      B = Bucket_Queue(quantum=quantum)
+      last = 0.0
+      for i in range(500):
+        if Q and random.random() < 0.4:
+          entry = Q.pop()
+          assert B.pop() == entry
+          last = entry[0]
+        else:
+          # Priorities are never below the last one popped, with many ties
+          entry = (last + random.randint(0, 8) * 0.5, random.randint(0, 50))
+          for queue in (Q, B):
+            if entry[1] in queue:
+              queue.decrease_key(entry)
+            else:
+              queue.push(entry)
+        assert len(Q) == len(B)
+      while Q:
+        assert B.pop() == Q.pop()
+      assert not B
+  def test_Bucket_Queue_Centrality(self):
+    """
+    Test that centrality is the same with a bucket queue
+    """
+    metrics = [REACH, GRAVITY, BETWEENNESS, CLOSENESS]
+    for radius in [2, INFINITE_RADIUS]:
+      results = []
+      for quantum in [None, 0.5, 3]:
+        graph = construct_graph(self.nodes, self.edges)
+        compute_centrality(graph, self.nodes, True, True, True, True, False,
+            radius, True, 1, list(metrics), [], queue_quantum=quantum)
+        results.append([getattr(graph[id], metric) for id in self.nodes for
+            metric in metrics])
+      for values in results[1:]:
+        assert all(eq_tol(a, b) for (a, b) in zip(values, results[0]))
+
+class TestKernels(unittest.TestCase):
+  """
+  Specialized kernels, compared against the general kernel on
+      |diagonal_grid_graph|
+  """
+  def setUp(self):
+    """
+    Setup
+    """
+    self.graph = diagonal_grid_graph()
+  def test_Kernels(self):
+    """
+    Test every combination of metrics and options
+    """
+    origins = range(len(self.graph))
+    for options in product([False, True], repeat=7):
+      (compute_r, compute_g, compute_b, compute_c, compute_s, network_radius,
+          have_accumulations) = options
+      accumulator_fields = ["Total_Time"] if have_accumulations else []
+      sequences = tuple(a.tolist() for a in graph_arrays(self.graph,
+          accumulator_fields))
+      arguments = (compute_r, compute_g, compute_b, compute_c, compute_s, 2.5,
+          network_radius, 0.5, accumulator_fields)
+      kernel = select_kernel(compute_r, compute_g, compute_b, compute_c,
+          compute_s, network_radius, have_accumulations, True)
+      assert kernel is not compute_origins
+      results = []
+      for f in [compute_origins, kernel]:
+        betweenness = [0.0] * len(self.graph)
+        values = f(sequences, origins, *(arguments + (betweenness,
+            lambda: None)))
+        results.append((values, betweenness))
+      (general_values, general_betweenness), (values, betweenness) = results
+      assert sorted(values.keys()) == sorted(general_values.keys())
+      for key in values:
+        assert all(eq_tol(a, b) for (a, b) in zip(values[key],
+            general_values[key]))
+      assert all(eq_tol(a, b) for (a, b) in zip(betweenness,
+          general_betweenness))
+  def test_Scratch_Reset(self):
+    """
+    Test that the scratch buffers reused across origins give the same results
+        as one call per origin
+    """
+    sequences = tuple(a.tolist() for a in graph_arrays(self.graph, []))
+    arguments = (True, True, True, True, True, 2.5, True, 0.5, [])
+    betweenness = [0.0] * len(self.graph)
+    values = compute_origins(sequences, range(len(self.graph)), *(arguments +
+        (betweenness, lambda: None)))
+    separate_betweenness = [0.0] * len(self.graph)
+    for s in range(len(self.graph)):
+      separate_values = compute_origins(sequences, [s], *(arguments + (
+          separate_betweenness, lambda: None)))
+      for key in values:
+        assert eq_tol(values[key][s], separate_values[key][0])
+    assert all(eq_tol(a, b) for (a, b) in zip(betweenness,
+        separate_betweenness))
+
+class TestSweep(unittest.TestCase):
+  """
+  Several radii and betas computed in one sweep, compared against separate
+      runs on |diagonal_grid_graph|
+  """
+  def setUp(self):
+    """
+    Setup
+    """
+    self.graph = diagonal_grid_graph()
+  def test_Sweep(self):
+    """
+    Test that each radius and beta of the sweep gives the single run results
+    """
+    radii = [1.5, 2.5, INFINITE_RADIUS]
+    betas = [0.5, 1.0]
+    norm_metrics = {REACH: NORM_REACH, GRAVITY: NORM_GRAVITY,
+        BETWEENNESS: NORM_BETWEENNESS, CLOSENESS: NORM_CLOSENESS,
+        STRAIGHTNESS: NORM_STRAIGHTNESS}
+    for network_radius in [True, False]:
+      self.graph.metrics = {}
+      compute_centrality(self.graph, self.graph.ids, True, True, True, True,
+          True, radii, network_radius, betas, list(norm_metrics),
+          ["Total_Time"])
+      sweep_metrics = self.graph.metrics
+      for (radius, label) in zip(radii, radius_labels(radii)):
+        for (beta_index, beta) in enumerate(betas):
+          self.graph.metrics = {}
+          compute_centrality(self.graph, self.graph.ids, True, True, True,
+              True, True, radius, network_radius, beta, list(norm_metrics),
+              ["Total_Time"])
+          columns = [(SWEEP_ACCUMULATOR_NAME(0, label), "Total_Time")]
+          for (metric, norm_metric) in norm_metrics.items():
+            index = beta_index if metric == GRAVITY else None
+            columns.append((SWEEP_METRIC_NAME(metric, label, index), metric))
+            columns.append((SWEEP_NORM_METRIC_NAME(metric, label, index),
+                norm_metric))
+          for (sweep_column, column) in columns:
+            assert all(eq_tol(a, b) for (a, b) in zip(
+                sweep_metrics[sweep_column], self.graph.metrics[column]))
+  def test_Sweep_Columns(self):
+    """
+    Test that the sweep columns are distinct field names, labeled by position
+        when the radii have no short distinct labels
+    """
+    for (radii, labels) in [([400, 800.5, INFINITE_RADIUS], ["400", "800p5",
+        "Inf"]), ([1234.5678, 1234.5679, 1e7 + 0.5], ["r1", "r2", "r3"]),
+        ([0.25, 12345.5], ["r1", "r2"])]:
+      assert radius_labels(radii) == labels
+      columns = sweep_columns(radii, [0.1 * k for k in xrange(1, 13)], True,
+          True, True, True, True, ["Total_%d" % k for k in xrange(12)])
+      names = [name for (reach_key, weighted_reach_key, metrics,
+          accumulators) in columns for name in accumulators + [column for
+          (metric, column, norm_column, beta) in metrics] + [norm_column for
+          (metric, column, norm_column, beta) in metrics]]
+      assert all(len(name) <= 10 for name in names)
+      assert all(name.replace("_", "").isalnum() for name in names)
+      assert len(set(names)) == len(names)
+    self.assertRaises(Invalid_Parameters_Exception, sweep_columns, [800.5,
+        900.5], range(100), False, True, False, False, False, [])
+  def test_Parallel_Sweep(self):
+    """
+    Test that a sweep split among two processes gives the same results
+    """
+    graphs = []
+    for processes in [1, 2]:
+      graph = diagonal_grid_graph()
+      compute_centrality(graph, graph.ids, True, True, True, True, True, [1.5,
+          2.5], True, [0.5, 1.0], [], ["Total_Time"], processes)
+      graphs.append(graph)
+    assert_same_metrics(*graphs)
+
+class TestApproximate(unittest.TestCase):
+  """
+  Metrics estimated from a sample of the origins, on |diagonal_grid_graph|
+  """
+  def setUp(self):
+    """
+    Setup
+    """
+    self.graph = diagonal_grid_graph()
+  def test_Full_Sample(self):
+    """
+    Test that a sample of all nodes gives the exact results, for all origins
+        and for some of them
+    """
+    metrics = [REACH, GRAVITY, BETWEENNESS, CLOSENESS, STRAIGHTNESS]
+    for (network_radius, origins) in product([True, False],
+        [self.graph.ids, self.graph.ids[::3]]):
+      # A birds-eye radius cannot be sampled with accumulations
+      fields = ["Total_Time"] if network_radius else []
+      self.graph.metrics = {}
+      compute_centrality(self.graph, origins, True, True, True, True, True,
+          2.5, network_radius, 0.5, [], fields)
+      exact_metrics = self.graph.metrics
+      self.graph.metrics = {}
+      compute_centrality(self.graph, origins, True, True, True, True, True,
+          2.5, network_radius, 0.5, [], fields, sample_size=len(self.graph))
+      indices = [self.graph.index[id] for id in origins]
+      for column in metrics + fields:
+        # Betweenness is estimated for every node, the others for the origins
+        rows = slice(None) if column == BETWEENNESS else indices
+        assert all(eq_tol(a, b) for (a, b) in zip(
+            exact_metrics[column][rows], self.graph.metrics[column][rows]))
+        assert all(eq_tol(a, 0) for a in self.graph.metrics[CONFIDENCE_PREFIX
+            + column][rows])
+    self.assertRaises(Invalid_Parameters_Exception, compute_centrality,
+        self.graph, self.graph.ids, True, False, False, False, False, 2.5,
+        False, 0.5, [], ["Total_Time"], sample_size=5)
+  def test_Seed(self):
+    """
+    Test that the same seed gives the same estimates, and that betweenness is
+        normalized from a sample of some of the origins
+    """
+    origins = self.graph.ids[::2]
+    results = []
+    for i in xrange(2):
+      self.graph.metrics = {}
+      compute_centrality(self.graph, origins, False, False, True, True, False,
+          INFINITE_RADIUS, True, 0.5, [BETWEENNESS], [], sample_size=5,
+          stratified=True, seed=7)
+      results.append(self.graph.metrics)
+    assert sorted(results[0].keys()) == sorted(results[1].keys())
+    for column in results[0]:
+      assert all(a == b for (a, b) in zip(results[0][column],
+          results[1][column]))
+    assert results[0][NORM_BETWEENNESS].any()
+  def test_Stratified_Order(self):
+    """
+    Test that every prefix of a stratified order takes from each stratum in
+        proportion to its size
+    """
+    origins = range(100)
+    order = pivot_order(origins, None, True, 1)
+    assert sorted(order) == origins
+    for k in [10, 50]:
+      # 10 strata of 10 consecutive origins
+      counts = [0] * 10
+      for s in order[:k]:
+        counts[s // 10] += 1
+      assert max(counts) - min(counts) <= 2
+
+class TestDistanceCache(unittest.TestCase):
+  """
+  Metrics evaluated from cached distances, on |diagonal_grid_graph|
+  """
+  def setUp(self):
+    """
+    Setup
+    """
+    self.graph = diagonal_grid_graph()
+    self.directory = mkdtemp()
+  def tearDown(self):
+    """
+    Remove the cache
+    """
+    rmtree(self.directory)
+  def run_metrics(self, radius, network_radius, beta, distance_cache):
+    """
+    Returns a new grid with the metrics computed with or without the cache
+    """
+    graph = diagonal_grid_graph()
+    compute_centrality(graph, graph.ids, True, True, True, True, True, radius,
+        network_radius, beta, [REACH, CLOSENESS], [],
+        distance_cache=distance_cache)
+    return graph
+  def test_Distance_Cache(self):
+    """
+    Test that the cached distances give the exact results for smaller radii
+        and other betas, and that the cache is rebuilt when the graph or, for
+        a birds-eye radius, the node locations change
+    """
+    for network_radius in [True, False]:
+      self.run_metrics(3, network_radius, 0.5, self.directory)
+      key = graph_key(self.graph, network_radius)
+      matrix = load_distance_matrix(self.directory, key, 3, network_radius)
+      assert matrix is not None
+      for (radius, beta) in [(3, 0.5), (2, 1.5), (1, 0.5)]:
+        assert_same_metrics(self.run_metrics(radius, network_radius, beta,
+            None), self.run_metrics(radius, network_radius, beta,
+            self.directory))
+      assert load_distance_matrix(self.directory, key, 4,
+          network_radius) is None
+    network_key = graph_key(self.graph, True)
+    key = graph_key(self.graph, False)
+    assert network_key != key
+    # Locations only matter to a birds-eye radius
+    self.graph.locations[0] += 0.5
+    assert graph_key(self.graph, True) == network_key
+    assert load_distance_matrix(self.directory, graph_key(self.graph, False),
+        3, False) is None
+    self.graph.locations[0] -= 0.5
+    assert load_distance_matrix(self.directory, key, 3, False) is not None
+    self.graph.weights[0] += 1
+    assert load_distance_matrix(self.directory, graph_key(self.graph, False),
+        3, False) is None
+
+class TestIncremental(unittest.TestCase):
+  """
+  Results updated after changes to |grid_graph|, compared against full runs
+  """
+  def test_Incremental(self):
+    """
+    Test weight changes, edge changes, and both
+    """
+    metrics = [REACH, GRAVITY, BETWEENNESS, CLOSENESS, STRAIGHTNESS]
+    arguments = (True, True, True, True, True, 3, True, 0.5)
+    for (removed_edges, added_edges, weights) in [
+        ((), (), {(2, 2): 5, (7, 3): 0.5}),
+        ((((8, 8), (8, 9)),), (((0, 0), (1, 1), 1.5),), {}),
+        ((((1, 8), (2, 8)),), (), {(5, 5): 4, (1, 7): 2})]:
+      graph = grid_graph()
+      compute_centrality(graph, graph.ids, *(arguments + (list(metrics),
+          ["Total_Time"])))
+      new_graph = grid_graph(removed_edges, added_edges, weights)
+      recomputed = update_centrality(graph, new_graph, graph.ids, *(
+          arguments + (list(metrics), ["Total_Time"])))
+      assert recomputed < len(graph) and (recomputed > 0) == bool(
+          removed_edges or added_edges)
+      full_graph = grid_graph(removed_edges, added_edges, weights)
+      compute_centrality(full_graph, full_graph.ids, *(arguments +
+          (list(metrics), ["Total_Time"])))
+      assert_same_metrics(full_graph, new_graph)
+  def test_Previous_Results(self):
+    """
+    Test that a run keeps its graph and results in the previous results file,
+        that the next run on an edited graph starts from them, and that
+        results computed with other parameters are not used
+    """
+    metrics = [REACH, GRAVITY, BETWEENNESS, CLOSENESS, STRAIGHTNESS]
+    directory = mkdtemp()
+    path = join(directory, "Previous_Results.npz")
+    try:
+      graph = grid_graph()
+      for (radius, removed_edges, recomputed) in [(3, (), 100), (3, (((8, 8),
+          (8, 9)),), None), (4, (((8, 8), (8, 9)),), 100)]:
+        arguments = (True, True, True, True, True, radius, True, 0.5,
+            list(metrics), ["Total_Time"])
+        new_graph = grid_graph(removed_edges)
+        count = update_previous_results(path, new_graph, new_graph.ids,
+            *arguments)
+        assert count == recomputed or (recomputed is None and 0 < count <
+            len(graph))
+        full_graph = grid_graph(removed_edges)
+        compute_centrality(full_graph, full_graph.ids, *arguments)
+        assert_same_metrics(full_graph, new_graph)
+        saved_graph, key = load_graph(path)
+        assert saved_graph.ids == new_graph.ids
+        assert (saved_graph.indices == new_graph.indices).all()
+        assert (saved_graph.locations == new_graph.locations).all()
+        assert saved_graph.accumulator_fields == ("Total_Time",)
+        assert_same_metrics(new_graph, saved_graph)
+    finally:
+      rmtree(directory)
+
+class TestComponents(unittest.TestCase):
+  """
+  Centrality computed one connected component at a time, compared against runs
+      on the whole graph
+  """
+  def setUp(self):
+    """
+    Setup: a 6 by 6 grid, a 3 by 4 grid, a path of 4 nodes and 2 lone nodes
+    """
+    builder = Graph_Builder(["Total_Time"])
+    for (name, width, height) in [("a", 6, 6), ("b", 3, 4), ("c", 4, 1)]:
+      for x in range(width):
+        for y in range(height):
+          if x + 1 < width:
+            builder.add_edge((name, x, y), (name, x + 1, y), 1 + (x * y) % 2,
+                {"Total_Time": 1})
+          if y + 1 < height:
+            builder.add_edge((name, x, y), (name, x, y + 1), 1,
+                {"Total_Time": 2})
+    builder.add_node(("d", 0, 0))
+    builder.add_node(("e", 0, 0))
+    self.builder = builder
+  def build(self, spacing=10):
+    """
+    Returns a new graph with locations and weights, the components are
+        |spacing| apart in x
+    """
+    graph = self.builder.build()
+    for id in graph.ids:
+      graph.set_location(id, (id[1] + spacing * "abcde".index(id[0]), id[2]))
+      graph.set_weight(id, 1 + (id[1] + id[2]) % 3)
+    return graph
+  def test_Components(self):
+    """
+    Test the components, the subgraphs, and the computed metrics
+    """
+    graph = self.build()
+    labels = connected_components(graph)
+    assert labels.max() == 4
+    for i in range(len(graph)):
+      for j in graph.indices[graph.indptr[i]:graph.indptr[i + 1]]:
+        assert labels[i] == labels[j]
+    nodes = (labels == labels[graph.index[("b", 0, 0)]]).nonzero()[0]
+    subgraph = graph.subgraph(nodes)
+    assert len(subgraph) == 12 and subgraph.indices.max() < 12
+    assert sorted(subgraph.ids) == sorted(graph.ids[i] for i in nodes)
+    origins = [graph.index[id] for id in graph.ids if id[1] != 1]
+    # With a birds-eye radius, the circles of the origins reach into the other
+    #     components
+    for (spacing, radius, network_radius) in [(10, 3, True), (10,
+        INFINITE_RADIUS, True), (6.5, 3, False)]:
+      graph = self.build(spacing)
+      sequences = tuple(a.tolist() for a in graph_arrays(graph,
+          ["Total_Time"]))
+      arguments = (True, True, True, True, True, radius, network_radius, 0.5,
+          ["Total_Time"])
+      # Every origin run on the whole graph
+      whole_betweenness = [0.0] * len(graph)
+      whole_values = compute_origins(sequences, origins, *(arguments + (
+          whole_betweenness, lambda: None)))
+      # No tiny components, the default ones, and all components tiny
+      for (processes, tiny_component) in product([1, 2], [1, TINY_COMPONENT,
+          len(graph)]):
+        values, betweenness = compute_origins_by_component(graph, origins,
+            arguments, processes, 1, lambda: None, None, tiny_component)
+        assert sorted(values) == sorted(whole_values)
+        for key in values:
+          assert all(eq_tol(a, b) for (a, b) in zip(values[key],
+              whole_values[key]))
+        assert all(eq_tol(a, b) for (a, b) in zip(betweenness,
+            whole_betweenness))
+    # The metrics, from the values and betweenness of the components
+    graph = self.build()
+    compute_centrality(graph, graph.ids, True, True, True, True, True, 3,
+        True, 0.5, [BETWEENNESS], ["Total_Time"])
+    assert graph.metrics[REACH][graph.index[("d", 0, 0)]] == 0
+    assert graph.metrics[BETWEENNESS].any()
+
+class TestResults(unittest.TestCase):
+  """
+  Metric columns written to a file and read back, on |diagonal_grid_graph|
+  """
+  def setUp(self):
+    """
+    Setup
+    """
+    self.graph = diagonal_grid_graph()
+    self.directory = mkdtemp()
+  def tearDown(self):
+    """
+    Remove the file
+    """
+    rmtree(self.directory)
+  def test_Save_Load(self):
+    """
+    Test that the columns are read back as they were written
+    """
+    metrics = [REACH, GRAVITY, BETWEENNESS, CLOSENESS, STRAIGHTNESS]
+    compute_centrality(self.graph, self.graph.ids, True, True, True, True,
+        True, 2.5, True, 0.5, list(metrics), ["Total_Time"])
+    path = join(self.directory, "results.npz")
+    save_metrics(self.graph, path)
+    graph = construct_array_graph(self.graph.ids, [])
+    assert load_metrics(graph, path)
+    assert_same_metrics(self.graph, graph)
+    assert sorted(graph.reach_values) == sorted(self.graph.reach_values)
+    other_graph = construct_array_graph(self.graph.ids[1:], [])
+    assert not load_metrics(other_graph, path)
+    assert not other_graph.metrics
+
+class TestOrdering(unittest.TestCase):
+  """
+  Nodes renumbered along a Hilbert curve or in reverse Cuthill-McKee order
+  """
+  def test_Hilbert(self):
+    """
+    Test that consecutive nodes in Hilbert order are neighbors on an 8 by 8 grid
+    """
+    locations = [(x, y) for x in range(8) for y in range(8)]
+    order = hilbert_order(locations).tolist()
+    assert sorted(order) == range(64)
+    for (i, j) in zip(order, order[1:]):
+      assert (abs(locations[i][0] - locations[j][0]) + abs(locations[i][1] -
+          locations[j][1])) == 1
+  def test_RCM(self):
+    """
+    Test that a path with shuffled ids is numbered along the path
+    """
+    ids = range(20)
+    Random(1).shuffle(ids)
+    graph = construct_array_graph(ids, zip(ids, ids[1:], [1] * 19))
+    renumbered_graph = graph.subgraph(rcm_order(graph))
+    for i in range(len(renumbered_graph)):
+      for j in renumbered_graph.indices[renumbered_graph.indptr[i]:
+          renumbered_graph.indptr[i + 1]]:
+        assert abs(i - j) == 1
+  def test_Renumbered(self):
+    """
+    Test that renumbering does not change the metrics of any node id
+    """
+    metrics = [REACH, GRAVITY, BETWEENNESS, CLOSENESS, STRAIGHTNESS]
+    graph = diagonal_grid_graph()
+    origins = [id for id in graph.ids if id[0] != 2]
+    compute_centrality(graph, origins, True, True, True, True, True, 2.5, True,
+        0.5, list(metrics), ["Total_Time"])
+    for ordering in [HILBERT_ORDERING, RCM_ORDERING]:
+      renumbered_graph = renumbered(diagonal_grid_graph(), ordering)
+      assert renumbered_graph.ids != graph.ids
+      compute_centrality(renumbered_graph, origins, True, True, True, True,
+          True, 2.5, True, 0.5, list(metrics), ["Total_Time"])
+      # Accumulations follow one of the shortest paths when several are as
+      #     short, which one can depend on the node numbering
+      assert_same_metrics(graph, renumbered_graph, ["Total_Time"])
+
+class TestChunks(unittest.TestCase):
+  """
+  Origins run in chunks within a memory limit, on |grid_graph|
+  """
+  def test_Chunks(self):
+    """
+    Test that chunks give the same results as a single run
+    """
+    metrics = [REACH, GRAVITY, BETWEENNESS, CLOSENESS, STRAIGHTNESS]
+    arguments = (True, True, True, True, True, 4, True, 0.5)
+    graph = grid_graph()
+    compute_centrality(graph, graph.ids, *(arguments + (list(metrics),
+        ["Total_Time"])))
+    N, E = len(graph), graph.edge_count()
+    # Reach, gravity, closeness, straightness, one accumulation and the two
+    #     reach keys per origin
+    value_count = 7
+    for processes in [1, 2]:
+      max_memory = (fixed_bytes(N, E, 1, True, 1, value_count, processes) +
+          7 * origin_bytes(value_count))
+      chunked_graph = grid_graph()
+      compute_centrality(chunked_graph, chunked_graph.ids, *(arguments + (
+          list(metrics), ["Total_Time"], processes, None, None, False, 0, None,
+          None, max_memory)))
+      assert_same_metrics(graph, chunked_graph)
+  def test_Limits(self):
+    """
+    Test that accumulations are left out when they do not fit, and that a
+        limit too low for a single origin or combined with sampling is refused
+    """
+    graph = grid_graph()
+    N, E = len(graph), graph.edge_count()
+    # Reach and the two reach keys, and one accumulation
+    max_memory = fixed_bytes(N, E, 0, False, 1, 3, 1) + 1000
+    assert max_memory < fixed_bytes(N, E, 1, False, 1, 4, 1)
+    compute_centrality(graph, graph.ids, True, False, False, False, False, 4,
+        True, 0.5, [], ["Total_Time"], max_memory=max_memory)
+    assert REACH in graph.metrics and "Total_Time" not in graph.metrics
+    self.assertRaises(Invalid_Parameters_Exception, compute_centrality,
+        graph, graph.ids, True, False, False, False, False, 4, True, 0.5, [],
+        ["Total_Time"], max_memory=1000)
+    # Sampling does not run in chunks
+    self.assertRaises(Invalid_Parameters_Exception, compute_centrality,
+        graph, graph.ids, True, False, False, False, False, 4, True, 0.5, [],
+        [], sample_size=10, max_memory=max_memory)
+
+# Metric inputs of the shards of |TestShards|
+SHARD_ARGUMENTS = (True, True, True, True, True, 4, True, 0.5, ["Total_Time"])
+
+def compute_shard_in_process(shard, path):
+  """
+  Computes |shard| of |grid_graph| and writes its partial results to |path|,
+      stands in for one machine
+  """
+  graph = grid_graph()
+  compute_shard(graph, graph.ids, shard, path, *SHARD_ARGUMENTS)
+
+class TestShards(unittest.TestCase):
+  """
+  Origins split among shards run in separate processes, on |grid_graph|
+  """
+  def setUp(self):
+    """
+    Setup
+    """
+    self.directory = mkdtemp()
+  def tearDown(self):
+    """
+    Remove the partial results files
+    """
+    rmtree(self.directory)
+  def run_shards(self, shards):
+    """
+    Runs each of |shards| in its own process and returns the paths of their
+        partial results files
+    """
+    paths = [join(self.directory, "shard%d.npz" % i) for i in
+        xrange(len(shards))]
+    workers = [Process(target=compute_shard_in_process, args=(shard, path))
+        for (shard, path) in zip(shards, paths)]
+    for worker in workers:
+      worker.start()
+    for worker in workers:
+      worker.join()
+      assert worker.exitcode == 0
+    return paths
+  def test_Merge(self):
+    """
+    Test that merged shards give the same results as a single run
+    """
+    metrics = [REACH, GRAVITY, BETWEENNESS, CLOSENESS, STRAIGHTNESS]
+    graph = grid_graph()
+    compute_centrality(graph, graph.ids, *(SHARD_ARGUMENTS[:-1] + (
+        list(metrics), SHARD_ARGUMENTS[-1])))
+    # Two shards dealt by node index, and one given as a file of origin ids
+    id_file_path = join(self.directory, "ids.txt")
+    id_file = open(id_file_path, "w")
+    id_file.write("\n".join(str(id) for id in graph.ids[10:40]))
+    id_file.close()
+    shard_ids = parse_shard(id_file_path)
+    assert len(shard_ids) == 30
+    paths = self.run_shards([parse_shard("1/3"), parse_shard("3/3"),
+        shard_ids])
+    # The origins left out of shards 1 and 3 of 3 are run as one more shard
+    merged_graph = grid_graph()
+    origins = merge_partial_results(merged_graph, paths[:2], [])
+    assert len(origins) == len(graph) - len(graph) // 3
+    rest = [id for id in graph.ids if id not in set(origins)]
+    compute_shard(merged_graph, rest, (1, 1), join(self.directory,
+        "rest.npz"), *SHARD_ARGUMENTS)
+    merged_graph = grid_graph()
+    origins = merge_partial_results(merged_graph, paths[:2] + [join(
+        self.directory, "rest.npz")], list(metrics))
+    assert len(origins) == len(graph)
+    assert_same_metrics(graph, merged_graph)
+    # Shards that share origins are refused
+    self.assertRaises(Invalid_Parameters_Exception, merge_partial_results,
+        grid_graph(), paths, [])
+  def test_Mismatch(self):
+    """
+    Test that partial results of another graph or of other inputs are refused
+    """
+    paths = self.run_shards([(1, 2), (2, 2)])
+    other_graph = grid_graph(weights={(0, 0): 5})
+    compute_shard(other_graph, other_graph.ids, (2, 2), paths[1], *(
+        SHARD_ARGUMENTS[:5] + (3,) + SHARD_ARGUMENTS[6:]))
+    self.assertRaises(Invalid_Parameters_Exception, merge_partial_results,
+        grid_graph(), paths, [])
+    smaller_graph = grid_graph(((((0, 0), (0, 1)),)))
+    self.assertRaises(Invalid_Parameters_Exception, merge_partial_results,
+        smaller_graph, paths[:1], [])
+    self.assertRaises(Invalid_Parameters_Exception, parse_shard, "3/2")
+
+class TestTiles(unittest.TestCase):
+  """
+  Origins run one tile at a time, on |grid_graph|
+  """
+  def setUp(self):
+    """
+    Setup
+    """
+    self.graph = renumbered(grid_graph(),
+        HILBERT_ORDERING)
+    # The edges of the grid, as rows of an adjacency list
+    self.rows = []
+    for u in xrange(len(self.graph)):
+      for e in xrange(self.graph.indptr[u], self.graph.indptr[u + 1]):
+        self.rows.append((self.graph.ids[u], self.graph.ids[
+            self.graph.indices[e]], float(self.graph.weights[e]),
+            {"Total_Time": float(self.graph.accumulations[e, 0])}))
+  def nodes(self, scale):
+    """
+    Returns the nodes of the grid without their edges, with locations scaled by
+        |scale|
+    """
+    builder = Graph_Builder(["Total_Time"])
+    for id in self.graph.ids:
+      builder.add_node(id)
+    nodes = builder.build()
+    for id in nodes.ids:
+      nodes.set_location(id, (scale * id[0], scale * id[1]))
+      nodes.set_weight(id, self.graph.node_weights[self.graph.index[id]])
+    return renumbered(nodes, HILBERT_ORDERING)
+  def test_Tile_Origins(self):
+    """
+    Test that every origin is in exactly one tile of the given size
+    """
+    tiles = tile_origins(self.graph, range(len(self.graph)), 3)
+    assert len(tiles) == 16
+    assert sorted(s for (extent, origins) in tiles for s in origins) == range(
+        len(self.graph))
+    for ((x_min, y_min, x_max, y_max), origins) in tiles:
+      for (x, y) in self.graph.locations[origins].tolist():
+        assert x_min <= x < x_max and y_min <= y < y_max
+  def test_Tiles(self):
+    """
+    Test that tiles give the same results as a run on the whole graph, also
+        when network distances are shorter than straight line distances and
+        halos have to be widened, and that the adjacency list is read once
+    """
+    metrics = [REACH, GRAVITY, BETWEENNESS, CLOSENESS, STRAIGHTNESS]
+    reads = []
+    def edge_rows():
+      reads.append(True)
+      return iter(self.rows)
+    for radius in [3, [2, 4]]:
+      arguments = (True, True, True, True, True, radius, True, 0.5)
+      for (scale, processes) in [(1, 1), (4, 1), (4, 2)]:
+        graph = renumbered(grid_graph(), HILBERT_ORDERING)
+        graph.locations *= scale
+        compute_centrality(graph, graph.ids, *(arguments + (list(metrics),
+            ["Total_Time"])))
+        nodes = self.nodes(scale)
+        del reads[:]
+        compute_centrality(nodes, nodes.ids, *(arguments + (list(metrics),
+            ["Total_Time"], processes, None, None, False, 0, None, None, None,
+            3 * scale, edge_rows)))
+        assert_same_metrics(graph, nodes)
+        assert len(reads) == 1
+    self.assertRaises(Invalid_Parameters_Exception, compute_centrality,
+        self.nodes(1), self.graph.ids, True, False, False, False, False, 3,
+        False, 0.5, [], [], tile_size=3, edge_rows=lambda: iter(self.rows))
+  def test_Unknown_Nodes(self):
+    """
+    Test that edges to nodes that are not in the graph are left out, as Step 2
+        leaves them out, rather than widening the halos without end
+    """
+    metrics = [REACH, GRAVITY, BETWEENNESS, CLOSENESS, STRAIGHTNESS]
+    arguments = (True, True, True, True, True, 3, True, 0.5, list(metrics),
+        ["Total_Time"])
+    graph = renumbered(grid_graph(), HILBERT_ORDERING)
+    compute_centrality(graph, graph.ids, *arguments)
+    rows = self.rows + [(self.graph.ids[0], "unknown", 1.0, {"Total_Time":
+        1.0})]
+    nodes = self.nodes(1)
+    compute_centrality(nodes, nodes.ids, *(arguments + (1, None, None, False,
+        0, None, None, None, 2.5, lambda: iter(rows))))
+    assert_same_metrics(graph, nodes)
+
+class TestInstrumentation(unittest.TestCase):
+  """
+  Timings and counts of the work of the kernels, on |grid_graph|
+  """
+  def setUp(self):
+    """
+    Setup
+    """
+    self.directory = mkdtemp()
+  def tearDown(self):
+    """
+    Turn instrumentation off and remove the report
+    """
+    Instrumentation.disable()
+    rmtree(self.directory)
+  def test_Counters(self):
+    """
+    Test that every origin settles every node and relaxes every edge with an
+        infinite radius, on one process or several, that the results do not
+        change, and that the peak memory of every worker is reported
+    """
+    metrics = [REACH, BETWEENNESS]
+    graph = grid_graph()
+    compute_centrality(graph, graph.ids, True, False, True, False, False,
+        INFINITE_RADIUS, True, 0.5, list(metrics), [])
+    N, E = len(graph), graph.edge_count()
+    Instrumentation.enable()
+    for processes in [1, 2]:
+      Instrumentation.start_step(STEP_4)
+      counted_graph = grid_graph()
+      compute_centrality(counted_graph, counted_graph.ids, True, False, True,
+          False, False, INFINITE_RADIUS, True, 0.5, list(metrics), [],
+          processes)
+      counters = Instrumentation.counters()
+      Instrumentation.finish_step()
+      assert counters[NODES_SETTLED] == N * N
+      assert counters[EDGES_RELAXED] == N * E
+      assert counters[PREDECESSOR_ENTRIES] >= N * (N - 1)
+      assert_same_metrics(graph, counted_graph)
+    path = join(self.directory, "report.json")
+    Instrumentation.write_report(path)
+    report_file = open(path)
+    report = load(report_file)
+    report_file.close()
+    assert [step["step"] for step in report["steps"]] == [STEP_4, STEP_4]
+    assert all(step["wall_seconds"] >= 0 and step["cpu_seconds"] >= 0 for
+        step in report["steps"])
+    assert all(step["cumulative_peak_memory_bytes"] is None or
+        step["cumulative_peak_memory_bytes"] >= step[
+        "peak_memory_growth_bytes"] >= 0 for step in report["steps"])
+    assert [len(step["worker_peak_memory_bytes"]) for step in
+        report["steps"]] == [0, 2]
+  def test_Sweep(self):
+    """
+    Test that a sweep of several radii counts its work and gives the same
+        results, with a network radius and with a birds-eye radius, with
+        accumulations
+    """
+    metrics = [REACH, GRAVITY, BETWEENNESS, CLOSENESS, STRAIGHTNESS]
+    for network_radius in [True, False]:
+      arguments = (True, True, True, True, True, [3, INFINITE_RADIUS],
+          network_radius, 0.5)
+      graph = grid_graph()
+      compute_centrality(graph, graph.ids, *(arguments + (list(metrics),
+          ["Total_Time"])))
+      Instrumentation.enable()
+      counted_graph = grid_graph()
+      compute_centrality(counted_graph, counted_graph.ids, *(arguments + (
+          list(metrics), ["Total_Time"])))
+      counters = Instrumentation.counters()
+      Instrumentation.disable()
+      N, E = len(graph), graph.edge_count()
+      assert counters[NODES_SETTLED] == N * N
+      assert counters[EDGES_RELAXED] == N * E
+      assert_same_metrics(graph, counted_graph)
+  def test_Disabled(self):
+    """
+    Test that nothing is counted while instrumentation is off
+    """
+    graph = grid_graph()
+    Instrumentation.start_step(STEP_4)
+    compute_centrality(graph, graph.ids, True, False, True, False, False, 3,
+        True, 0.5, [], [])
+    Instrumentation.finish_step()
+    assert not Instrumentation.enabled() and not Instrumentation.counters()
+
+class TestBenchmark(unittest.TestCase):
+  """
+  Synthetic graphs of the benchmark suite, and the differential oracle that
+      compares the optimized ways of running the computation to the reference
+  """
+  def test_Generators(self):
+    """
+    Test that each generator gives a connected, undirected graph of about the
+        requested size, with positive edge weights and located nodes
+    """
+    for (name, generator) in sorted(GENERATORS.items()):
+      graph = generator(400)
+      N = len(graph)
+      assert 300 <= N <= 500
+      assert len(graph.locations) == N and (graph.weights > 0).all()
+      edges = set()
+      for u in xrange(N):
+        for j in xrange(graph.indptr[u], graph.indptr[u + 1]):
+          edges.add((u, graph.indices[j], graph.weights[j]))
+      assert all((v, u, weight) in edges for (u, v, weight) in edges)
+      if name != "geometric":
+        assert connected_components(graph).max() == 0
+  def test_Engines(self):
+    """
+    Test that every engine matches the reference run for every metric
+        combination, with both kinds of radius and with accumulations, on each
+        kind of graph, one of which has several components
+    """
+    # Geometric graphs this sparse fall apart into several components
+    for (name, generator) in sorted(GENERATORS.items()):
+      graph = (generator(60, mean_degree=3) if name == "geometric" else
+          generator(60))
+      assert (connected_components(graph).max() > 0) == (name ==
+          "geometric")
+      failures = check(graph, 4 * graph.weights.mean())
+      assert not failures, sorted(failures)[:5]
+  def test_Mismatch(self):
+    """
+    Test that the oracle reports an engine that gives wrong values
+    """
+    def wrong_engine(graph, origins, *arguments):
+      compute_centrality(graph, origins[1:], *arguments)
+    graph = GENERATORS["ties"](100)
+    arguments = (True, False, False, True, False, 3, True, 0.5, [], [])
+    assert not compare(graph, graph.ids, arguments, ENGINES["parallel"])
+    mismatches = compare(graph, graph.ids, arguments, wrong_engine)
+    assert mismatches and all(id == graph.ids[0] for (column, id, expected,
+        actual) in mismatches)
+
+class TestNativeAdjacency(unittest.TestCase):
+  """
+  Adjacency list computed from shapefiles without Network Analyst, on two
+      streets meeting at a corner
+  """
+  def setUp(self):
+    """
+    Setup
+    """
+    self.directory = mkdtemp()
+    self.streets = join(self.directory, "Streets.shp")
+    write_shapefile(self.streets, [[[(0.0, 0.0), (100.0, 0.0), (300.0, 0.0)]],
+        [[(300.0, 0.0), (300.0, 200.0)]]], [("Minutes",) + DOUBLE_FIELD],
+        [(3.0,), (2.0,)])
+    self.buildings = join(self.directory, "Buildings.shp")
+    write_shapefile(self.buildings, [(50.0, 10.0), (150.0, -5.0), (250.0, 3.0),
+        (250.0, 3.0), (310.0, 100.0), (9000.0, 0.0)], [("Id",) +
+        INTEGER_FIELD, ("Name", "C", 8, 0)], [(i, "B%d" % i) for i in
+        xrange(1, 7)])
+  def tearDown(self):
+    """
+    Remove the shapefiles
+    """
+    rmtree(self.directory)
+  def test_Shapefiles(self):
+    """
+    Test that shapefiles read back as written
+    """
+    streets = read_shapefile(self.streets)
+    assert [shape for (shape, attributes) in streets] == [[[(0.0, 0.0),
+        (100.0, 0.0), (300.0, 0.0)]], [[(300.0, 0.0), (300.0, 200.0)]]]
+    assert [attributes for (shape, attributes) in streets] == [{"Minutes":
+        3.0}, {"Minutes": 2.0}]
+    buildings = read_shapefile(self.buildings)
+    assert buildings[2] == ((250.0, 3.0), {"Id": 3, "Name": "B3"})
+  def test_Barriers(self):
+    """
+    Test that searches stop at the first buildings they reach, that buildings
+        at the same location are not neighbors of each other, that the
+        impedance and accumulations are split along the streets, and that
+        buildings too far from the streets are left out
+    """
+    locations = compute_native_adjacency_list(self.buildings, self.streets,
+        "Id", "Length", "Minutes", 1000, self.directory, "Adj.adj")
+    assert locations == {1: (50.0, 0.0), 2: (150.0, 0.0), 3: (250.0, 0.0),
+        4: (250.0, 0.0), 5: (300.0, 100.0)}
+    adj_file = join(self.directory, "Adj.adj")
+    assert read_fields(adj_file) == ["Total_Leng", "Total_Minu"]
+    rows = set((origin_id, destination_id) + tuple(values) for (origin_id,
+        destination_id, values) in read_rows(adj_file))
+    edges = [(1, 2, 100.0, 1.0), (2, 3, 100.0, 1.0), (2, 4, 100.0, 1.0),
+        (3, 5, 150.0, 1.5), (4, 5, 150.0, 1.5)]
+    assert rows == set(edges + [(v, u, length, minutes) for (u, v, length,
+        minutes) in edges])
+    # A smaller radius leaves out the longer edges
+    compute_native_adjacency_list(self.buildings, self.streets, "Id", "Length",
+        "#", 120, self.directory, "Adj.adj", True)
+    assert read_fields(adj_file) == ["Total_Leng"]
+    assert row_count(adj_file) == 6
+
+class Stand_In_Solver:
+  """
+  Stand-in for the OD cost matrix solver of the adjacency list computation: a
+      cell is a list of origin ids, and each origin is adjacent to the next id
+  Each partial adjacency list records the number of cells the solver has
+      solved so far, and is written to the workspace of the solver
+  |offset|: difference between the ids of adjacent origins
+  """
+  def __init__(self, workspace, offset=1):
+    self.workspace = workspace
+    self.offset = offset
+    self.solved = 0
+  def solve(self, cell, path):
+    if cell == ["fail"]:
+      raise Exception("Stand-in solver failed")
+    if cell == ["crash"]:
+      # The process dies without a word, as when it is killed
+      _exit(3)
+    assert dirname(path) == self.workspace
+    self.solved += 1
+    writer = Adjacency_Writer(path, ["Solved"])
+    for id in cell:
+      writer.write(id, id + self.offset, [self.solved])
+    writer.close()
+    return path
+  def close(self):
+    pass
+
+class TestAdjacencyFile(unittest.TestCase):
+  """
+  Binary adjacency list files
+  """
+  def setUp(self):
+    """
+    Setup
+    """
+    self.directory = mkdtemp()
+    self.fields = value_fields("Length", "Minutes;Turns")
+    self.rows = [(i, (7 * i) % 11, [i * 1.5, -i / 4.0, float(i % 3)]) for i in
+        xrange(25)]
+  def tearDown(self):
+    """
+    Remove the files
+    """
+    rmtree(self.directory)
+  def write(self, name, rows, compress=False, chunk_rows=4):
+    """
+    Writes |rows| to the file |name| and returns its path
+    """
+    path = join(self.directory, name)
+    writer = Adjacency_Writer(path, self.fields, compress, chunk_rows)
+    for (origin_id, destination_id, values) in rows:
+      writer.write(origin_id, destination_id, values)
+    writer.close()
+    return path
+  def test_Round_Trip(self):
+    """
+    Test that rows read back as written, in chunks or not, compressed or not
+    """
+    assert self.fields == ["Total_Leng", "Total_Minu", "Total_Turn"]
+    for (compress, chunk_rows) in product([False, True], [1, 4, 100]):
+      path = self.write("Adj.adj", self.rows, compress, chunk_rows)
+      assert read_fields(path) == self.fields
+      assert row_count(path) == len(self.rows)
+      assert list(read_rows(path)) == self.rows
+    # Repetitive rows compress well
+    plain = self.write("Plain.adj", self.rows * 20, False, 1000)
+    compressed = self.write("Compressed.adj", self.rows * 20, True, 1000)
+    assert getsize(compressed) < getsize(plain)
+    # An empty file has no rows
+    assert list(read_rows(self.write("Empty.adj", []))) == []
+  def test_Append(self):
+    """
+    Test that appended files keep their rows in order, compressed or not, and
+        that files with other value columns can not be appended
+    """
+    first = self.write("First.adj", self.rows[:10], True)
+    second = self.write("Second.adj", self.rows[10:])
+    path = join(self.directory, "Adj.adj")
+    writer = Adjacency_Writer(path, self.fields)
+    writer.write(*self.rows[0])
+    writer.append_file(first)
+    writer.append_file(second)
+    writer.close()
+    assert list(read_rows(path)) == self.rows[:1] + self.rows
+    other = join(self.directory, "Other.adj")
+    Adjacency_Writer(other, self.fields[:1]).close()
+    writer = Adjacency_Writer(path, self.fields)
+    self.assertRaises(Exception, writer.append_file, other)
+    writer.close()
+  def test_Export_DBF(self):
+    """
+    Test that the DBF export has the fields of the Network Analyst tables
+    """
+    path = self.write("Adj.adj", self.rows, True)
+    dbf = join(self.directory, "Adj.dbf")
+    assert export_dbf(path, dbf) == len(self.rows)
+    fields, records = read_dbf(dbf)
+    assert [field[0] for field in fields] == ["OriginID", "Destinatio"] + (
+        self.fields)
+    assert [(record["OriginID"], record["Destinatio"], [record[field] for
+        field in self.fields]) for record in records] == self.rows
+
+class TestParallelCells(unittest.TestCase):
+  """
+  Cells of origins of the adjacency list computation solved on several
+      processes, with a stand-in solver
+  """
+  def setUp(self):
+    """
+    Setup
+    """
+    self.directory = mkdtemp()
+    self.cells = [range(10 * j, 10 * j + j % 4 + 1) for j in xrange(9)]
+  def tearDown(self):
+    """
+    Remove the partial tables
+    """
+    rmtree(self.directory)
+  def test_Order(self):
+    """
+    Test that the partial tables come back in cell order whatever the number of
+        processes, and that each worker has its own solver and workspace
+    """
+    expected = [(id, id + 1) for cell in self.cells for id in cell]
+    for processes in [1, 2, 3]:
+      steps = []
+      paths = solve_cells_in_parallel(self.cells, Stand_In_Solver,
+          self.directory, processes, lambda: steps.append(1))
+      assert len(steps) == len(self.cells)
+      rows = [row for path in paths for row in read_rows(path)]
+      assert [(origin_id, destination_id) for (origin_id, destination_id,
+          values) in rows] == expected
+      assert len(set(dirname(path) for path in paths)) == processes
+      # Cells are dealt to the workers in turn
+      for (j, path) in enumerate(paths):
+        assert read_rows(path).next()[2] == [j // processes + 1]
+  def test_Pickled_Solver(self):
+    """
+    Test that solver makers survive pickling, as they do when worker processes
+        are spawned rather than forked
+    """
+    make_solver = loads(dumps(partial(Stand_In_Solver, offset=2),
+        HIGHEST_PROTOCOL))
+    paths = solve_cells_in_parallel(self.cells, make_solver, self.directory, 2,
+        lambda: None)
+    assert [(origin_id, destination_id) for path in paths for (origin_id,
+        destination_id, values) in read_rows(path)] == [(id, id + 2) for cell
+        in self.cells for id in cell]
+    # The OD cost matrix solver needs the geoprocessing tools of arcpy
+    import arcpy
+    if getattr(arcpy, "headless", False):
+      self.skipTest("arcpy is not installed")
+    from Adjacency_List_Computation import OD_Cost_Matrix_Solver
+    make_solver = partial(OD_Cost_Matrix_Solver, input_points="Points",
+        input_network="Network", id_attribute="Id",
+        impedance_attribute="Length", accumulator_attributes="#",
+        cutoff_radius=100.0, compress=True)
+    unpickled = loads(dumps(make_solver, HIGHEST_PROTOCOL))
+    assert unpickled.func is OD_Cost_Matrix_Solver
+    assert unpickled.keywords == make_solver.keywords
+  def test_Failure(self):
+    """
+    Test that a failing solver fails the computation
+    """
+    self.assertRaises(Exception, solve_cells_in_parallel, self.cells +
+        [["fail"]], Stand_In_Solver, self.directory, 2, lambda: None)
+  def test_Crash(self):
+    """
+    Test that a worker that dies without a message fails the computation
+        instead of leaving it waiting
+    """
+    self.assertRaises(Exception, solve_cells_in_parallel, self.cells +
+        [["crash"]], Stand_In_Solver, self.directory, 2, lambda: None)
+
+class TestOriginBatches(unittest.TestCase):
+  """
+  Origins of the adjacency list computation split into batches on their
+      locations
+  """
+  def test_Batches(self):
+    """
+    Test that the batches of origins cover every origin once, stay within their
+        bounds, and are smaller where the origins are denser
+    """
+    random = Random(7)
+    # A dense square of side 10 in a sparse square of side 1000
+    locations = ([(random.uniform(0, 10), random.uniform(0, 10)) for i in
+        xrange(400)] + [(random.uniform(0, 1000), random.uniform(0, 1000)) for
+        i in xrange(100)])
+    for max_size in [1, 7, 50, 500, 1000]:
+      batches = kd_batches(locations, max_size)
+      assert sorted(i for batch in batches for i in batch) == range(500)
+      assert all(batch == sorted(batch) for batch in batches)
+      assert all(len(batch) <= max_size for batch in batches)
+      assert all(2 * len(batch) >= min(max_size, 500) for batch in batches)
+    # Each dense batch covers a much smaller area than the sparse batches
+    def area(batch):
+      xs = [locations[i][0] for i in batch]
+      ys = [locations[i][1] for i in batch]
+      return (max(xs) - min(xs)) * (max(ys) - min(ys))
+    batches = kd_batches(locations, 50)
+    dense = [area(batch) for batch in batches if max(batch) < 400]
+    sparse = [area(batch) for batch in batches if min(batch) >= 400]
+    assert dense and sparse and max(dense) * 100 < min(sparse)
+    assert kd_batches([], 10) == []
+
 if __name__ == "__main__":
   unittest.main()
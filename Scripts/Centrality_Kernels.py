@@ -0,0 +1,1209 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Shortest path tree computations that produce the centrality metrics of a set of
+    origins.
+|compute_origins| is the general kernel, it checks which metrics to compute
+    inside its innermost loops. |select_kernel| returns a copy of it that is
+    specialized to one combination of metrics and options: every check of a
+    fixed option is evaluated once, when the kernel is generated, and the
+    branches that are not taken are removed. |bucket_kernel| returns a copy of
+    a kernel that runs Dijkstra with a bucket queue.
+"""
+
+from Constants import BETWEENNESS
+from Constants import CLOSENESS
+from Constants import GRAVITY
+from Constants import MAX_FIELD_NAME_LENGTH
+from Constants import NORM_BETWEENNESS
+from Constants import NORM_CLOSENESS
+from Constants import NORM_GRAVITY
+from Constants import NORM_REACH
+from Constants import NORM_STRAIGHTNESS
+from Constants import radius_labels
+from Constants import REACH
+from Constants import STRAIGHTNESS
+from Constants import SWEEP_ACCUMULATOR_NAME
+from Constants import SWEEP_METRIC_NAME
+from Constants import SWEEP_NORM_METRIC_NAME
+import ast
+from functools import partial
+from inspect import getsource
+from Instrumentation import count
+from Instrumentation import Counting_Queue
+from Instrumentation import EDGES_RELAXED
+from Instrumentation import enabled as instrumentation_enabled
+from Instrumentation import PREDECESSOR_ENTRIES
+from math import exp
+from numpy import arange
+from numpy import asarray
+from numpy import diff
+from numpy import exp as exp_array
+from numpy import float64
+from numpy import repeat
+from numpy import sqrt as sqrt_array
+from numpy import zeros
+from Priority_Queue import Bucket_Queue
+from Priority_Queue import Priority_Queue
+from Spatial_Index import Grid_Index
+from types import FunctionType
+from Utils import eq_tol
+from Utils import Invalid_Parameters_Exception
+from Utils import lt_tol
+
+# Options that a kernel can be specialized to, in order
+KERNEL_OPTIONS = ("compute_r", "compute_g", "compute_b", "compute_c",
+    "compute_s", "network_radius", "have_accumulations", "have_locations")
+
+# Keys for the unweighted and weighted reach of each origin (normalization)
+REACH_COUNT = "reach"
+WEIGHTED_REACH = "weighted_reach"
+
+# Estimated bytes taken by one item of a scratch buffer of |compute_origins|: a
+#     list slot and the number object it refers to
+SCRATCH_ITEM_BYTES = 32
+
+# Euclidean distance looked up for the nodes beyond the radius of an origin, it
+#     is only ever compared against the radius
+OUTSIDE_RADIUS = float("inf")
+
+# Range of the edges of a node in the kernels, |counting_kernel| replaces it to
+#     count the edges relaxed
+edge_range = xrange
+
+def graph_arrays(graph, accumulator_fields):
+  """
+  Returns the arrays of |graph| used by |compute_origins|, in order:
+      (indptr, indices, weights, node_weights, locations, accumulations)
+  |locations| is a flat array of (x, y) pairs, or None if |graph| has no
+      locations
+  |accumulations| is a flat array with one row of |accumulator_fields| values
+      per edge
+  """
+  columns = [graph.accumulator_fields.index(field) for field in
+      accumulator_fields]
+  locations = (None if graph.locations is None else
+      graph.locations.reshape(-1))
+  return (graph.indptr, graph.indices, graph.weights, graph.node_weights,
+      locations, graph.accumulations[:, columns].reshape(-1))
+
+def euclidean_distances(spatial_index, x, y, radius):
+  """
+  Returns a dictionary mapping the index of each node within euclidean distance
+      |radius| of (|x|, |y|) to its distance, computed in one array operation
+  |spatial_index|: |Grid_Index| of the node locations
+  """
+  nodes, distances = spatial_index.within_distances(x, y, radius)
+  return dict(zip(nodes.tolist(), distances.tolist()))
+
+def scratch_bytes(N, E, compute_b):
+  """
+  Returns the estimated size in bytes of the scratch buffers that
+      |compute_origins| allocates for a graph with |N| nodes and |E| directed
+      edges, the size does not depend on the number of origins
+  """
+  # Distances, and with betweenness the number of shortest paths, the
+  #     dependencies, the first predecessor entry of each node, and two items
+  #     per predecessor entry
+  return SCRATCH_ITEM_BYTES * ((4 * N + 2 * E) if compute_b else N)
+
+def fill_tree_accumulations(s, tree_edges, depth, edge_sources,
+    edge_accumulations, node_accumulations):
+  """
+  Fills the rows of |node_accumulations| for the nodes of the shortest path tree
+      of |s| with the accumulations along their shortest paths from |s|, and
+      returns an array of the nodes of the tree other than |s|
+  |tree_edges|: maps each node of the tree other than |s| to the last edge of
+      its shortest path from |s|
+  |depth|: maps each node of the tree to its number of edges from |s|
+  |edge_sources|: node at the start of each edge
+  |edge_accumulations|: accumulator weights of each edge
+  |node_accumulations|: scratch array with a row of accumulations per node
+  The accumulations of all nodes at the same depth are computed at once, from
+      the accumulations of their parents one level up
+  """
+  node_accumulations[s] = 0.0
+  if not tree_edges:
+    return zeros(0, dtype=int)
+  nodes = asarray(tree_edges.keys())
+  edges = asarray(tree_edges.values())
+  depths = asarray([depth[v] for v in tree_edges])
+  order = depths.argsort(kind="mergesort")
+  nodes, edges, depths = nodes[order], edges[order], depths[order]
+  levels = depths.searchsorted(arange(1, depths[-1] + 2))
+  for level in xrange(len(levels) - 1):
+    level_nodes = nodes[levels[level]:levels[level + 1]]
+    level_edges = edges[levels[level]:levels[level + 1]]
+    node_accumulations[level_nodes] = (
+        node_accumulations[edge_sources[level_edges]] +
+        edge_accumulations[level_edges])
+  return nodes
+
+def tree_accumulations(s, tree_edges, depth, edge_sources, edge_accumulations,
+    node_accumulations):
+  """
+  Returns a list with the sum, over all nodes of the shortest path tree of |s|,
+      of the accumulations along the shortest path from |s| to the node (one
+      entry per accumulator field)
+  Parameters are as in |fill_tree_accumulations|
+  """
+  nodes = fill_tree_accumulations(s, tree_edges, depth, edge_sources,
+      edge_accumulations, node_accumulations)
+  return node_accumulations[nodes].sum(axis=0).tolist()
+
+def compute_origins(sequences, origins, compute_r, compute_g, compute_b,
+    compute_c, compute_s, radius, network_radius, beta, accumulator_fields,
+    betweenness, step):
+  """
+  Computes the shortest path tree of each of the |origins| and returns a
+      dictionary mapping the name of each computed metric to a list of values
+      for the |origins|, in order
+  |sequences|: the arrays returned by |graph_arrays|, as sequences that can be
+      indexed one item at a time (e.g. lists or shared memory arrays)
+  |origins|: node indices of the origins
+  |betweenness|: sequence of betweenness values per node, the betweenness
+      contributions of the |origins| are added to it
+  |step|: called once for each origin that is done
+  All other parameters are as in |compute_centrality|
+  """
+  (indptr, indices, weights, node_weights, locations,
+      accumulations) = sequences
+  K = len(accumulator_fields)
+  have_accumulations = K > 0
+  if have_accumulations:
+    # Accumulator weights of each edge, one column per accumulator field
+    edge_accumulations = asarray(accumulations, dtype=float64).reshape((-1,
+        K))
+    # Node at the start of each edge
+    edge_sources = repeat(arange(len(node_weights)), diff(asarray(indptr)))
+    # Accumulations along the shortest path from the origin to each node, one
+    #     column per accumulator field, only valid for the nodes of the
+    #     current shortest path tree
+    node_accumulations = zeros((len(node_weights), K))
+  have_locations = locations is not None
+  compute_s = compute_s and have_locations
+  if compute_s:
+    node_locations = asarray(locations, dtype=float64).reshape((-1, 2))
+    node_weight_array = asarray(node_weights, dtype=float64)
+  if not network_radius:
+    # Index node locations to find the nodes within |radius| of each origin
+    spatial_index = Grid_Index(locations, radius)
+
+  # Scratch buffers indexed by node, allocated once and reused for every
+  #     origin; only the entries of the nodes in |touched| are reset after each
+  #     origin, so an origin costs time in proportion to the nodes it visits
+  N = len(node_weights)
+  d = [None] * N # Shortest distance from the origin, None if not found
+  touched = [] # Nodes whose entries were set for the current origin
+  if compute_b:
+    sigma = [0.0] * N # Number of shortest paths from the origin
+    delta = [0.0] * N # Dependency of the origin on each node
+    # Predecessors, as linked lists in a flat buffer: the predecessors of |w|
+    #     are |pred_node|[k] for k = |pred_head|[w], |pred_next|[k], ... until
+    #     -1; each edge adds at most one entry per origin
+    pred_head = [-1] * N
+    pred_node = [0] * len(indices)
+    pred_next = [0] * len(indices)
+
+  # Metric values for each of the |origins|
+  values = {REACH_COUNT: [], WEIGHTED_REACH: []}
+  for (metric, compute) in [(REACH, compute_r), (GRAVITY, compute_g),
+      (CLOSENESS, compute_c), (STRAIGHTNESS, compute_s)]:
+    if compute:
+      values[metric] = []
+  for field in accumulator_fields:
+    values[field] = []
+
+  for s in origins:
+    weight_s = node_weights[s]
+    if have_locations: x_s, y_s = locations[2 * s], locations[2 * s + 1]
+
+    # Initialize reach (weighted and unweighted) computation for |s|
+    #     (normalization)
+    reach_s = -1
+    weighted_reach_s = -weight_s
+
+    # Initialize measures
+    if compute_g: gravity_s = 0.0
+    if compute_b:
+      S = [] # Stack containing nodes in the order they are extended
+      sigma[s] = 1.0
+      pred_count = 0 # Number of entries in the predecessor buffer
+    if compute_c: d_sum_s = 0.0
+    if compute_s:
+      # Nodes that count towards straightness, and their distances from |s|
+      straight_nodes = []
+      straight_d = []
+    if have_accumulations:
+      tree_edges = {} # Last edge of the shortest path from |s| to each node
+      depth = {s: 0} # Number of edges on the shortest path from |s|
+
+    d[s] = 0.0
+    touched.append(s)
+    # Queue for Dijkstra
+    Q = Priority_Queue([(0.0, s)] if network_radius else [(0.0, s, 0.0)])
+
+    # If we use euclidean radius, make a list of all reachable nodes and
+    #     their euclidean distances from |s|
+    if not network_radius:
+      dist_s = euclidean_distances(spatial_index, x_s, y_s, radius)
+      reachable_s = set(dist_s)
+
+    # Dijkstra
+    while Q and (True if network_radius else reachable_s):
+      # Pop the closest node to |s| from |Q|
+      if network_radius:
+        d_sv, v = Q.pop()
+      else:
+        d_sv, v, dist_sv = Q.pop()
+        if v in reachable_s:
+          reachable_s.remove(v)
+      weight_v = node_weights[v]
+
+      # Only nodes within the radius count towards the metrics of |s|
+      if network_radius or dist_sv <= radius:
+        reach_s += 1
+        weighted_reach_s += weight_v
+        if d_sv > 0:
+          if compute_g: gravity_s += weight_v * exp(-d_sv * beta)
+          if compute_c: d_sum_s += weight_v * d_sv
+          if compute_s:
+            straight_nodes.append(v)
+            straight_d.append(d_sv)
+        if compute_b: S.append(v)
+
+      for e in edge_range(indptr[v], indptr[v + 1]):
+        w = indices[e]
+        d_vw = weights[e]
+        # s ~ ... ~ v ~ w
+        d_sw = d_sv + d_vw
+        if not network_radius:
+            # Use Euclidean distance
+            dist_sw = dist_s.get(w, OUTSIDE_RADIUS)
+
+        if compute_b: b_refresh = False
+
+        add_w_to_Q = False
+
+        if d[w] is None: # Found a path from |s| to |w| for the first time
+          if d_sw <= radius or not network_radius:
+            add_w_to_Q = True
+          d[w] = d_sw
+          touched.append(w)
+          if compute_b: b_refresh = True
+
+        elif lt_tol(d_sw, d[w]): # Found a better path from |s| to |w|
+          if d_sw <= radius or not network_radius:
+            # If |w| is already in |Q|, its longer path entry becomes stale
+            add_w_to_Q = True
+          d[w] = d_sw
+          if compute_b: b_refresh = True
+
+        if add_w_to_Q:
+          new_node = (d_sw, w) if network_radius else (d_sw, w, dist_sw)
+          if w in Q:
+            Q.decrease_key(new_node)
+          else:
+            Q.push(new_node)
+          if have_accumulations:
+            tree_edges[w] = e
+            depth[w] = depth[v] + 1
+
+        if compute_b:
+          if b_refresh:
+            sigma[w] = 0.0
+            pred_head[w] = -1
+          if eq_tol(d_sw, d[w]): # Count all shortest paths from |s| to |w|
+            sigma[w] += sigma[v] # Update the number of shortest paths
+            # |v| is a predecessor of |w|
+            pred_node[pred_count] = v
+            pred_next[pred_count] = pred_head[w]
+            pred_head[w] = pred_count
+            pred_count += 1
+
+    if compute_r: values[REACH].append(weighted_reach_s)
+    if compute_g: values[GRAVITY].append(gravity_s)
+    if compute_b:
+      while S: # Revisit nodes in reverse order of distance from |s|
+        w = S.pop()
+        delta_w = delta[w] # Dependency of |s| on |w|
+        k = pred_head[w]
+        while k != -1:
+          v = pred_node[k]
+          weight_w = node_weights[w]
+          delta[v] += sigma[v] / sigma[w] * (weight_w + delta_w)
+          k = pred_next[k]
+        if w != s:
+          betweenness[w] += delta_w
+    if compute_c: values[CLOSENESS].append(1.0 / d_sum_s if d_sum_s > 0 else
+        0.0)
+    if compute_s:
+      # Straightness of |s| in one pass over the nodes that count towards it
+      straight_nodes = asarray(straight_nodes, dtype=int)
+      values[STRAIGHTNESS].append(float((node_weight_array[straight_nodes] *
+          sqrt_array(((node_locations[straight_nodes] - (x_s, y_s))**2).sum(
+          axis=1)) / asarray(straight_d, dtype=float64)).sum()))
+
+    values[REACH_COUNT].append(reach_s)
+    values[WEIGHTED_REACH].append(weighted_reach_s)
+
+    # Reset the scratch entries of the nodes visited from |s|
+    for v in touched:
+      d[v] = None
+      if compute_b:
+        sigma[v] = 0.0
+        delta[v] = 0.0
+        pred_head[v] = -1
+    del touched[:]
+
+    if have_accumulations:
+      total_accumulations_s = tree_accumulations(s, tree_edges, depth,
+          edge_sources, edge_accumulations, node_accumulations)
+      for (k, field) in enumerate(accumulator_fields):
+        values[field].append(total_accumulations_s[k])
+
+    step()
+
+  return values
+
+def compute_distances(sequences, origins, radius, network_radius, add_row,
+    step):
+  """
+  Computes the shortest path tree of each of the |origins| and passes the
+      nodes within the radius and their distances to |add_row|
+  |add_row|: called as add_row(s, nodes, distances) for each origin |s|, the
+      nodes are in the order they are extended and include |s|
+  All other parameters are as in |compute_origins|
+  """
+  (indptr, indices, weights, node_weights, locations,
+      accumulations) = sequences
+  if not network_radius:
+    spatial_index = Grid_Index(locations, radius)
+
+  for s in origins:
+    if locations is not None:
+      x_s, y_s = locations[2 * s], locations[2 * s + 1]
+    # Nodes within the radius, in the order they are extended, and their
+    #     distances from |s|
+    S = []
+    S_d = []
+
+    d = {s: 0.0} # Shortest distance from |s| to other nodes
+    # Queue for Dijkstra
+    Q = Priority_Queue([(0.0, s)] if network_radius else [(0.0, s, 0.0)])
+
+    # If we use euclidean radius, make a list of all reachable nodes and
+    #     their euclidean distances from |s|
+    if not network_radius:
+      dist_s = euclidean_distances(spatial_index, x_s, y_s, radius)
+      reachable_s = set(dist_s)
+
+    # Dijkstra
+    while Q and (True if network_radius else reachable_s):
+      # Pop the closest node to |s| from |Q|
+      if network_radius:
+        d_sv, v = Q.pop()
+      else:
+        d_sv, v, dist_sv = Q.pop()
+        if v in reachable_s:
+          reachable_s.remove(v)
+
+      if network_radius or dist_sv <= radius:
+        S.append(v)
+        S_d.append(d_sv)
+
+      for e in edge_range(indptr[v], indptr[v + 1]):
+        w = indices[e]
+        # s ~ ... ~ v ~ w
+        d_sw = d_sv + weights[e]
+        if not w in d or lt_tol(d_sw, d[w]):
+          d[w] = d_sw
+          if network_radius:
+            if d_sw <= radius:
+              if w in Q:
+                Q.decrease_key((d_sw, w))
+              else:
+                Q.push((d_sw, w))
+          else:
+            # Use Euclidean distance
+            new_node = (d_sw, w, dist_s.get(w, OUTSIDE_RADIUS))
+            if w in Q:
+              Q.decrease_key(new_node)
+            else:
+              Q.push(new_node)
+
+    add_row(s, S, S_d)
+    step()
+
+def compute_weight_changes(sequences, changes, sources, compute_g, compute_b,
+    compute_c, compute_s, radius, beta, deltas, betweenness, step):
+  """
+  Computes the changes in the metrics of the origins caused by changes in the
+      weights of some nodes, for a network radius
+  Shortest paths are the same in both directions, so the shortest path tree of
+      a node |t| within the radius gives the term of |t| in the metrics of
+      every origin within the radius of |t|
+  |changes|: list of (t, weight_change) for each node |t| whose weight changed
+  |sources|: sequence with 1.0 for the origins whose betweenness contributions
+      are updated and 0.0 for all other nodes
+  |deltas|: dictionary mapping WEIGHTED_REACH, GRAVITY, CLOSENESS (the sum of
+      weighted distances) and STRAIGHTNESS to arrays of changes per node, the
+      changes are added to them
+  |betweenness|: sequence of betweenness changes per node, the changes are
+      added to it
+  All other parameters are as in |compute_origins|
+  """
+  (indptr, indices, weights, node_weights, locations,
+      accumulations) = sequences
+  compute_s = compute_s and locations is not None
+  if compute_s:
+    node_locations = asarray(locations, dtype=float64).reshape((-1, 2))
+
+  for (t, change) in changes:
+    if compute_b:
+      P = {t: []} # Predecessors
+      sigma = {t: 1.0} # Number of shortest paths from |t| to other nodes
+    # Nodes within the radius, in the order they are extended, and their
+    #     distances from |t|
+    S = []
+    S_d = []
+
+    d = {t: 0.0} # Shortest distance from |t| to other nodes
+    # Queue for Dijkstra
+    Q = Priority_Queue([(0.0, t)])
+
+    # Dijkstra
+    while Q:
+      d_tv, v = Q.pop()
+      S.append(v)
+      S_d.append(d_tv)
+
+      for e in edge_range(indptr[v], indptr[v + 1]):
+        w = indices[e]
+        # t ~ ... ~ v ~ w
+        d_tw = d_tv + weights[e]
+        refresh = False
+        if not w in d or lt_tol(d_tw, d[w]):
+          if d_tw <= radius:
+            if w in Q:
+              Q.decrease_key((d_tw, w))
+            else:
+              Q.push((d_tw, w))
+          d[w] = d_tw
+          refresh = True
+
+        if compute_b:
+          if refresh:
+            sigma[w] = 0.0
+            P[w] = []
+          if eq_tol(d_tw, d[w]): # Count all shortest paths from |t| to |w|
+            sigma[w] += sigma[v]
+            P[w].append(v)
+
+    # Change of the term of |t| in the metrics of the nodes within the radius
+    S_nodes = asarray(S, dtype=int)
+    S_d = asarray(S_d, dtype=float64)
+    positive = S_d > 0
+    deltas[WEIGHTED_REACH][S_nodes] += change * (S_nodes != t)
+    if compute_g:
+      deltas[GRAVITY][S_nodes] += positive * (change * exp_array(-S_d * beta))
+    if compute_c:
+      deltas[CLOSENESS][S_nodes] += change * S_d
+    if compute_s:
+      S_d_positive = S_d.copy()
+      S_d_positive[~positive] = 1.0
+      deltas[STRAIGHTNESS][S_nodes] += positive * (change * sqrt_array(((
+          node_locations[S_nodes] - node_locations[t])**2).sum(axis=1)) /
+          S_d_positive)
+    if compute_b:
+      # Dependency of the |sources| on the paths to |t|, revisiting nodes in
+      #     reverse order of distance from |t|
+      delta = {}
+      for w in reversed(S):
+        delta_w = delta.get(w, 0.0)
+        for v in P[w]:
+          delta[v] = (delta.get(v, 0.0) + sigma[v] / sigma[w] *
+              (sources[w] + delta_w))
+        if w != t:
+          betweenness[w] += change * delta_w
+
+    step()
+
+def sweep_columns(radii, betas, compute_r, compute_g, compute_b, compute_c,
+    compute_s, accumulator_fields):
+  """
+  Returns the columns of a sweep over |radii| and |betas|, as a list with one
+      entry per radius: (reach_key, weighted_reach_key, metrics, accumulators)
+  |reach_key|, |weighted_reach_key|: keys of the unweighted and weighted reach
+      values for the radius
+  |metrics|: list of (metric, column, norm_column, beta) for each computed
+      metric at the radius, there is one gravity entry per beta
+  |accumulators|: list of the accumulator columns for the radius, in order of
+      |accumulator_fields|
+  With a single radius and beta, the usual metric and accumulator names are
+      used, otherwise the radii are labeled as in |radius_labels|
+  """
+  sweep = len(radii) > 1 or len(betas) > 1
+  labels = radius_labels(radii)
+  columns = []
+  for (i, label) in enumerate(labels):
+    metrics = []
+    for (metric, norm_metric, compute) in [(REACH, NORM_REACH, compute_r),
+        (GRAVITY, NORM_GRAVITY, compute_g),
+        (BETWEENNESS, NORM_BETWEENNESS, compute_b),
+        (CLOSENESS, NORM_CLOSENESS, compute_c),
+        (STRAIGHTNESS, NORM_STRAIGHTNESS, compute_s)]:
+      if not compute:
+        continue
+      for (j, beta) in (enumerate(betas) if metric == GRAVITY else
+          [(None, betas[0])]):
+        if sweep:
+          metrics.append((metric, SWEEP_METRIC_NAME(metric, label, j),
+              SWEEP_NORM_METRIC_NAME(metric, label, j), beta))
+        else:
+          metrics.append((metric, metric, norm_metric, beta))
+    if sweep:
+      accumulators = [SWEEP_ACCUMULATOR_NAME(k, label) for k in
+          xrange(len(accumulator_fields))]
+      if any(len(column) > MAX_FIELD_NAME_LENGTH for column in accumulators +
+          [column for (metric, column, norm_column, beta) in metrics] +
+          [norm_column for (metric, column, norm_column, beta) in metrics]):
+        raise Invalid_Parameters_Exception("too many betas or accumulator "
+            "fields to name the sweep columns")
+      columns.append(((REACH_COUNT, i), (WEIGHTED_REACH, i), metrics,
+          accumulators))
+    else:
+      columns.append((REACH_COUNT, WEIGHTED_REACH, metrics,
+          list(accumulator_fields)))
+  return columns
+
+def compute_origins_sweep(sequences, origins, compute_r, compute_g, compute_b,
+    compute_c, compute_s, radii, network_radius, betas, accumulator_fields,
+    betweenness, step):
+  """
+  Same as |compute_origins|, but computes the metrics for every radius in
+      |radii| and every beta in |betas| from a single shortest path tree per
+      origin, grown up to the largest radius
+  Since nodes are settled in order of distance, the part of the tree within a
+      smaller radius is the tree that a run at the smaller radius would grow
+  With a euclidean radius, a run accumulates over its whole tree at the point
+      where it has extended every node within its radius, so the tree is kept
+      as it is at that point for each smaller radius
+  The values are keyed as described by |sweep_columns|
+  |betweenness|: sequence of N * len(|radii|) values, the betweenness values
+      for the i-th radius are at [i * N:(i + 1) * N]
+  """
+  (indptr, indices, weights, node_weights, locations,
+      accumulations) = sequences
+  N = len(node_weights)
+  K = len(accumulator_fields)
+  have_accumulations = K > 0
+  if have_accumulations:
+    edge_accumulations = asarray(accumulations, dtype=float64).reshape((-1,
+        K))
+    edge_sources = repeat(arange(N), diff(asarray(indptr)))
+    node_accumulations = zeros((N, K))
+  have_locations = locations is not None
+  compute_s = compute_s and have_locations
+  if have_locations:
+    node_locations = asarray(locations, dtype=float64).reshape((-1, 2))
+  node_weight_array = asarray(node_weights, dtype=float64)
+  radius = max(radii)
+  if not network_radius:
+    spatial_index = Grid_Index(locations, radius)
+  columns = sweep_columns(radii, betas, compute_r, compute_g, compute_b,
+      compute_c, compute_s, accumulator_fields)
+
+  # Scratch buffers indexed by node, as in |compute_origins|; the dependencies
+  #     are reset after each radius
+  d = [None] * N # Shortest distance from the origin, None if not found
+  touched = [] # Nodes whose entries were set for the current origin
+  if compute_b:
+    sigma = [0.0] * N # Number of shortest paths from the origin
+    delta = [0.0] * N # Dependency of the origin on each node
+    # Predecessors, as linked lists in a flat buffer
+    pred_head = [-1] * N
+    pred_node = [0] * len(indices)
+    pred_next = [0] * len(indices)
+
+  # Metric values for each of the |origins|
+  values = {}
+  for (reach_key, weighted_reach_key, metrics, accumulators) in columns:
+    # Betweenness is accumulated in |betweenness| instead
+    for key in [reach_key, weighted_reach_key] + [column for (metric, column,
+        norm_column, beta) in metrics if metric != BETWEENNESS] + accumulators:
+      values[key] = []
+
+  for s in origins:
+    weight_s = node_weights[s]
+    if have_locations: x_s, y_s = locations[2 * s], locations[2 * s + 1]
+
+    if compute_b:
+      sigma[s] = 1.0
+      pred_count = 0 # Number of entries in the predecessor buffer
+    if have_accumulations:
+      tree_edges = {} # Last edge of the shortest path from |s| to each node
+      depth = {s: 0} # Number of edges on the shortest path from |s|
+    # Nodes within the largest radius, in the order they are extended, and
+    #     their network and euclidean distances from |s|
+    S = []
+    S_d = []
+    S_dist = []
+
+    d[s] = 0.0
+    touched.append(s)
+    # Queue for Dijkstra
+    Q = Priority_Queue([(0.0, s)] if network_radius else [(0.0, s, 0.0)])
+
+    # If we use euclidean radius, make a list of all reachable nodes and
+    #     their euclidean distances from |s|
+    if not network_radius:
+      dist_s = euclidean_distances(spatial_index, x_s, y_s, radius)
+      reachable_s = set(dist_s)
+      if have_accumulations:
+        # Number of nodes within each radius that are not extended yet, and
+        #     the (tree_edges, depth) of the tree once there are none left
+        unextended = [sum(1 for dist in dist_s.itervalues() if dist <=
+            radius_i) for radius_i in radii]
+        trees = [None] * len(radii)
+
+    # Dijkstra
+    while Q and (True if network_radius else reachable_s):
+      # Pop the closest node to |s| from |Q|
+      if network_radius:
+        d_sv, v = Q.pop()
+        dist_sv = d_sv
+      else:
+        d_sv, v, dist_sv = Q.pop()
+        if v in reachable_s:
+          reachable_s.remove(v)
+          if have_accumulations:
+            for (i, radius_i) in enumerate(radii):
+              if dist_sv <= radius_i:
+                unextended[i] -= 1
+
+      if network_radius or dist_sv <= radius:
+        S.append(v)
+        S_d.append(d_sv)
+        S_dist.append(dist_sv)
+
+      for e in edge_range(indptr[v], indptr[v + 1]):
+        w = indices[e]
+        # s ~ ... ~ v ~ w
+        d_sw = d_sv + weights[e]
+        if not network_radius:
+            # Use Euclidean distance
+            dist_sw = dist_s.get(w, OUTSIDE_RADIUS)
+
+        refresh = False
+        add_w_to_Q = False
+
+        if d[w] is None: # Found a path from |s| to |w| for the first time
+          if d_sw <= radius or not network_radius:
+            add_w_to_Q = True
+          d[w] = d_sw
+          touched.append(w)
+          refresh = True
+
+        elif lt_tol(d_sw, d[w]): # Found a better path from |s| to |w|
+          if d_sw <= radius or not network_radius:
+            # If |w| is already in |Q|, its longer path entry becomes stale
+            add_w_to_Q = True
+          d[w] = d_sw
+          refresh = True
+
+        if add_w_to_Q:
+          new_node = (d_sw, w) if network_radius else (d_sw, w, dist_sw)
+          if w in Q:
+            Q.decrease_key(new_node)
+          else:
+            Q.push(new_node)
+          if have_accumulations:
+            tree_edges[w] = e
+            depth[w] = depth[v] + 1
+
+        if compute_b:
+          if refresh:
+            sigma[w] = 0.0
+            pred_head[w] = -1
+          if eq_tol(d_sw, d[w]): # Count all shortest paths from |s| to |w|
+            sigma[w] += sigma[v] # Update the number of shortest paths
+            # |v| is a predecessor of |w|
+            pred_node[pred_count] = v
+            pred_next[pred_count] = pred_head[w]
+            pred_head[w] = pred_count
+            pred_count += 1
+
+      # A run at a radius with no unextended nodes left would stop here
+      if not network_radius and have_accumulations:
+        for i in xrange(len(radii)):
+          if not unextended[i] and trees[i] is None:
+            trees[i] = (dict(tree_edges), dict(depth))
+
+    # Evaluate the metrics of |s| at each radius
+    S_nodes = asarray(S, dtype=int)
+    S_d = asarray(S_d, dtype=float64)
+    # Distance compared against the radius
+    S_key = S_d if network_radius else asarray(S_dist, dtype=float64)
+    S_weights = node_weight_array[S_nodes]
+    if compute_s:
+      S_straight = sqrt_array(((node_locations[S_nodes] - (x_s, y_s))**2).sum(
+          axis=1))
+    if have_accumulations and network_radius:
+      tree_nodes = fill_tree_accumulations(s, tree_edges, depth, edge_sources,
+          edge_accumulations, node_accumulations)
+      tree_d = asarray([d[v] for v in tree_nodes.tolist()], dtype=float64)
+    for (i, (reach_key, weighted_reach_key, metrics, accumulators)) in (
+        enumerate(columns)):
+      radius_i = radii[i]
+      within = S_key <= radius_i
+      positive = within & (S_d > 0)
+      weights_i = S_weights[positive]
+      d_i = S_d[positive]
+      reach_s = int(within.sum()) - 1
+      weighted_reach_s = float(S_weights[within].sum()) - weight_s
+      values[reach_key].append(reach_s)
+      values[weighted_reach_key].append(weighted_reach_s)
+      for (metric, column, norm_column, beta) in metrics:
+        if metric == REACH:
+          values[column].append(weighted_reach_s)
+        elif metric == GRAVITY:
+          values[column].append(float((weights_i * exp_array(-d_i *
+              beta)).sum()))
+        elif metric == CLOSENESS:
+          d_sum_s = float((weights_i * d_i).sum())
+          values[column].append(1.0 / d_sum_s if d_sum_s > 0 else 0.0)
+        elif metric == STRAIGHTNESS:
+          values[column].append(float((weights_i * S_straight[positive] /
+              d_i).sum()))
+      if have_accumulations and network_radius:
+        total_accumulations_s = node_accumulations[tree_nodes[tree_d <=
+            radius_i]].sum(axis=0).tolist()
+      elif have_accumulations:
+        tree_edges_i, depth_i = trees[i] or (tree_edges, depth)
+        total_accumulations_s = tree_accumulations(s, tree_edges_i, depth_i,
+            edge_sources, edge_accumulations, node_accumulations)
+      if have_accumulations:
+        for (k, column) in enumerate(accumulators):
+          values[column].append(total_accumulations_s[k])
+      if compute_b:
+        # Revisit nodes within the radius in reverse order of distance from |s|
+        offset = i * N
+        for w in reversed(S_nodes[within].tolist()):
+          delta_w = delta[w] # Dependency of |s| on |w|
+          weight_w = node_weights[w]
+          k = pred_head[w]
+          while k != -1:
+            v = pred_node[k]
+            delta[v] += sigma[v] / sigma[w] * (weight_w + delta_w)
+            k = pred_next[k]
+          if w != s:
+            betweenness[offset + w] += delta_w
+        for v in touched:
+          delta[v] = 0.0
+
+    # Reset the scratch entries of the nodes visited from |s|
+    for v in touched:
+      d[v] = None
+      if compute_b:
+        sigma[v] = 0.0
+        pred_head[v] = -1
+    del touched[:]
+
+    step()
+
+  return values
+
+def pivot_quantities(compute_r, compute_g, compute_b, compute_c, compute_s,
+    accumulator_fields):
+  """
+  Returns the keys of the quantities that |compute_pivots| sums for each node:
+      the unweighted and weighted reach, gravity, betweenness, the sum of
+      weighted distances (closeness), straightness and the accumulator fields
+  """
+  quantities = [REACH_COUNT, WEIGHTED_REACH]
+  for (metric, compute) in [(GRAVITY, compute_g), (BETWEENNESS, compute_b),
+      (CLOSENESS, compute_c), (STRAIGHTNESS, compute_s)]:
+    if compute:
+      quantities.append(metric)
+  return quantities + list(accumulator_fields)
+
+def compute_pivots(sequences, pivots, compute_r, compute_g, compute_b,
+    compute_c, compute_s, radius, network_radius, beta, accumulator_fields,
+    sums, step, sources=None):
+  """
+  Computes the shortest path tree of each of the |pivots| and adds the term of
+      the pivot to the metrics of every node in the tree
+  Shortest path and euclidean distances are symmetric, so the term of pivot p
+      in the metrics of node t is the term of t in the metrics of p; summing
+      over a sample of the origins estimates the metrics of every node
+  |sums|: dictionary mapping each of the |pivot_quantities| to a 2 by N array,
+      the terms of the pivots are added to its first row and their squares to
+      its second row (for the variance of the estimates)
+  For closeness, the weighted distances are summed
+  |sources|: set of the pivots whose betweenness terms are added, or None for
+      all pivots (betweenness only counts the paths from the origins)
+  All other parameters are as in |compute_origins|
+  """
+  (indptr, indices, weights, node_weights, locations,
+      accumulations) = sequences
+  N = len(node_weights)
+  K = len(accumulator_fields)
+  have_accumulations = K > 0
+  if have_accumulations:
+    edge_accumulations = asarray(accumulations, dtype=float64).reshape((-1,
+        K))
+    edge_sources = repeat(arange(N), diff(asarray(indptr)))
+    node_accumulations = zeros((N, K))
+  compute_s = compute_s and locations is not None
+  if compute_s:
+    node_locations = asarray(locations, dtype=float64).reshape((-1, 2))
+  if not network_radius:
+    spatial_index = Grid_Index(locations, radius)
+
+  # Scratch buffers indexed by node, as in |compute_origins|
+  d = [None] * N # Shortest distance from the pivot, None if not found
+  touched = [] # Nodes whose entries were set for the current pivot
+  if compute_b:
+    sigma = [0.0] * N # Number of shortest paths from the pivot
+    delta = [0.0] * N # Dependency of the pivot on each node
+    # Predecessors, as linked lists in a flat buffer
+    pred_head = [-1] * N
+    pred_node = [0] * len(indices)
+    pred_next = [0] * len(indices)
+
+  for p in pivots:
+    weight_p = node_weights[p]
+    if locations is not None:
+      x_p, y_p = locations[2 * p], locations[2 * p + 1]
+
+    if compute_b:
+      sigma[p] = 1.0
+      pred_count = 0 # Number of entries in the predecessor buffer
+    if have_accumulations:
+      tree_edges = {} # Last edge of the shortest path from |p| to each node
+      depth = {p: 0} # Number of edges on the shortest path from |p|
+    # Nodes within the radius, in the order they are extended, and their
+    #     distances from |p|
+    S = []
+    S_d = []
+
+    d[p] = 0.0
+    touched.append(p)
+    # Queue for Dijkstra
+    Q = Priority_Queue([(0.0, p)] if network_radius else [(0.0, p, 0.0)])
+
+    # If we use euclidean radius, make a list of all reachable nodes and
+    #     their euclidean distances from |p|
+    if not network_radius:
+      dist_p = euclidean_distances(spatial_index, x_p, y_p, radius)
+      reachable_p = set(dist_p)
+
+    # Dijkstra
+    while Q and (True if network_radius else reachable_p):
+      # Pop the closest node to |p| from |Q|
+      if network_radius:
+        d_pv, v = Q.pop()
+      else:
+        d_pv, v, dist_pv = Q.pop()
+        if v in reachable_p:
+          reachable_p.remove(v)
+
+      if network_radius or dist_pv <= radius:
+        S.append(v)
+        S_d.append(d_pv)
+
+      for e in edge_range(indptr[v], indptr[v + 1]):
+        w = indices[e]
+        # p ~ ... ~ v ~ w
+        d_pw = d_pv + weights[e]
+        if not network_radius:
+            # Use Euclidean distance
+            dist_pw = dist_p.get(w, OUTSIDE_RADIUS)
+
+        refresh = False
+        add_w_to_Q = False
+
+        if d[w] is None: # Found a path from |p| to |w| for the first time
+          if d_pw <= radius or not network_radius:
+            add_w_to_Q = True
+          d[w] = d_pw
+          touched.append(w)
+          refresh = True
+
+        elif lt_tol(d_pw, d[w]): # Found a better path from |p| to |w|
+          if d_pw <= radius or not network_radius:
+            add_w_to_Q = True
+          d[w] = d_pw
+          refresh = True
+
+        if add_w_to_Q:
+          new_node = (d_pw, w) if network_radius else (d_pw, w, dist_pw)
+          if w in Q:
+            Q.decrease_key(new_node)
+          else:
+            Q.push(new_node)
+          if have_accumulations:
+            tree_edges[w] = e
+            depth[w] = depth[v] + 1
+
+        if compute_b:
+          if refresh:
+            sigma[w] = 0.0
+            pred_head[w] = -1
+          if eq_tol(d_pw, d[w]): # Count all shortest paths from |p| to |w|
+            sigma[w] += sigma[v]
+            pred_node[pred_count] = v
+            pred_next[pred_count] = pred_head[w]
+            pred_head[w] = pred_count
+            pred_count += 1
+
+    # Terms of |p| in the metrics of the nodes within the radius
+    S_nodes = asarray(S, dtype=int)
+    S_d = asarray(S_d, dtype=float64)
+    others = S_nodes != p
+    positive = S_d > 0
+    terms = {REACH_COUNT: others * 1.0, WEIGHTED_REACH: others * weight_p}
+    if compute_g:
+      terms[GRAVITY] = positive * (weight_p * exp_array(-S_d * beta))
+    if compute_c:
+      terms[CLOSENESS] = weight_p * S_d
+    if compute_s:
+      S_d_positive = S_d.copy()
+      S_d_positive[~positive] = 1.0
+      terms[STRAIGHTNESS] = positive * (weight_p * sqrt_array(((
+          node_locations[S_nodes] - (x_p, y_p))**2).sum(axis=1)) /
+          S_d_positive)
+    if have_accumulations:
+      fill_tree_accumulations(p, tree_edges, depth, edge_sources,
+          edge_accumulations, node_accumulations)
+      for (k, field) in enumerate(accumulator_fields):
+        terms[field] = node_accumulations[S_nodes, k]
+    for (key, terms_p) in terms.items():
+      sums[key][0][S_nodes] += terms_p
+      sums[key][1][S_nodes] += terms_p * terms_p
+    if compute_b and (sources is None or p in sources):
+      # Revisit nodes in reverse order of distance from |p|
+      for w in reversed(S):
+        delta_w = delta[w] # Dependency of |p| on |w|
+        weight_w = node_weights[w]
+        k = pred_head[w]
+        while k != -1:
+          v = pred_node[k]
+          delta[v] += sigma[v] / sigma[w] * (weight_w + delta_w)
+          k = pred_next[k]
+      delta_values = asarray([delta[w] for w in S], dtype=float64)
+      delta_values[~others] = 0.0
+      sums[BETWEENNESS][0][S_nodes] += delta_values
+      sums[BETWEENNESS][1][S_nodes] += delta_values * delta_values
+
+    # Reset the scratch entries of the nodes visited from |p|
+    for v in touched:
+      d[v] = None
+      if compute_b:
+        sigma[v] = 0.0
+        delta[v] = 0.0
+        pred_head[v] = -1
+    del touched[:]
+
+    step()
+
+def _constant(node):
+  """
+  Returns (True, value) if |node| is a True or False constant, (False, None)
+      otherwise
+  """
+  if isinstance(node, ast.Name) and node.id in ("True", "False"):
+    return True, node.id == "True"
+  value = getattr(node, "value", None)
+  if type(node).__name__ in ("NameConstant", "Constant") and isinstance(value,
+      bool):
+    return True, value
+  return False, None
+
+def _constant_node(value):
+  """
+  Returns an expression node for the constant |value|
+  """
+  return ast.parse(repr(bool(value)), mode="eval").body
+
+class _Kernel_Specializer(ast.NodeTransformer):
+  """
+  Replaces the options of a kernel with their values and removes the code that
+      is not reached with those values
+  """
+
+  def __init__(self, options):
+    """
+    |options|: maps option names to True or False
+    """
+    self.options = options
+
+  def visit_Name(self, node):
+    if node.id in self.options and isinstance(node.ctx, ast.Load):
+      return ast.copy_location(_constant_node(self.options[node.id]), node)
+    return node
+
+  def visit_UnaryOp(self, node):
+    self.generic_visit(node)
+    is_constant, value = _constant(node.operand)
+    if is_constant and isinstance(node.op, ast.Not):
+      return ast.copy_location(_constant_node(not value), node)
+    return node
+
+  def visit_BoolOp(self, node):
+    self.generic_visit(node)
+    # Value that decides the whole expression, True for "or" and False for
+    #     "and"
+    deciding = isinstance(node.op, ast.Or)
+    operands = []
+    for operand in node.values:
+      is_constant, value = _constant(operand)
+      if not is_constant:
+        operands.append(operand)
+      elif value == deciding:
+        return ast.copy_location(_constant_node(deciding), node)
+    if not operands:
+      return ast.copy_location(_constant_node(not deciding), node)
+    if len(operands) == 1:
+      return operands[0]
+    node.values = operands
+    return node
+
+  def visit_IfExp(self, node):
+    self.generic_visit(node)
+    is_constant, value = _constant(node.test)
+    if is_constant:
+      return node.body if value else node.orelse
+    return node
+
+  def generic_visit(self, node):
+    ast.NodeTransformer.generic_visit(self, node)
+    # Blocks of statements that were emptied must still hold a statement
+    if isinstance(getattr(node, "body", None), list) and not node.body:
+      node.body = [ast.copy_location(ast.Pass(), node)]
+    return node
+
+  def visit_If(self, node):
+    self.generic_visit(node)
+    is_constant, value = _constant(node.test)
+    if is_constant:
+      block = node.body if value else node.orelse
+      return [statement for statement in block if not isinstance(statement,
+          ast.Pass)] or None
+    if (isinstance(node.test, ast.Compare) and not node.orelse and
+        all(isinstance(statement, ast.Pass) for statement in node.body)):
+      # Nothing left to do under a comparison
+      return None
+    return node
+
+  def visit_While(self, node):
+    self.generic_visit(node)
+    is_constant, value = _constant(node.test)
+    if is_constant and not value:
+      return node.orelse or None
+    return node
+
+# Specialized kernels generated so far, keyed by option values
+_kernels = {}
+
+def select_kernel(compute_r, compute_g, compute_b, compute_c, compute_s,
+    network_radius, have_accumulations, have_locations):
+  """
+  Returns a kernel with the same parameters as |compute_origins| that is
+      specialized to the given option values, the kernel ignores the values it
+      is later passed for these options
+  Falls back to |compute_origins| if the kernel cannot be generated (e.g. if
+      the source of this script is not available)
+  """
+  compute_s = compute_s and have_locations
+  key = tuple(bool(option) for option in (compute_r, compute_g, compute_b,
+      compute_c, compute_s, network_radius, have_accumulations, have_locations))
+  if key not in _kernels:
+    try:
+      tree = ast.parse(getsource(compute_origins))
+      tree = _Kernel_Specializer(dict(zip(KERNEL_OPTIONS, key))).visit(tree)
+      ast.fix_missing_locations(tree)
+      namespace = {}
+      exec(compile(tree, __file__, "exec"), globals(), namespace)
+      _kernels[key] = namespace[compute_origins.__name__]
+    except:
+      _kernels[key] = compute_origins
+  return _kernels[key]
+
+# Kernels that use a |Bucket_Queue|, keyed by (kernel, quantum)
+_bucket_kernels = {}
+
+def bucket_kernel(kernel, quantum):
+  """
+  Returns a copy of |kernel| that runs Dijkstra with a |Bucket_Queue| whose
+      buckets are |quantum| wide, instead of a |Priority_Queue|
+  Both queues pop nodes in the same order, so the results are the same
+  """
+  key = (kernel, quantum)
+  if key not in _bucket_kernels:
+    namespace = dict(kernel.__globals__)
+    namespace[Priority_Queue.__name__] = partial(Bucket_Queue,
+        quantum=quantum)
+    _bucket_kernels[key] = FunctionType(kernel.__code__, namespace,
+        kernel.__name__, kernel.__defaults__)
+  return _bucket_kernels[key]
+
+# Kernels that count their work, keyed by kernel
+_counting_kernels = {}
+
+def counting_kernel(kernel):
+  """
+  Returns a copy of |kernel| that tallies its work with |count|: the nodes
+      settled, the edges relaxed, the queue pushes and decrease-keys, and the
+      predecessor entries recorded for betweenness
+  The copy looks up its queue, the range of edges of each settled node and the
+      test for a shortest path tie through counting wrappers, |kernel| itself
+      is left as it is
+  """
+  if kernel not in _counting_kernels:
+    namespace = dict(kernel.__globals__)
+    queue = namespace[Priority_Queue.__name__]
+    def counting_queue(entries=()):
+      return Counting_Queue(queue(entries))
+    def counting_edge_range(start, stop):
+      count(EDGES_RELAXED, stop - start)
+      return xrange(start, stop)
+    def tie(a, b):
+      if eq_tol(a, b):
+        count(PREDECESSOR_ENTRIES)
+        return True
+      return False
+    namespace[Priority_Queue.__name__] = counting_queue
+    namespace["edge_range"] = counting_edge_range
+    namespace[eq_tol.__name__] = tie
+    _counting_kernels[kernel] = FunctionType(kernel.__code__, namespace,
+        kernel.__name__, kernel.__defaults__)
+  return _counting_kernels[kernel]
+
+def kernel_for(arguments, sequences, quantum=None):
+  """
+  Returns the kernel specialized to a call to |compute_origins| with the metric
+      |arguments| (the arguments between |origins| and |betweenness|) on the
+      graph |sequences|
+  |quantum|: if given, the kernel uses a |Bucket_Queue| with buckets this wide
+  The kernel counts its work if instrumentation is on, see |counting_kernel|
+  """
+  (compute_r, compute_g, compute_b, compute_c, compute_s, radius,
+      network_radius, beta, accumulator_fields) = arguments
+  if isinstance(radius, list):
+    kernel = compute_origins_sweep
+  else:
+    kernel = select_kernel(compute_r, compute_g, compute_b, compute_c,
+        compute_s, network_radius, len(accumulator_fields) > 0,
+        sequences[4] is not None)
+  if quantum is not None:
+    kernel = bucket_kernel(kernel, quantum)
+  return counting_kernel(kernel) if instrumentation_enabled() else kernel
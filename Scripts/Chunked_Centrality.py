@@ -0,0 +1,118 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Script for running the centrality computation within a memory budget.
+The origins are run in chunks sized so that the graph with its metric columns,
+    the shortest path trees and the values of one chunk fit in the budget. The
+    values of each finished chunk are recorded in the metric columns before the
+    next chunk is run.
+"""
+
+from arcpy import AddMessage
+from Centrality_Kernels import scratch_bytes
+from Centrality_Kernels import SCRATCH_ITEM_BYTES
+from Component_Centrality import compute_origins_by_component
+from Constants import CHUNK_DONE
+from numpy import asarray
+from numpy import zeros
+from Utils import Invalid_Parameters_Exception
+from Utils import peak_memory
+
+# Estimated bytes taken by each node that a shortest path tree visits: its
+#     queue entry, its entry in the map of live queue priorities, and its place
+#     in the stack of extended nodes
+TREE_NODE_BYTES = 256
+# Estimated bytes taken by each node of a shortest path tree to keep track of
+#     accumulations: its last tree edge and its depth, plus 8 per field
+ACCUMULATION_NODE_BYTES = 224
+
+def fixed_bytes(N, E, K, compute_b, R, value_count, processes):
+  """
+  Returns the estimated bytes needed to grow shortest path trees on a graph
+      with |N| nodes and |E| directed edges, with |K| accumulator fields and
+      |R| radii, on |processes| processes, whatever the number of origins
+  |value_count|: number of values computed per origin
+  Any origin may reach every node, so every tree is taken to span the graph
+  """
+  # Each process holds the arrays of the graph as Python lists (offsets,
+  #     neighbors, edge weights and accumulations, node weights and locations)
+  per_process = (scratch_bytes(N, E, compute_b) + N * TREE_NODE_BYTES +
+      N * R * SCRATCH_ITEM_BYTES + (4 * N + (2 + K) * E) * SCRATCH_ITEM_BYTES)
+  if K:
+    per_process += N * (ACCUMULATION_NODE_BYTES + 8 * K)
+  # The arrays of the graph itself, and its metric columns (each value and
+  #     each betweenness value per node, with a normalized copy)
+  graph_bytes = 4 * (N + 1) + 4 * E + 8 * E * (1 + K) + 24 * N
+  metric_bytes = 2 * N * (value_count + R) * 8
+  # The parent process sums the betweenness values of the chunks
+  return (processes * per_process + graph_bytes + metric_bytes + N * R * 8)
+
+def origin_bytes(value_count):
+  """
+  Returns the estimated bytes taken by the |value_count| values of an origin,
+      held as Python lists by the workers and by the parent process
+  """
+  return max(1, 2 * value_count * SCRATCH_ITEM_BYTES)
+
+def chunk_size(max_memory, N, E, K, compute_b, R, value_count, processes):
+  """
+  Returns the number of origins to run at once so that the computation fits in
+      |max_memory| bytes, or 0 if a single origin does not fit
+  Parameters are as in |fixed_bytes|
+  """
+  free = max_memory - fixed_bytes(N, E, K, compute_b, R, value_count,
+      processes)
+  return max(0, int(free // origin_bytes(value_count)))
+
+def plan_chunks(max_memory, N, E, K, compute_b, R, value_count,
+    accumulation_value_count, processes):
+  """
+  Returns (size, keep_accumulations), the number of origins per chunk and
+      whether accumulations still fit in |max_memory|
+  |accumulation_value_count|: number of the values per origin that are
+      accumulations
+  Raises |Invalid_Parameters_Exception| if a single origin does not fit in
+      |max_memory| even without accumulations
+  """
+  size = chunk_size(max_memory, N, E, K, compute_b, R, value_count, processes)
+  if size > 0:
+    return size, True
+  size = chunk_size(max_memory, N, E, 0, compute_b, R, value_count -
+      accumulation_value_count, processes)
+  if size > 0:
+    return size, False
+  raise Invalid_Parameters_Exception("a shortest path tree needs about %.1f "
+      "MB, more than the memory limit of %.1f MB" % (fixed_bytes(N, E, 0,
+      compute_b, R, value_count - accumulation_value_count, processes) /
+      2.0**20, max_memory / 2.0**20))
+
+def compute_origins_in_chunks(graph, origin_indices, arguments, processes, R,
+    step, quantum, size, record):
+  """
+  Same as |compute_origins_by_component|, run on |size| origins at a time
+  |record|: called as record(chunk_origin_indices, chunk_values) with the
+      values of each chunk as soon as it is done, to store them in the metric
+      columns of |graph|
+  The peak memory use of the process is reported after each chunk
+  Returns the betweenness values, as |compute_origins_by_component|
+  """
+  N = len(graph)
+  O = len(origin_indices)
+  betweenness = zeros(N * R)
+  chunks = (O + size - 1) // size
+  for (i, start) in enumerate(xrange(0, O, size)):
+    chunk_origin_indices = origin_indices[start:start + size]
+    chunk_values, chunk_betweenness = compute_origins_by_component(graph,
+        chunk_origin_indices, arguments, processes, R, step, quantum)
+    betweenness += asarray(chunk_betweenness)
+    record(chunk_origin_indices, chunk_values)
+    del chunk_values, chunk_betweenness
+    AddMessage(CHUNK_DONE(i + 1, chunks, peak_memory()))
+  return betweenness
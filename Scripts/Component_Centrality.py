@@ -0,0 +1,168 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Script for running the centrality computation one connected component at a
+    time.
+A shortest path tree never leaves the component of its origin, so each
+    component is an independent work unit with its own, compact, node indices.
+    Units are run largest first. Origins in components of a single node have
+    nothing to reach and take no shortest path tree at all, origins in tiny
+    components are run together as one unit, on the subgraph of all tiny
+    components.
+With a birds-eye radius, a run with accumulations goes on until every node
+    within the circle is extended, nodes of other components included, so it
+    accumulates over the whole component of its origin; such runs are made on
+    the whole graph.
+"""
+
+from Centrality_Kernels import graph_arrays
+from Centrality_Kernels import kernel_for
+from Graph import connected_components
+from numpy import asarray
+from numpy import bincount
+from numpy import concatenate
+from numpy import cumsum
+from numpy import zeros
+from Parallel_Centrality import compute_origins_in_parallel
+from Parallel_Centrality import compute_units_in_parallel
+
+# Default largest size of the components that are run together as one unit
+TINY_COMPONENT = 8
+
+def _sequences(graph, accumulator_fields):
+  """
+  Returns the arrays of |graph| used by |compute_origins|, as lists
+  """
+  # Python lists are faster than arrays to index one item at a time
+  return tuple(None if a is None else a.tolist() for a in graph_arrays(graph,
+      accumulator_fields))
+
+def compute_origins_by_component(graph, origin_indices, arguments, processes,
+    R, step, quantum=None, tiny_component=TINY_COMPONENT):
+  """
+  Same as |compute_origins| on the whole of |graph|, run one connected
+      component at a time
+  |origin_indices|: node indices of the origins
+  |arguments|: the arguments to |compute_origins| between |origins| and
+      |betweenness|, as a tuple
+  |processes|: number of processes to split the work among
+  |R|: number of radii, the betweenness array has |R| values per node
+  |quantum|: as in |kernel_for|
+  |tiny_component|: components of at most this many nodes (and more than one)
+      are run together as a single unit
+  Returns (values, betweenness), as |compute_origins_in_parallel|
+  """
+  N = len(graph)
+  O = len(origin_indices)
+  network_radius = arguments[6]
+  accumulator_fields = arguments[8]
+  labels = connected_components(graph)
+  sizes = bincount(labels)
+  if len(sizes) == 1 or (accumulator_fields and not network_radius):
+    # A single component, or runs that do not stop within their component, run
+    #     on the graph as it is
+    if processes > 1:
+      return compute_origins_in_parallel(graph_arrays(graph,
+          accumulator_fields), origin_indices, processes, arguments, N * R,
+          step, quantum)
+    sequences = _sequences(graph, accumulator_fields)
+    betweenness = [0.0] * (N * R)
+    values = kernel_for(arguments, sequences, quantum)(sequences,
+        origin_indices, *(arguments + (betweenness, step)))
+    return values, betweenness
+
+  # Nodes of each component, in increasing order
+  order = labels.argsort(kind="mergesort")
+  ends = cumsum(sizes)
+  starts = ends - sizes
+  # Positions in |origin_indices| of the origins of each component
+  component_origins = {}
+  for (i, s) in enumerate(origin_indices):
+    component_origins.setdefault(int(labels[s]), []).append(i)
+
+  # The keys of the values, from a run without origins
+  sequences = _sequences(graph, accumulator_fields)
+  kernel = kernel_for(arguments, sequences, quantum)
+  values = dict((key, [0.0] * O) for key in kernel(sequences, [], *(arguments
+      + ([0.0] * (N * R), step))))
+  betweenness = zeros(N * R)
+
+  def record(positions, nodes, unit_values, unit_betweenness):
+    """
+    Records the results of a unit, |nodes| maps its node indices to node
+        indices of |graph|
+    """
+    for (key, key_values) in unit_values.items():
+      for (i, value) in zip(positions, key_values):
+        values[key][i] = value
+    n = len(nodes)
+    unit_betweenness = asarray(unit_betweenness)
+    for r in xrange(R):
+      betweenness[r * N + nodes] += unit_betweenness[r * n:(r + 1) * n]
+
+  # Units, largest first
+  units = []
+  tiny_positions = []
+  tiny_nodes = []
+  for c in sorted(component_origins, key=lambda c: (-sizes[c] *
+      len(component_origins[c]), c)):
+    positions = component_origins[c]
+    if sizes[c] == 1:
+      # Nothing to reach, all values stay 0
+      for i in positions:
+        step()
+    elif sizes[c] <= tiny_component:
+      tiny_positions.extend(positions)
+      tiny_nodes.append(order[starts[c]:ends[c]])
+    else:
+      nodes = order[starts[c]:ends[c]]
+      subgraph = graph.subgraph(nodes)
+      local_origins = nodes.searchsorted([origin_indices[i] for i in
+          positions]).tolist()
+      units.append((positions, nodes, subgraph, local_origins))
+  if tiny_positions:
+    # Tiny components are one unit, too small to be worth a subgraph each
+    nodes = concatenate(tiny_nodes)
+    nodes.sort()
+    units.append((tiny_positions, nodes, graph.subgraph(nodes),
+        nodes.searchsorted([origin_indices[i] for i in
+        tiny_positions]).tolist()))
+
+  if processes > 1 and units:
+    # Units that would take more than a fair share of the work are split into
+    #     parts with interleaved origins
+    total_cost = sum(len(nodes) * len(positions) for (positions, nodes,
+        subgraph, local_origins) in units)
+    parts = []
+    for (positions, nodes, subgraph, local_origins) in units:
+      count = min(len(positions), processes, -(-len(nodes) * len(positions) *
+          processes // total_cost))
+      for k in xrange(count):
+        parts.append((positions[k::count], nodes, subgraph,
+            local_origins[k::count]))
+    units = parts
+    results = compute_units_in_parallel([(graph_arrays(subgraph,
+        accumulator_fields), local_origins) for (positions, nodes, subgraph,
+        local_origins) in units], [len(subgraph) * len(local_origins) for (
+        positions, nodes, subgraph, local_origins) in units], processes,
+        arguments, step, quantum)
+    for ((positions, nodes, subgraph, local_origins), (unit_values,
+        unit_betweenness)) in zip(units, results):
+      record(positions, nodes, unit_values, unit_betweenness)
+  else:
+    for (positions, nodes, subgraph, local_origins) in units:
+      unit_sequences = _sequences(subgraph, accumulator_fields)
+      unit_betweenness = [0.0] * (len(nodes) * R)
+      unit_values = kernel_for(arguments, unit_sequences, quantum)(
+          unit_sequences, local_origins, *(arguments + (unit_betweenness,
+          step)))
+      record(positions, nodes, unit_values, unit_betweenness)
+
+  return values, betweenness
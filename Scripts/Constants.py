@@ -57,13 +57,49 @@ OUTPUT_LOCATION = input_number.next()
 OUTPUT_FILE_NAME = input_number.next()
 ACCUMULATOR_ATTRIBUTES = input_number.next()
 OUTPUT_FEATURE_CLASS = input_number.next()
+# Optional inputs, these may be left out when the tool is run
+PARALLEL_PROCESSES = input_number.next()
+SEARCH_RADII = input_number.next()
+BETAS = input_number.next()
+SAMPLE_SIZE = input_number.next()
+RELATIVE_ERROR = input_number.next()
+STRATIFIED_SAMPLING = input_number.next()
+RANDOM_SEED = input_number.next()
+DISTANCE_CACHE = input_number.next()
+QUEUE_QUANTUM = input_number.next()
+NODE_ORDERING = input_number.next()
+MAX_MEMORY = input_number.next()
+SHARD = input_number.next()
+PARTIAL_RESULTS = input_number.next()
+MERGE_PARTIAL_RESULTS = input_number.next()
+TILE_SIZE = input_number.next()
+PERFORMANCE_REPORT = input_number.next()
+ADJACENCY_ENGINE = input_number.next()
+COMPRESS_ADJACENCY_LIST = input_number.next()
+ADJACENCY_LIST_DBF = input_number.next()
+PREVIOUS_RESULTS = input_number.next()
 
 # Number of inputs
 INPUT_COUNT = input_number.next()
+# Number of inputs that are always given
+REQUIRED_INPUT_COUNT = PARALLEL_PROCESSES
 
 # Network vs. Euclidean radius option
 ON_THE_NETWORK_OPTION = "On the network"
 
+# Orders that nodes can be renumbered in, so that nodes that are close in the
+#     network are close in memory
+HILBERT_ORDERING = "Hilbert curve"
+RCM_ORDERING = "Reverse Cuthill-McKee"
+NO_ORDERING = "None"
+NODE_ORDERINGS = [HILBERT_ORDERING, RCM_ORDERING, NO_ORDERING]
+
+# Ways to compute the adjacency list: with the OD cost matrix of Network
+#     Analyst, or natively from the shapefiles of the buildings and streets
+NETWORK_ANALYST_ENGINE = "Network Analyst"
+NATIVE_ENGINE = "Native"
+ADJACENCY_ENGINES = [NETWORK_ANALYST_ENGINE, NATIVE_ENGINE]
+
 # We convert input buildings to point feature class
 INPUT_POINTS = "INPUT_POINTS"
 # Name of input points after feature to point conversion
@@ -77,21 +113,67 @@ INPUT_BUILDINGS_COPY_FAILED = "[failed]"
 
 PROGRESS_NORMALIZATION = "Normalizing results"
 
-WARNING_LARGE_ADJ_FILE_NAME = ("Adjacency list DBF name is too large, "
+WARNING_LARGE_ADJ_FILE_NAME = ("Adjacency list file name is too large, "
     "please rerun with shorter input file names")
 WARNING_OUTPUT_ALREADY_EXISTS = "Output with the same name already exists"
 WARNING_NO_EDGE_FEATURE = lambda input_network: ("%s does not have edge feature"
     % input_network)
 WARNING_NO_JUNCTION_FEATURE = lambda input_network: ("%s does not have junction"
     " feature" % input_network)
+WARNING_NO_EDGE_SHAPEFILE = lambda input_network: ("%s is not built on a "
+    "shapefile of edges, the adjacency list cannot be computed natively" %
+    input_network)
 WARNING_POINTS_NOT_IN_GRAPH = lambda in_graph, not_in_graph: ("%d out of %d "
     "input points not recorded in graph" % (not_in_graph, (in_graph +
     not_in_graph)))
+WARNING_POINTS_NOT_SNAPPED = lambda points, not_snapped: ("%d out of %d input "
+    "points not within the search tolerance of a street" % (not_snapped,
+    points))
 WARNING_NO_NODES = "No nodes in graph"
 WARNING_APPLY_SYMBOLOGY_FAILED = "Failed to apply symbology to output layer"
 WARNING_FAIL_TO_DISPLAY = "Layer produced but not displayed"
 WARNING_NO_BETWEENNESS_NORMALIZATION = ("Betweenness values were not normalized"
     " since not all nodes were used as origins")
+WARNING_NO_TILES = ("Origins were not run in tiles, tiles take a finite "
+    "network radius and cannot be combined with sampling, a distance cache, a "
+    "memory limit or shards")
+WARNING_ACCUMULATIONS_DROPPED = ("Accumulations were not computed since they "
+    "do not fit in the memory limit")
+WARNING_NO_SAMPLED_ACCUMULATIONS = ("Accumulations were not computed since "
+    "they cannot be estimated from a sample with a birds-eye radius")
+WARNING_NO_MEMORY_LIMIT = ("The memory limit was not used since sampling "
+    "does not run the origins in chunks")
+WARNING_NO_PREVIOUS_RESULTS = ("Previous results were not used, they cannot be "
+    "combined with sampling, shards, tiles or a memory limit")
+WARNING_PREVIOUS_RESULTS_NOT_USED = ("Previous results were computed from "
+    "other origins or with other parameters, all origins were recomputed")
+WARNING_NO_WORKER_PROCESSES = ("Computed on a single process, no python "
+    "interpreter was found to start worker processes with")
+SWEEP_COLUMNS = lambda radii, labels, betas: ("Computing metrics for radii %s "
+    "and betas %s, gravity columns are numbered in order of beta" % (
+    ", ".join("%g (%s)" % (radius, label) for (radius, label) in zip(radii,
+    labels)), ", ".join("%g" % beta for beta in betas)))
+APPROXIMATE_CENTRALITY = lambda pivots, nodes, error: ("Estimated metrics "
+    "from the trees of %d of %d nodes, mean relative error %.3g at 95%% "
+    "confidence" % (pivots, nodes, error))
+BUILDING_DISTANCE_CACHE = "Caching distances within the search radius"
+DISTANCE_CACHE_USED = "Using cached distances within the search radius"
+INCREMENTAL_CENTRALITY = lambda recomputed, origins: ("Recomputed %d of %d "
+    "origins" % (recomputed, origins))
+SCRATCH_MEMORY = lambda size, processes: ("Shortest path scratch buffers take "
+    "about %.1f MB in each of %d processes" % (size / 2.0**20, processes))
+CHUNK_DONE = lambda chunk, chunks, peak: ("Finished chunk %d of %d of origins, "
+    "peak memory %s" % (chunk, chunks, "unknown" if peak is None else
+    "%.1f MB" % (peak / 2.0**20)))
+PARTIAL_RESULTS_WRITTEN = lambda origins, path: ("Wrote the partial results of "
+    "%d origins to %s, merge them to get the final results" % (origins, path))
+TILE_DONE = lambda tile, tiles, nodes, halo, peak: ("Finished tile %d of %d "
+    "with %d nodes and a halo of %g, peak memory %s" % (tile, tiles, nodes,
+    halo, "unknown" if peak is None else "%.1f MB" % (peak / 2.0**20)))
+PERFORMANCE_REPORT_WRITTEN = lambda path: ("Wrote the timings and counts of "
+    "the steps to %s" % path)
+PARTIAL_RESULTS_MERGED = lambda files, origins: ("Merged %d partial results "
+    "files with %d origins in all" % (files, origins))
 
 POINT_CONVERSION_STARTED = ("... [started] Converting polygons to network "
     "locations")
@@ -99,12 +181,17 @@ POINT_CONVERSION_FINISHED = "... [finished]"
 POINT_CONVERSION_DONE = "Conversion has already been done"
 
 ADJACENCY_LIST_COMPUTED = "Adjacency list already computed on previous run"
+ADJACENCY_LIST_EXPORTED = lambda dbf: "Adjacency list exported to %s" % dbf
 
 BARRIER_COST_PRE_PROCESSING = "Barrier cost computation pre-processing"
 BARRIER_COST_COMPUTATION = "Barrier cost computation"
 BARRIER_COST_COMPUTATION_STARTED = "... [started] Computing barrier costs"
 BARRIER_COST_COMPUTATION_FINISHED = "... [finished]"
 
+ORIGIN_BATCHES = lambda batches, smallest, largest, mean: ("%d batches of "
+    "origins, of %d to %d points (%.1f on average)" % (batches, smallest,
+    largest, mean))
+
 CALCULATE_LOCATIONS_STARTED = ("... [started] Calculating locations on the "
     "network")
 CALCULATE_LOCATIONS_FINISHED = "... [finished]"
@@ -159,6 +246,52 @@ NORM_METRICS = (NORM_REACH, NORM_GRAVITY, NORM_BETWEENNESS, NORM_CLOSENESS,
     NORM_STRAIGHTNESS)
 FINAL_ATTRIBUTES = METRICS + NORM_METRICS
 
+# Metrics computed for several radii and betas in one run (a sweep) are stored
+#     in one column per radius (and per beta for gravity), the column names
+#     must fit in the 10 characters of a DBF field name
+METRIC_ABBREVIATIONS = {REACH: "R", GRAVITY: "G", BETWEENNESS: "B",
+    CLOSENESS: "C", STRAIGHTNESS: "S"}
+NORM_PREFIX = "N"
+ACCUMULATOR_PREFIX = "A"
+# Number of characters of a DBF field name
+MAX_FIELD_NAME_LENGTH = 10
+# Longest radius label, so that the columns of up to 99 betas and 999
+#     accumulator fields fit in a field name
+MAX_RADIUS_LABEL_LENGTH = 5
+def radius_label(radius):
+  """
+  Returns a short label for |radius| that can be used in a field name
+  """
+  if radius >= INFINITE_RADIUS:
+    return "Inf"
+  if radius == int(radius):
+    return str(int(radius))
+  return ("%g" % radius).replace(".", "p")
+def radius_labels(radii):
+  """
+  Returns the labels that name the columns of each of |radii|: the short labels
+      of the radii if they are all distinct and short enough, otherwise the
+      positions of the radii ("r1", "r2", ...)
+  """
+  labels = [radius_label(radius) for radius in radii]
+  if len(set(labels)) == len(labels) and all(label.isalnum() and len(label) <=
+      MAX_RADIUS_LABEL_LENGTH for label in labels):
+    return labels
+  return ["r%d" % (i + 1) for i in xrange(len(radii))]
+SWEEP_METRIC_NAME = lambda metric, label, beta_index=None: ("%s%s%s" % (
+    METRIC_ABBREVIATIONS[metric], label, "" if beta_index is None else "_%d" %
+    (beta_index + 1)))
+SWEEP_NORM_METRIC_NAME = lambda metric, label, beta_index=None: ("%s%s" % (
+    NORM_PREFIX, SWEEP_METRIC_NAME(metric, label, beta_index)))
+SWEEP_ACCUMULATOR_NAME = lambda field_index, label: ("%s%d_%s" % (
+    ACCUMULATOR_PREFIX, field_index + 1, label))
+
+# Metrics estimated from a sample of the origins come with the half width of
+#     their 95% confidence interval, stored in a column named with this prefix
+CONFIDENCE_PREFIX = "CI_"
+# Standard normal quantile of the 95% confidence intervals
+CONFIDENCE_Z = 1.96
+
 # Constants for adjacency list computation
 # Network feature type identifiers
 EDGE_FEATURE = "EdgeFeature"
@@ -174,8 +307,14 @@ BARRIER_COST_FIELD = "Barrier_Cost"
 BARRIER_COST = (maxint / 5) * 2
 # Maximum extent of search on the network
 SEARCH_TOLERANCE = "5000 Meters"
+# Distance below which two locations are the same when the adjacency list is
+#     computed natively
+XY_TOLERANCE = 0.001
 # Distance offset when buildings are snapped to the network
 SNAP_OFFSET = "5 Meters"
+# Rows per chunk of an adjacency list file, and zlib level of compressed chunks
+ADJACENCY_CHUNK_ROWS = 2**16
+ADJACENCY_COMPRESSION_LEVEL = 6
 # Origin and Destination ID names
 ORIGIN_ID_FIELD_NAME = "OriginID"
 DESTINATION_ID_FIELD_NAME = "DestinationID"
@@ -183,6 +322,7 @@ DESTINATION_ID_FIELD_NAME = "DestinationID"
 # File names
 feature_class_name = lambda base: "%s_Featureclass" % base
 layer_name = lambda base: "%s_Layer" % base
+report_name = lambda base: "%s_Report.json" % base
 symbology_layer_name= lambda shape_type, first_metric: (
     "%s_%s_Symbology_Layer.lyr" % (shape_type, first_metric))
 SYMBOLOGY_DIR_NAME = "Symbology_Layers"
@@ -191,9 +331,11 @@ ADJACENCY_LIST_NAME = "Adj"
 AUXILIARY_DIR_NAME = "Auxiliary_Files"
 OD_COST_MATRIX_LAYER_NAME = layer_name("OD_Cost_Matrix")
 OD_COST_MATRIX_LINES = "Lines"
-TEMP_ADJACENCY_DBF_NAME = lambda adj_dbf_name: "Temp_%s" % adj_dbf_name
+TEMP_ADJACENCY_LIST_NAME = lambda adj_file_name: "Temp_%s" % adj_file_name
 POLYGONS_SHAPEFILE_NAME = "Polygons.shp"
 PARTIAL_ADJACENCY_LIST_NAME = "Partial_Adjacency_List.dbf"
+PARTIAL_CELL_TABLE_NAME = lambda cell: "Partial_Adjacency_List_%d.adj" % cell
+WORKER_WORKSPACE_NAME = lambda worker: "Worker_%d" % worker
 POLYGONS_LAYER_NAME = layer_name("Polygons")
 RASTER_NAME = "Raster"
 INPUT_POINTS_LAYER_NAME = layer_name("Input_Points")
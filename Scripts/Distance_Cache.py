@@ -0,0 +1,280 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Script for caching the shortest path distances within the search radius.
+Reach, gravity, closeness and straightness only depend on the (s, t, d_st)
+    triples within the radius, the node weights and the node locations. The
+    triples are written to disk once, as a sparse matrix with one row per
+    origin (CSR), and the metrics are then evaluated from the memory-mapped
+    matrix with array reductions, for any node weights, beta, or radius up to
+    the radius of the cache.
+"""
+
+from Centrality_Kernels import REACH_COUNT
+from Centrality_Kernels import WEIGHTED_REACH
+from Constants import CLOSENESS
+from Constants import GRAVITY
+from Constants import REACH
+from Constants import STRAIGHTNESS
+from hashlib import sha1
+from json import dump
+from json import load
+from numpy import arange
+from numpy import array
+from numpy import asarray
+from numpy import ascontiguousarray
+from numpy import bincount
+from numpy import diff
+from numpy import exp
+from numpy import float64
+from numpy import int32
+from numpy import int64
+from numpy import memmap
+from numpy import repeat
+from numpy import sqrt
+from numpy import zeros
+from os import makedirs
+from os import remove
+from os import rename
+from os.path import exists
+from os.path import getsize
+from os.path import join
+
+# Files of a distance cache
+META_FILE = "distances.json"
+ORIGINS_FILE = "origins.bin"
+INDPTR_FILE = "indptr.bin"
+INDICES_FILE = "indices.bin"
+DISTANCES_FILE = "distances.bin"
+# Suffix of the files while they are written
+PARTIAL_SUFFIX = ".part"
+
+# Number of entries kept in memory before they are written to disk
+FLUSH_ENTRIES = 1 << 20
+# Number of entries evaluated at once
+CHUNK_ENTRIES = 1 << 22
+
+def graph_key(graph, network_radius=True):
+  """
+  Returns a key that identifies the nodes and edges of |graph|, a cache
+      computed for another adjacency list has a different key
+  |network_radius|: as in |compute_centrality|, with a birds-eye radius the
+      nodes within the radius depend on the node locations, which are then
+      part of the key
+  """
+  digest = sha1()
+  digest.update(repr(graph.ids).encode("utf-8"))
+  for a in (graph.indptr, graph.indices, graph.weights):
+    digest.update(a.view("uint8"))
+  digest.update(b"network" if network_radius else b"euclidean")
+  if not network_radius and graph.locations is not None:
+    digest.update(ascontiguousarray(graph.locations).view("uint8"))
+  return digest.hexdigest()
+
+class Distance_Matrix_Writer:
+  """
+  Writes the rows of a distance matrix to disk as they are computed
+  """
+
+  def __init__(self, directory, key, N, radius, network_radius):
+    """
+    |directory|: directory of the cache, files of an older cache are replaced
+    |key|: key of the graph the distances are computed on, see |graph_key|
+    |N|: number of nodes in the graph
+    |radius|, |network_radius|: as in |compute_centrality|
+    """
+    if not exists(directory):
+      makedirs(directory)
+    self.directory = directory
+    self.meta = {"key": key, "nodes": N, "radius": radius,
+        "network_radius": network_radius}
+    # An incomplete cache must never be loaded
+    if exists(join(directory, META_FILE)):
+      remove(join(directory, META_FILE))
+    self.indices_file = open(self.path(INDICES_FILE, True), "wb")
+    self.distances_file = open(self.path(DISTANCES_FILE, True), "wb")
+    self.origins = []
+    self.counts = []
+    self.indices = []
+    self.distances = []
+
+  def path(self, name, partial=False):
+    """
+    Returns the path of the cache file |name|
+    """
+    return join(self.directory, name + (PARTIAL_SUFFIX if partial else ""))
+
+  def add_row(self, s, nodes, distances):
+    """
+    Records the row of origin |s|: the |nodes| within the radius of |s| and
+        their shortest path |distances| from |s|
+    """
+    self.origins.append(s)
+    self.counts.append(len(nodes))
+    self.indices.extend(nodes)
+    self.distances.extend(distances)
+    if len(self.indices) >= FLUSH_ENTRIES:
+      self.flush()
+
+  def flush(self):
+    """
+    Writes the entries kept in memory to disk
+    """
+    asarray(self.indices, dtype=int32).tofile(self.indices_file)
+    asarray(self.distances, dtype=float64).tofile(self.distances_file)
+    self.indices = []
+    self.distances = []
+
+  def close(self):
+    """
+    Completes the cache and returns it as a |Distance_Matrix|
+    """
+    self.flush()
+    self.indices_file.close()
+    self.distances_file.close()
+    indptr = zeros(len(self.counts) + 1, dtype=int64)
+    indptr[1:] = asarray(self.counts, dtype=int64).cumsum()
+    asarray(self.origins, dtype=int32).tofile(self.path(ORIGINS_FILE, True))
+    indptr.tofile(self.path(INDPTR_FILE, True))
+    for name in (ORIGINS_FILE, INDPTR_FILE, INDICES_FILE, DISTANCES_FILE):
+      if exists(self.path(name)):
+        remove(self.path(name))
+      rename(self.path(name, True), self.path(name))
+    # The cache is only valid once its description is written
+    meta_file = open(self.path(META_FILE), "w")
+    dump(self.meta, meta_file)
+    meta_file.close()
+    return load_distance_matrix(self.directory, self.meta["key"],
+        self.meta["radius"], self.meta["network_radius"])
+
+def _map(path, dtype):
+  """
+  Returns the array stored in the file at |path|, mapped into memory
+  """
+  if getsize(path) == 0:
+    return zeros(0, dtype=dtype)
+  return memmap(path, dtype=dtype, mode="r")
+
+def load_distance_matrix(directory, key, radius, network_radius):
+  """
+  Returns the |Distance_Matrix| cached in |directory|, or None if there is no
+      complete cache there that was computed on the graph with key |key|, with
+      the same kind of radius and a radius of at least |radius|
+  """
+  if directory is None or not exists(join(directory, META_FILE)):
+    return None
+  try:
+    meta_file = open(join(directory, META_FILE))
+    meta = load(meta_file)
+    meta_file.close()
+  except:
+    return None
+  if (meta["key"] != key or meta["network_radius"] != network_radius or
+      meta["radius"] < radius):
+    return None
+  return Distance_Matrix(_map(join(directory, ORIGINS_FILE), int32),
+      _map(join(directory, INDPTR_FILE), int64),
+      _map(join(directory, INDICES_FILE), int32),
+      _map(join(directory, DISTANCES_FILE), float64), meta["radius"],
+      network_radius)
+
+class Distance_Matrix:
+  """
+  Shortest path distances from a set of origins to the nodes within the radius
+      of each origin, in compressed sparse row form: the nodes within the radius
+      of |origins|[i] are |indices|[|indptr|[i]:|indptr|[i + 1]], at distances
+      |distances|[|indptr|[i]:|indptr|[i + 1]]
+  Each row includes the origin itself, at distance 0
+  """
+
+  def __init__(self, origins, indptr, indices, distances, radius,
+      network_radius):
+    """
+    |radius|, |network_radius|: as in |compute_centrality|, the radius the
+        distances were computed for
+    """
+    self.origins = origins
+    self.indptr = indptr
+    self.indices = indices
+    self.distances = distances
+    self.radius = radius
+    self.network_radius = network_radius
+    # Row of each origin
+    self.rows = dict((s, i) for (i, s) in enumerate(origins.tolist()))
+
+  def covers(self, origins):
+    """
+    Returns True if the matrix has a row for each of the |origins|
+    """
+    return all(s in self.rows for s in origins)
+
+  def evaluate(self, origins, node_weights, locations, compute_r, compute_g,
+      compute_c, compute_s, radius, beta):
+    """
+    Returns a dictionary mapping the name of each computed metric to a list of
+        values for the |origins|, in order, as returned by |compute_origins|
+    |node_weights|: array of node weights
+    |locations|: N by 2 array of node locations, or None
+    |radius|: radius to evaluate the metrics for, at most the radius of the
+        matrix
+    All other parameters are as in |compute_centrality|
+    """
+    R = len(self.origins)
+    node_weights = asarray(node_weights, dtype=float64)
+    compute_s = compute_s and locations is not None
+    sums = dict((key, zeros(R)) for key in (REACH_COUNT, WEIGHTED_REACH,
+        GRAVITY, CLOSENESS, STRAIGHTNESS))
+    origins_array = asarray(self.origins)
+    counts = diff(asarray(self.indptr))
+    # Evaluate rows in chunks of about |CHUNK_ENTRIES| entries
+    start = 0
+    while start < R:
+      end = min(R, max(start + 1, int(asarray(self.indptr).searchsorted(
+          self.indptr[start] + CHUNK_ENTRIES, side="right")) - 1))
+      first, last = int(self.indptr[start]), int(self.indptr[end])
+      rows = repeat(arange(start, end), counts[start:end])
+      t = asarray(self.indices[first:last])
+      d = asarray(self.distances[first:last])
+      if compute_s or not self.network_radius:
+        s_locations = locations[origins_array[rows]]
+        straight = sqrt(((locations[t] - s_locations)**2).sum(axis=1))
+      within = (d if self.network_radius else straight) <= radius
+      weights = node_weights[t] * within
+      positive = within & (d > 0)
+      d_positive = d.copy()
+      d_positive[~positive] = 1.0
+      chunk_sums = [(REACH_COUNT, within * 1.0), (WEIGHTED_REACH, weights)]
+      if compute_g:
+        chunk_sums.append((GRAVITY, positive * weights * exp(-d * beta)))
+      if compute_c:
+        chunk_sums.append((CLOSENESS, weights * d))
+      if compute_s:
+        chunk_sums.append((STRAIGHTNESS, positive * weights * straight /
+            d_positive))
+      for (key, terms) in chunk_sums:
+        sums[key][start:end] += bincount(rows - start, weights=terms,
+            minlength=end - start)
+      start = end
+
+    rows = array([self.rows[s] for s in origins], dtype=int)
+    origins = asarray(origins, dtype=int)
+    weighted_reach = sums[WEIGHTED_REACH][rows] - node_weights[origins]
+    values = {REACH_COUNT: (sums[REACH_COUNT][rows] - 1).astype(int).tolist(),
+        WEIGHTED_REACH: weighted_reach.tolist()}
+    if compute_r:
+      values[REACH] = weighted_reach.tolist()
+    if compute_g:
+      values[GRAVITY] = sums[GRAVITY][rows].tolist()
+    if compute_c:
+      values[CLOSENESS] = [1.0 / d_sum if d_sum > 0 else 0.0 for d_sum in
+          sums[CLOSENESS][rows].tolist()]
+    if compute_s:
+      values[STRAIGHTNESS] = sums[STRAIGHTNESS][rows].tolist()
+    return values
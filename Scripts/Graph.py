@@ -0,0 +1,494 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Script for the array-backed representation of a weighted, undirected graph.
+"""
+
+from Constants import BETWEENNESS
+from Constants import HILBERT_ORDERING
+from Constants import LOCATION
+from Constants import NEIGHBORS
+from Constants import NO_ORDERING
+from Constants import WEIGHT
+from json import dumps
+from json import loads
+from numpy import arange
+from numpy import array
+from numpy import asarray
+from numpy import bincount
+from numpy import cumsum
+from numpy import diff
+from numpy import float64
+from numpy import int32
+from numpy import int64
+from numpy import lexsort
+from numpy import load
+from numpy import minimum
+from numpy import ones
+from numpy import repeat
+from numpy import savez
+from numpy import zeros
+from Priority_Queue import Priority_Queue
+
+# Number of bits of each coordinate of the grid that |hilbert_order| orders
+HILBERT_BITS = 16
+
+# Names of the arrays in a file written by |save_metrics|
+IDS_COLUMN = "ids"
+METRIC_PREFIX = "metric:"
+REACH_PREFIX = "reach:"
+# Names of the other arrays in a file written by |save_graph|
+KEY_COLUMN = "key"
+FIELDS_COLUMN = "accumulator_fields"
+LOCATIONS_COLUMN = "locations"
+GRAPH_COLUMNS = ("indptr", "indices", "weights", "accumulations",
+    "node_weights")
+
+class Graph:
+  """
+  Compact representation of a weighted, undirected graph
+  Nodes are identified by dense integer indices 0, 1, ..., N - 1 and |ids| maps
+      each index back to the id of the node
+  Edges are stored in compressed sparse row (CSR) form: the neighbors of node
+      |i| are |indices|[|indptr|[i]:|indptr|[i + 1]] and the weights of the
+      edges connecting them to |i| are |weights|[|indptr|[i]:|indptr|[i + 1]]
+  Node attributes and computed metrics are stored in arrays indexed by node
+  """
+
+  def __init__(self, ids, indptr, indices, weights, accumulations=None,
+      accumulator_fields=()):
+    """
+    |ids|: node ids, in order of node index
+    |indptr|, |indices|, |weights|: CSR representation of the edges
+    |accumulations|: array with one row per entry in |indices| and one column
+        per accumulator field, weight of the edge based on other metrics
+    |accumulator_fields|: names of the columns of |accumulations|
+    """
+    N = len(ids)
+    # Node index to node id, and node id to node index
+    self.ids = list(ids)
+    self.index = dict((id, i) for (i, id) in enumerate(self.ids))
+    # Edges
+    self.indptr = array(indptr, dtype=int32)
+    self.indices = array(indices, dtype=int32)
+    self.weights = array(weights, dtype=float64)
+    self.accumulator_fields = tuple(accumulator_fields)
+    if accumulations is None:
+      accumulations = zeros((len(self.indices), len(self.accumulator_fields)))
+    self.accumulations = array(accumulations, dtype=float64).reshape(
+        (len(self.indices), len(self.accumulator_fields)))
+    # Weight of each node
+    self.node_weights = ones(N)
+    # (x, y) location of each node, None if locations are not known
+    self.locations = None
+    # Maps metric names to arrays of metric values, indexed by node
+    self.metrics = {}
+    # Maps the reach keys of |compute_origins| to arrays of the unweighted and
+    #     weighted reach of each origin, indexed by node (normalization)
+    self.reach_values = {}
+
+  def __len__(self):
+    """
+    Returns the number of nodes in the graph
+    """
+    return len(self.ids)
+
+  def edge_count(self):
+    """
+    Returns the number of directed edges in the graph
+    """
+    return len(self.indices)
+
+  def set_weight(self, id, weight):
+    """
+    Sets the weight of the node with id |id|
+    """
+    self.node_weights[self.index[id]] = weight
+
+  def set_location(self, id, location):
+    """
+    Sets the (x, y) location of the node with id |id|
+    """
+    if self.locations is None:
+      self.locations = zeros((len(self), 2))
+    self.locations[self.index[id]] = location
+
+  def subgraph(self, nodes):
+    """
+    Returns the |Graph| made of the nodes with indices |nodes| and the edges
+        between them, the nodes are indexed in the order of |nodes|
+    Node weights and locations are copied, metrics are not
+    """
+    nodes = asarray(nodes, dtype=int32)
+    n = len(nodes)
+    local = zeros(len(self), dtype=int32) - 1
+    local[nodes] = arange(n, dtype=int32)
+    starts = self.indptr[nodes]
+    counts = self.indptr[nodes + 1] - starts
+    positions = repeat(starts, counts) + (arange(counts.sum()) -
+        repeat(cumsum(counts) - counts, counts))
+    indices = local[self.indices[positions]]
+    # Drop the edges to nodes outside of |nodes|
+    keep = indices >= 0
+    indptr = zeros(n + 1, dtype=int32)
+    indptr[1:] = cumsum(bincount(repeat(arange(n), counts)[keep],
+        minlength=n))
+    graph = Graph([self.ids[i] for i in nodes.tolist()], indptr,
+        indices[keep], self.weights[positions][keep],
+        self.accumulations[positions][keep], self.accumulator_fields)
+    graph.node_weights = self.node_weights[nodes]
+    if self.locations is not None:
+      graph.locations = self.locations[nodes]
+    return graph
+
+  def metric(self, name):
+    """
+    Returns the array of values for the metric |name|, creating it (filled with
+        zeros) if necessary
+    """
+    if name not in self.metrics:
+      self.metrics[name] = zeros(len(self))
+    return self.metrics[name]
+
+  def reach(self, key):
+    """
+    Returns the array of reach values for the reach key |key|, creating it
+        (filled with zeros) if necessary
+    """
+    if key not in self.reach_values:
+      self.reach_values[key] = zeros(len(self))
+    return self.reach_values[key]
+
+def hilbert_order(locations):
+  """
+  Returns the array of node indices sorted by the position of their |locations|
+      (an N by 2 array) along a Hilbert curve over their bounding box, nodes
+      that are close on the curve are close in space
+  """
+  xy = asarray(locations, dtype=float64)
+  N = len(xy)
+  if N == 0:
+    return zeros(0, dtype=int32)
+  # Locations on a |side| by |side| grid
+  side = 1 << HILBERT_BITS
+  low = xy.min(axis=0)
+  span = xy.max(axis=0) - low
+  span[span == 0] = 1.0
+  cells = minimum(((xy - low) / span * side).astype(int64), side - 1)
+  x = cells[:, 0].copy()
+  y = cells[:, 1].copy()
+  # Distance along the curve, built one level at a time from the top
+  position = zeros(N, dtype=int64)
+  s = side >> 1
+  while s > 0:
+    rx = (x & s) > 0
+    ry = (y & s) > 0
+    position += s * s * ((3 * rx) ^ ry)
+    # Rotate the quadrant so that the curve inside it has the right
+    #     orientation
+    flip = ~ry & rx
+    x[flip] = side - 1 - x[flip]
+    y[flip] = side - 1 - y[flip]
+    swap = ~ry
+    x[swap], y[swap] = y[swap], x[swap]
+    s >>= 1
+  return position.argsort(kind="mergesort").astype(int32)
+
+def rcm_order(graph):
+  """
+  Returns the array of node indices of |graph| in reverse Cuthill-McKee order:
+      breadth first from a node of lowest degree in each connected component,
+      neighbors in order of degree, then reversed; neighboring nodes get close
+      indices
+  """
+  N = len(graph)
+  indptr = graph.indptr.tolist()
+  indices = graph.indices.tolist()
+  degrees = diff(graph.indptr).tolist()
+  visited = [False] * N
+  order = []
+  for start in sorted(xrange(N), key=lambda v: (degrees[v], v)):
+    if visited[start]:
+      continue
+    visited[start] = True
+    first = len(order)
+    order.append(start)
+    while first < len(order):
+      v = order[first]
+      first += 1
+      neighbors = [w for w in set(indices[indptr[v]:indptr[v + 1]]) if not
+          visited[w]]
+      neighbors.sort(key=lambda w: (degrees[w], w))
+      for w in neighbors:
+        visited[w] = True
+      order.extend(neighbors)
+  order.reverse()
+  return array(order, dtype=int32)
+
+def renumbered(graph, ordering):
+  """
+  Returns a copy of |graph| with its nodes indexed in the order given by
+      |ordering|, one of |NODE_ORDERINGS|, or |graph| itself for
+      |NO_ORDERING|
+  Hilbert ordering falls back to reverse Cuthill-McKee ordering if node
+      locations are not known. Ids, node weights and locations stay with their
+      nodes, so results are mapped back to the original ids exactly.
+      Accumulations follow the shortest path found first when several are as
+      short, and which one that is can depend on the numbering.
+  """
+  if ordering == NO_ORDERING or len(graph) == 0:
+    return graph
+  if ordering == HILBERT_ORDERING and graph.locations is not None:
+    return graph.subgraph(hilbert_order(graph.locations))
+  return graph.subgraph(rcm_order(graph))
+
+def _metric_columns(graph):
+  """
+  Returns the dictionary of the arrays that |save_metrics| writes for |graph|
+  """
+  columns = {IDS_COLUMN: array(dumps(graph.ids))}
+  for (name, values) in graph.metrics.items():
+    columns[METRIC_PREFIX + name] = values
+  for (key, values) in graph.reach_values.items():
+    columns[REACH_PREFIX + key] = values
+  return columns
+
+def _save_columns(path, columns):
+  """
+  Writes the arrays of |columns| to the NumPy archive at |path|
+  """
+  # A file object keeps |savez| from changing the name of the file
+  archive = open(path, "wb")
+  try:
+    savez(archive, **columns)
+  finally:
+    archive.close()
+
+def save_metrics(graph, path):
+  """
+  Writes the node ids, metrics and reach values of |graph| to the NumPy archive
+      at |path|, one array per column
+  """
+  _save_columns(path, _metric_columns(graph))
+
+def load_metrics(graph, path):
+  """
+  Reads the metrics and reach values written by |save_metrics| into |graph|
+  Returns True if they were read, or False if they were written for a graph
+      with other nodes
+  """
+  archive = load(path)
+  try:
+    if loads(str(archive[IDS_COLUMN])) != loads(dumps(graph.ids)):
+      return False
+    for name in archive.files:
+      if name.startswith(METRIC_PREFIX):
+        graph.metrics[name[len(METRIC_PREFIX):]] = archive[name]
+      elif name.startswith(REACH_PREFIX):
+        graph.reach_values[name[len(REACH_PREFIX):]] = archive[name]
+    return True
+  finally:
+    archive.close()
+
+def save_graph(graph, path, key):
+  """
+  Writes |graph|, with its nodes, edges, node weights and locations, metrics
+      and reach values, to the NumPy archive at |path|, along with the text
+      |key| that tells what the metrics were computed for
+  """
+  columns = _metric_columns(graph)
+  for name in GRAPH_COLUMNS:
+    columns[name] = getattr(graph, name)
+  columns[FIELDS_COLUMN] = array(dumps(graph.accumulator_fields))
+  columns[KEY_COLUMN] = array(key)
+  if graph.locations is not None:
+    columns[LOCATIONS_COLUMN] = graph.locations
+  _save_columns(path, columns)
+
+def load_graph(path):
+  """
+  Reads the graph written by |save_graph| at |path|
+  Returns (graph, key), the |Graph| with its metrics and reach values, and the
+      key it was written with
+  """
+  archive = load(path)
+  try:
+    # Ids that were tuples are read back as lists
+    ids = [tuple(id) if isinstance(id, list) else id for id in
+        loads(str(archive[IDS_COLUMN]))]
+    graph = Graph(ids, archive["indptr"], archive["indices"],
+        archive["weights"], archive["accumulations"],
+        loads(str(archive[FIELDS_COLUMN])))
+    graph.node_weights = archive["node_weights"]
+    if LOCATIONS_COLUMN in archive.files:
+      graph.locations = archive[LOCATIONS_COLUMN]
+    key = str(archive[KEY_COLUMN])
+  finally:
+    archive.close()
+  load_metrics(graph, path)
+  return graph, key
+
+def connected_components(graph):
+  """
+  Returns an array with the label of the connected component of each node of
+      |graph|, components are labeled 0, 1, ... in order of their first node
+  Edges are taken in both directions
+  """
+  N = len(graph)
+  # Union-find over the edges
+  parent = range(N)
+  def find(v):
+    while parent[v] != v:
+      parent[v] = parent[parent[v]]
+      v = parent[v]
+    return v
+  sources = repeat(arange(N), diff(graph.indptr)).tolist()
+  for (u, v) in zip(sources, graph.indices.tolist()):
+    root_u, root_v = find(u), find(v)
+    if root_u != root_v:
+      parent[max(root_u, root_v)] = min(root_u, root_v)
+  roots = [find(v) for v in xrange(N)]
+  # Relabel the roots 0, 1, ...
+  labels = {}
+  return array([labels.setdefault(root, len(labels)) for root in roots],
+      dtype=int32)
+
+def nodes_within(graph, sources, radius):
+  """
+  Returns the set of the indices of the nodes of |graph| within network
+      distance |radius| of any of the |sources|
+  """
+  indptr = graph.indptr.tolist()
+  indices = graph.indices.tolist()
+  weights = graph.weights.tolist()
+  d = dict((s, 0.0) for s in sources)
+  Q = Priority_Queue([(0.0, s) for s in d])
+  within = set()
+  while Q:
+    d_v, v = Q.pop()
+    within.add(v)
+    for e in xrange(indptr[v], indptr[v + 1]):
+      w = indices[e]
+      d_w = d_v + weights[e]
+      if d_w <= radius and (w not in d or d_w < d[w]):
+        d[w] = d_w
+        if w in Q:
+          Q.decrease_key((d_w, w))
+        else:
+          Q.push((d_w, w))
+  return within
+
+class Graph_Builder:
+  """
+  Collects the edges of a graph one at a time and then builds a |Graph|
+  """
+
+  def __init__(self, accumulator_fields=()):
+    """
+    |accumulator_fields|: names of the accumulator weights recorded per edge
+    """
+    self.accumulator_fields = tuple(accumulator_fields)
+    self.ids = set()
+    # Set of (origin_id, destination_id, edge_weight, accumulation_weights),
+    #     repeated edges are only recorded once
+    self.edges = set()
+
+  def add_node(self, id):
+    """
+    Makes sure the node with id |id| is recorded in the graph
+    """
+    self.ids.add(id)
+
+  def add_edge(self, origin_id, destination_id, edge_weight=1.0,
+      accumulation_weights={}):
+    """
+    Adds an undirected edge between |origin_id| and |destination_id|
+    |edge_weight|: weight of the edge connecting the two nodes
+    |accumulation_weights|: weight of the edge based on other metrics
+    """
+    self.ids.add(origin_id)
+    self.ids.add(destination_id)
+    accumulations = tuple(accumulation_weights.get(field, 0.0) for field in
+        self.accumulator_fields)
+    self.edges.add((origin_id, destination_id, edge_weight, accumulations))
+    self.edges.add((destination_id, origin_id, edge_weight, accumulations))
+
+  def add_directed_edge(self, origin_id, destination_id, edge_weight=1.0,
+      accumulations=()):
+    """
+    Adds an edge from |origin_id| to |destination_id| only
+    |accumulations|: accumulation weights in order of |accumulator_fields|
+    """
+    self.ids.add(origin_id)
+    self.ids.add(destination_id)
+    self.edges.add((origin_id, destination_id, edge_weight,
+        tuple(accumulations)))
+
+  def build(self):
+    """
+    Returns the |Graph| with the nodes and edges recorded so far
+    Nodes are indexed in sorted order of their ids
+    """
+    ids = sorted(self.ids)
+    index = dict((id, i) for (i, id) in enumerate(ids))
+    E = len(self.edges)
+    K = len(self.accumulator_fields)
+    sources = zeros(E, dtype=int32)
+    indices = zeros(E, dtype=int32)
+    weights = zeros(E)
+    accumulations = zeros((E, K))
+    for (e, (u, v, weight, accumulations_uv)) in enumerate(self.edges):
+      sources[e] = index[u]
+      indices[e] = index[v]
+      weights[e] = weight
+      if K:
+        accumulations[e] = accumulations_uv
+    # Group edges by source, keeping neighbors in a deterministic order
+    order = lexsort((indices, sources))
+    indptr = zeros(len(ids) + 1, dtype=int32)
+    indptr[1:] = cumsum(bincount(sources, minlength=len(ids)))
+    return Graph(ids, indptr, indices[order], weights[order],
+        accumulations[order], self.accumulator_fields)
+
+def graph_from_nodes(nodes, accumulator_fields=()):
+  """
+  Returns the |Graph| equivalent to |nodes|
+  |nodes|: dictionary mapping node id's to |Node| objects
+  |accumulator_fields|: names of the accumulator weights recorded per edge
+  """
+  builder = Graph_Builder(accumulator_fields)
+  for id in nodes:
+    builder.add_node(id)
+    for (neighbor_id, edge_weight, accumulation_items) in getattr(nodes[id],
+        NEIGHBORS):
+      accumulation_weights = dict(accumulation_items)
+      builder.add_directed_edge(id, neighbor_id, edge_weight,
+          [accumulation_weights.get(field, 0.0) for field in
+          builder.accumulator_fields])
+  graph = builder.build()
+  for id in nodes:
+    graph.set_weight(id, getattr(nodes[id], WEIGHT))
+  if nodes and hasattr(nodes.values()[0], LOCATION):
+    for id in nodes:
+      if hasattr(nodes[id], LOCATION):
+        graph.set_location(id, getattr(nodes[id], LOCATION))
+  return graph
+
+def metrics_to_nodes(graph, nodes, origins, all_node_metrics=(BETWEENNESS,)):
+  """
+  Records the metrics computed on |graph| as attributes of the |Node| objects
+      in |nodes|
+  The metrics in |all_node_metrics| (betweenness) are recorded for all nodes,
+      all other metrics are recorded only for the nodes in |origins|
+  """
+  for (name, values) in graph.metrics.items():
+    for id in (graph.ids if name in all_node_metrics else origins):
+      if id in nodes and id in graph.index:
+        setattr(nodes[id], name, float(values[graph.index[id]]))
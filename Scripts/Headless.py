@@ -0,0 +1,82 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Console stand-in for the parts of arcpy that the centrality computation uses,
+    so that the computation can run headless where arcpy is not installed
+    (e.g. benchmarks on Linux).
+Messages are printed to standard error and progressors are not shown. The
+    geoprocessing tools that the other steps of the tool use are not available
+    and raise |Headless_Exception| when called.
+"""
+
+from sys import modules
+from sys import stderr
+from types import ModuleType
+
+# Functions of arcpy that print a message
+MESSAGE_FUNCTIONS = ("AddError", "AddMessage", "AddWarning")
+# Functions of arcpy that update a progressor
+PROGRESSOR_FUNCTIONS = ("ResetProgressor", "SetProgressor",
+    "SetProgressorLabel", "SetProgressorPosition")
+# Geoprocessing functions of arcpy imported by the scripts of the computation
+TOOL_FUNCTIONS = ("CalculateLocations_na", "Delete_management", "Describe",
+    "Exists", "FeatureToPoint_management", "UpdateCursor")
+
+class Headless_Exception(Exception):
+  """
+  Exception thrown when a geoprocessing tool is called without arcpy
+  """
+
+  def __init__(self, tool_name):
+    """
+    |tool_name|: the name of the tool that was called
+    """
+    Exception.__init__(self, "%s needs arcpy" % tool_name)
+
+def _message(kind, quiet):
+  """
+  Returns a stand-in for the arcpy function that prints messages of |kind|
+  """
+  def add_message(message):
+    if not quiet:
+      stderr.write("%s: %s\n" % (kind, message))
+  return add_message
+
+def _tool(tool_name):
+  """
+  Returns a stand-in for the geoprocessing tool |tool_name|
+  """
+  def tool(*args, **kwargs):
+    raise Headless_Exception(tool_name)
+  return tool
+
+def install(quiet=False):
+  """
+  Makes "import arcpy" give the console stand-in if arcpy is not installed, this
+      has to be called before the scripts of the computation are imported
+  |quiet|: drop messages instead of printing them?
+  Returns True if the stand-in is used, False if arcpy is installed
+  """
+  try:
+    import arcpy
+    return getattr(arcpy, "headless", False)
+  except ImportError:
+    pass
+  arcpy = ModuleType("arcpy")
+  arcpy.__doc__ = __doc__
+  arcpy.headless = True
+  for name in MESSAGE_FUNCTIONS:
+    setattr(arcpy, name, _message(name[len("Add"):].lower(), quiet))
+  for name in PROGRESSOR_FUNCTIONS:
+    setattr(arcpy, name, lambda *args: None)
+  for name in TOOL_FUNCTIONS:
+    setattr(arcpy, name, _tool(name))
+  modules["arcpy"] = arcpy
+  return True
@@ -0,0 +1,241 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Script for updating centrality results after small changes to the graph.
+Changes of node weights are applied as changes of the terms of the changed
+    nodes in the metrics of the origins around them. Only the origins whose
+    shortest path trees within the radius could use a changed edge are
+    recomputed.
+The tool keeps the graph and results of a run in a previous results file, see
+    |update_previous_results|, and the next run on the edited network starts
+    from them.
+"""
+
+from arcpy import AddMessage
+from arcpy import AddWarning
+from Centrality_Computation import compute_centrality
+from Centrality_Computation import normalize_metrics
+from Centrality_Kernels import compute_weight_changes
+from Centrality_Kernels import graph_arrays
+from Centrality_Kernels import kernel_for
+from Centrality_Kernels import REACH_COUNT
+from Centrality_Kernels import sweep_columns
+from Centrality_Kernels import WEIGHTED_REACH
+from Constants import BETWEENNESS
+from Constants import CLOSENESS
+from Constants import GRAVITY
+from Constants import INCREMENTAL_CENTRALITY
+from Constants import REACH
+from Constants import STEP_4
+from Constants import STRAIGHTNESS
+from Constants import TOLERANCE
+from Constants import WARNING_PREVIOUS_RESULTS_NOT_USED
+from Graph import load_graph
+from Graph import nodes_within
+from Graph import save_graph
+from hashlib import sha1
+from numpy import arange
+from numpy import array_equal
+from numpy import asarray
+from numpy import cumsum
+from numpy import diff
+from numpy import flatnonzero
+from numpy import repeat
+from numpy import zeros
+from os.path import isfile
+from Utils import Progress_Bar
+
+def graph_changes(graph, new_graph):
+  """
+  Returns (weight_changes, edge_nodes), the list of (node index, weight change)
+      for each node whose weight differs between |graph| and |new_graph|, and
+      the list of the indices of the nodes whose edges differ
+  Returns None if the graphs do not have the same nodes, accumulator fields and
+      node locations
+  """
+  if (graph.ids != new_graph.ids or graph.accumulator_fields !=
+      new_graph.accumulator_fields or (graph.locations is None) !=
+      (new_graph.locations is None) or (graph.locations is not None and
+      not array_equal(graph.locations, new_graph.locations))):
+    return None
+  weight_changes = new_graph.node_weights - graph.node_weights
+  changed_weights = flatnonzero(weight_changes != 0)
+  # Nodes with a different number of edges
+  degrees = diff(graph.indptr)
+  new_degrees = diff(new_graph.indptr)
+  changed_edges = degrees != new_degrees
+  # Nodes with the same number of edges, compared edge by edge
+  same = flatnonzero(~changed_edges)
+  counts = degrees[same]
+  offsets = arange(counts.sum()) - repeat(cumsum(counts) - counts, counts)
+  positions = repeat(graph.indptr[same], counts) + offsets
+  new_positions = repeat(new_graph.indptr[same], counts) + offsets
+  differs = ((graph.indices[positions] != new_graph.indices[new_positions]) |
+      (graph.weights[positions] != new_graph.weights[new_positions]) |
+      (graph.accumulations[positions] !=
+      new_graph.accumulations[new_positions]).any(axis=1))
+  changed_edges[repeat(same, counts)[differs]] = True
+  return (zip(changed_weights.tolist(),
+      weight_changes[changed_weights].tolist()),
+      flatnonzero(changed_edges).tolist())
+
+def update_centrality(graph, new_graph, origins, compute_r, compute_g,
+    compute_b, compute_c, compute_s, radius, network_radius, beta,
+    measures_to_normalize, accumulator_fields):
+  """
+  Computes the same metrics as |compute_centrality| on |new_graph|, starting
+      from the results of a previous run of |compute_centrality| with the same
+      parameters on |graph|, and returns the number of origins whose shortest
+      path trees were recomputed
+  |graph|: the |Graph| of the previous run, with its results, or None
+  |new_graph|: a |Graph| with the same nodes as |graph|, in which some node
+      weights and some edges may be different
+  All other parameters are as in |compute_centrality|
+  An origin is only recomputed if it is within the radius of a node whose edges
+      changed, in |graph| or in |new_graph|. For the other origins, the terms
+      of the nodes whose weights changed are updated, which needs one shortest
+      path tree per changed node.
+  The results are the same as those of a full run on |new_graph|; with several
+      radii or betas, a birds-eye radius, or no previous results, a full run is
+      done
+  """
+  origin_indices = [new_graph.index[id] for id in origins if id in
+      new_graph.index]
+  changes = None if graph is None else graph_changes(graph, new_graph)
+  if (changes is None or not network_radius or isinstance(radius, (list,
+      tuple)) or isinstance(beta, (list, tuple)) or REACH_COUNT not in
+      graph.reach_values):
+    compute_centrality(new_graph, origins, compute_r, compute_g, compute_b,
+        compute_c, compute_s, radius, network_radius, beta,
+        measures_to_normalize, accumulator_fields)
+    AddMessage(INCREMENTAL_CENTRALITY(len(origin_indices),
+        len(origin_indices)))
+    return len(origin_indices)
+  weight_changes, edge_nodes = changes
+
+  # Preprocessing
+  N = len(new_graph)
+  accumulator_fields = [field for field in new_graph.accumulator_fields if
+      field in accumulator_fields]
+  compute_s = compute_s and new_graph.locations is not None
+  arguments = (compute_r, compute_g, compute_b, compute_c, compute_s, radius,
+      network_radius, beta, accumulator_fields)
+  columns = sweep_columns([radius], [beta], compute_r, compute_g, compute_b,
+      compute_c, compute_s, accumulator_fields)
+  # Origins whose shortest path trees may use a changed edge, distances are
+  #     padded so that rounding never leaves out an origin
+  affected = (nodes_within(graph, edge_nodes, radius + TOLERANCE) |
+      nodes_within(new_graph, edge_nodes, radius + TOLERANCE))
+  recomputed = [s for s in origin_indices if s in affected]
+  kept = [s for s in origin_indices if s not in affected]
+
+  # Start from the previous results
+  new_graph.metrics = dict((name, values.copy()) for (name, values) in
+      graph.metrics.items())
+  new_graph.reach_values = dict((key, values.copy()) for (key, values) in
+      graph.reach_values.items())
+  new_sequences = tuple(None if a is None else a.tolist() for a in
+      graph_arrays(new_graph, accumulator_fields))
+  progress = Progress_Bar(2 * len(recomputed) + len(weight_changes), 1,
+      STEP_4)
+
+  if recomputed:
+    # Take out the betweenness contributions of the recomputed origins in
+    #     |graph|, and add their contributions in |new_graph|
+    sequences = tuple(None if a is None else a.tolist() for a in
+        graph_arrays(graph, accumulator_fields))
+    old_betweenness = [0.0] * N
+    kernel_for(arguments, sequences)(sequences, recomputed, *(arguments +
+        (old_betweenness, progress.step)))
+    betweenness = [0.0] * N
+    values = kernel_for(arguments, new_sequences)(new_sequences, recomputed,
+        *(arguments + (betweenness, progress.step)))
+    for (reach_key, weighted_reach_key, metrics, accumulators) in columns:
+      for (metric, column, norm_column, beta_i) in metrics:
+        if metric == BETWEENNESS:
+          new_graph.metric(column)[:] += (asarray(betweenness) -
+              asarray(old_betweenness))
+        else:
+          new_graph.metric(column)[recomputed] = values[column]
+      for column in accumulators:
+        new_graph.metric(column)[recomputed] = values[column]
+      for key in (reach_key, weighted_reach_key):
+        new_graph.reach(key)[recomputed] = values[key]
+
+  if weight_changes and kept:
+    # Update the terms of the nodes whose weights changed in the metrics of
+    #     the other origins
+    sources = zeros(N)
+    sources[kept] = 1.0
+    deltas = dict((key, zeros(N)) for key in (WEIGHTED_REACH, GRAVITY,
+        CLOSENESS, STRAIGHTNESS))
+    betweenness = [0.0] * N
+    compute_weight_changes(new_sequences, weight_changes, sources.tolist(),
+        compute_g, compute_b, compute_c, compute_s, radius, beta, deltas,
+        betweenness, progress.step)
+    new_graph.reach(WEIGHTED_REACH)[kept] += deltas[WEIGHTED_REACH][kept]
+    if compute_r:
+      new_graph.metric(REACH)[kept] += deltas[WEIGHTED_REACH][kept]
+    if compute_g:
+      new_graph.metric(GRAVITY)[kept] += deltas[GRAVITY][kept]
+    if compute_b:
+      new_graph.metric(BETWEENNESS)[:] += asarray(betweenness)
+    if compute_c:
+      # Closeness is the inverse of the sum of weighted distances
+      closeness = new_graph.metric(CLOSENESS)
+      d_sums = [(1.0 / c if c > 0 else 0.0) + change for (c, change) in zip(
+          closeness[kept].tolist(), deltas[CLOSENESS][kept].tolist())]
+      closeness[kept] = [1.0 / d_sum if d_sum > 0 else 0.0 for d_sum in
+          d_sums]
+    if compute_s:
+      new_graph.metric(STRAIGHTNESS)[kept] += deltas[STRAIGHTNESS][kept]
+
+  # Normalization
+  normalize_metrics(new_graph, origin_indices, len(origins), columns,
+      list(measures_to_normalize))
+  AddMessage(INCREMENTAL_CENTRALITY(len(recomputed), len(origin_indices)))
+  return len(recomputed)
+
+def results_key(origins, *parameters):
+  """
+  Returns a key that identifies the |origins| and the other |parameters| of
+      |compute_centrality| that results were computed with
+  """
+  digest = sha1()
+  digest.update(repr(sorted(origins)).encode("utf-8"))
+  digest.update(repr(parameters).encode("utf-8"))
+  return digest.hexdigest()
+
+def update_previous_results(path, new_graph, origins, compute_r, compute_g,
+    compute_b, compute_c, compute_s, radius, network_radius, beta,
+    measures_to_normalize, accumulator_fields):
+  """
+  Computes the metrics on |new_graph| with |update_centrality|, starting from
+      the graph and results of the previous run kept in the file at |path|,
+      then keeps |new_graph| and its results in that file for the next run
+  The previous results are only used if they were computed from the same
+      origins with the same parameters, otherwise all origins are recomputed
+  All other parameters are as in |compute_centrality|
+  Returns the number of origins whose shortest path trees were recomputed
+  """
+  key = results_key(origins, compute_r, compute_g, compute_b, compute_c,
+      compute_s, radius, network_radius, beta, sorted(measures_to_normalize),
+      sorted(accumulator_fields))
+  graph = None
+  if isfile(path):
+    graph, previous_key = load_graph(path)
+    if previous_key != key:
+      AddWarning(WARNING_PREVIOUS_RESULTS_NOT_USED)
+      graph = None
+  recomputed = update_centrality(graph, new_graph, origins, compute_r,
+      compute_g, compute_b, compute_c, compute_s, radius, network_radius, beta,
+      measures_to_normalize, accumulator_fields)
+  save_graph(new_graph, path, key)
+  return recomputed
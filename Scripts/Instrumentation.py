@@ -0,0 +1,201 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Script for recording the time each step of the tool takes and the work it does.
+Instrumentation is off until |enable| is called. Steps are timed between
+    |start_step| and |finish_step|, and work is tallied in named counters with
+    |count|. While instrumentation is off these calls return at once, and the
+    shortest path kernels run without counting (see |counting_kernel|).
+Worker processes send their counts and their own peak memory to the parent
+    process with |worker_report|, the parent adds them with
+    |add_worker_report|.
+"""
+
+from json import dump
+from os import times
+from time import time
+from Utils import peak_memory
+
+# Counters of Step 1
+OD_SOLVES = "od_solves"
+CELLS_PROCESSED = "cells_processed"
+# Counters of Step 4
+NODES_SETTLED = "nodes_settled"
+EDGES_RELAXED = "edges_relaxed"
+HEAP_PUSHES = "heap_pushes"
+DECREASE_KEYS = "decrease_keys"
+PREDECESSOR_ENTRIES = "predecessor_entries"
+
+# The report, None while instrumentation is off
+_report = None
+# The step being timed, None between steps
+_step = None
+
+def enable():
+  """
+  Turns instrumentation on, with an empty report
+  """
+  global _report, _step
+  _report = {"steps": [], "counters": {}, "worker_peak_memory_bytes": []}
+  _step = None
+
+def disable():
+  """
+  Turns instrumentation off and drops the report
+  """
+  global _report, _step
+  _report = None
+  _step = None
+
+def enabled():
+  """
+  Returns True if instrumentation is on
+  """
+  return _report is not None
+
+def cpu_time():
+  """
+  Returns the user and system CPU time taken by this process so far, in seconds
+  """
+  process_times = times()
+  return process_times[0] + process_times[1]
+
+def start_step(name):
+  """
+  Starts timing the step |name|, counts are recorded with the step until it
+      is finished
+  """
+  global _step
+  if _report is None:
+    return
+  _step = {"step": name, "counters": {}, "wall_seconds": time(),
+      "cpu_seconds": cpu_time(), "peak_memory_growth_bytes": peak_memory(),
+      "worker_peak_memory_bytes": []}
+
+def finish_step():
+  """
+  Records the wall time, CPU time and counts of the step being timed, and the
+      peak memory of the process once it is done
+  The peak memory of a process only ever grows, so the step records both the
+      high-water mark of the process since it started and how much the step
+      raised it (0 if an earlier step used more memory), or None for both if
+      the peak cannot be measured
+  """
+  global _step
+  if _report is None or _step is None:
+    return
+  _step["wall_seconds"] = time() - _step["wall_seconds"]
+  _step["cpu_seconds"] = cpu_time() - _step["cpu_seconds"]
+  peak = peak_memory()
+  start_peak = _step["peak_memory_growth_bytes"]
+  _step["cumulative_peak_memory_bytes"] = peak
+  _step["peak_memory_growth_bytes"] = (None if peak is None or start_peak is
+      None else peak - start_peak)
+  _report["steps"].append(_step)
+  _step = None
+
+def count(name, n=1):
+  """
+  Adds |n| to the counter |name| of the step being timed, or of the whole run
+      between steps
+  """
+  if _report is None:
+    return
+  counters = _report["counters"] if _step is None else _step["counters"]
+  counters[name] = counters.get(name, 0) + n
+
+def counters():
+  """
+  Returns a dictionary with the counts recorded for the step being timed, or
+      for the whole run between steps
+  """
+  if _report is None:
+    return {}
+  return dict(_report["counters"] if _step is None else _step["counters"])
+
+def worker_report():
+  """
+  Returns (counts, peak), the counts of this worker process, as returned by
+      |counters|, and its peak memory in bytes, for |add_worker_report|
+  """
+  return counters(), peak_memory()
+
+def add_worker_report(report):
+  """
+  Adds the counts of a worker process to the step being timed, or to the whole
+      run between steps, and records the peak memory of the worker with them
+  |report|: as returned by |worker_report|
+  """
+  if _report is None:
+    return
+  counts, peak = report
+  for (name, n) in counts.items():
+    count(name, n)
+  (_report if _step is None else _step)["worker_peak_memory_bytes"].append(
+      peak)
+
+def write_report(path):
+  """
+  Writes the report to the JSON file at |path|
+  """
+  if _report is None:
+    return
+  report_file = open(path, "w")
+  try:
+    dump(_report, report_file, indent=2, sort_keys=True)
+  finally:
+    report_file.close()
+
+class Counting_Queue:
+  """
+  Priority queue that counts the pushes, decrease-keys and pops (nodes settled)
+      of another priority queue
+  """
+
+  def __init__(self, queue):
+    """
+    |queue|: the queue to count, a |Priority_Queue| or a |Bucket_Queue|
+    """
+    self.queue = queue
+    count(HEAP_PUSHES, len(queue))
+
+  def __len__(self):
+    """
+    Returns the number of keys in the queue
+    """
+    return len(self.queue)
+
+  def __contains__(self, key):
+    """
+    Returns True if |key| is in the queue, False otherwise
+    """
+    return key in self.queue
+
+  def push(self, entry):
+    """
+    Adds |entry| to the queue
+    """
+    count(HEAP_PUSHES)
+    self.queue.push(entry)
+
+  def decrease_key(self, entry):
+    """
+    Lowers the priority of the key of |entry| to the priority of |entry|
+    """
+    count(DECREASE_KEYS)
+    self.queue.decrease_key(entry)
+
+  def pop(self):
+    """
+    Removes and returns the live entry with the lowest priority
+    """
+    entry = self.queue.pop()
+    count(NODES_SETTLED)
+    return entry
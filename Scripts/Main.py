@@ -11,6 +11,10 @@
 Script for taking in the inputs to the toolbox and returning its outputs.
 """
 
+from Adjacency_File import export_dbf
+from Adjacency_File import read_chunks
+from Adjacency_File import read_fields
+from Adjacency_File import row_count
 from arcgisscripting import ExecuteAbort
 from arcpy import AddField_management
 from arcpy import AddMessage
@@ -33,19 +37,24 @@ from arcpy import UpdateCursor
 from Adjacency_List_Computation import compute_adjacency_list
 from Centrality_Computation import compute_centrality
 from Constants import ACCUMULATOR_ATTRIBUTES
+from Constants import ADJACENCY_ENGINE
+from Constants import ADJACENCY_ENGINES
 from Constants import ADJACENCY_LIST_COMPUTED
+from Constants import ADJACENCY_LIST_DBF
+from Constants import ADJACENCY_LIST_EXPORTED
 from Constants import ADJACENCY_LIST_NAME
 from Constants import AUXILIARY_DIR_NAME
 from Constants import BETA
+from Constants import BETAS
 from Constants import COMPUTE_BETWEENNESS
 from Constants import COMPUTE_CLOSENESS
+from Constants import COMPRESS_ADJACENCY_LIST
 from Constants import COMPUTE_GRAVITY
 from Constants import COMPUTE_REACH
 from Constants import COMPUTE_STRAIGHTNESS
-from Constants import DESTINATION_ID_FIELD_NAME
+from Constants import DISTANCE_CACHE
 from Constants import FAILURE
 from Constants import feature_class_name
-from Constants import FINAL_ATTRIBUTES
 from Constants import ID_ATTRIBUTE
 from Constants import IMPEDANCE_ATTRIBUTE
 from Constants import index
@@ -59,28 +68,49 @@ from Constants import INPUT_NETWORK
 from Constants import INPUT_POINTS
 from Constants import INPUT_POINTS_LAYER_NAME
 from Constants import layer_name
-from Constants import LOCATION
 from Constants import MAX_FILE_NAME_LENGTH
+from Constants import MAX_MEMORY
+from Constants import MERGE_PARTIAL_RESULTS
 from Constants import METRICS
+from Constants import NATIVE_ENGINE
+from Constants import NETWORK_ANALYST_ENGINE
+from Constants import NO_ORDERING
+from Constants import NODE_ORDERING
+from Constants import NODE_ORDERINGS
 from Constants import NODE_WEIGHT_ATTRIBUTE
 from Constants import NORMALIZE_RESULTS
 from Constants import OD_COST_MATRIX_LAYER_NAME
 from Constants import OD_COST_MATRIX_LINES
 from Constants import ON_THE_NETWORK_OPTION
-from Constants import ORIGIN_ID_FIELD_NAME
 from Constants import ORIGINAL_FID
 from Constants import OUTPUT_FEATURE_CLASS
 from Constants import OUTPUT_FILE_NAME
 from Constants import OUTPUT_LOCATION
+from Constants import PARALLEL_PROCESSES
 from Constants import PARTIAL_ADJACENCY_LIST_NAME
+from Constants import PARTIAL_RESULTS
+from Constants import PARTIAL_RESULTS_MERGED
+from Constants import PARTIAL_RESULTS_WRITTEN
+from Constants import PERFORMANCE_REPORT
+from Constants import PERFORMANCE_REPORT_WRITTEN
 from Constants import POINT_CONVERSION_FINISHED
 from Constants import POINT_CONVERSION_STARTED
 from Constants import POINT_FEATURE_CLASS_NAME
 from Constants import POINT_LOCATION
 from Constants import POLYGONS_LAYER_NAME
 from Constants import POLYGONS_SHAPEFILE_NAME
+from Constants import PREVIOUS_RESULTS
+from Constants import QUEUE_QUANTUM
+from Constants import RANDOM_SEED
 from Constants import RASTER_NAME
+from Constants import RELATIVE_ERROR
+from Constants import report_name
+from Constants import REQUIRED_INPUT_COUNT
+from Constants import SAMPLE_SIZE
+from Constants import SEARCH_RADII
 from Constants import SEARCH_RADIUS
+from Constants import SHARD
+from Constants import STEP_1
 from Constants import STEP_1_FAILED
 from Constants import STEP_1_FINISHED
 from Constants import STEP_1_STARTED
@@ -92,6 +122,7 @@ from Constants import STEP_3
 from Constants import STEP_3_FAILED
 from Constants import STEP_3_FINISHED
 from Constants import STEP_3_STARTED
+from Constants import STEP_4
 from Constants import STEP_4_FAILED
 from Constants import STEP_4_FINISHED
 from Constants import STEP_4_STARTED
@@ -99,359 +130,604 @@ from Constants import STEP_5
 from Constants import STEP_5_FAILED
 from Constants import STEP_5_FINISHED
 from Constants import STEP_5_STARTED
+from Constants import STEP_6
 from Constants import STEP_6_FAILED
 from Constants import STEP_6_FINISHED
 from Constants import STEP_6_STARTED
+from Constants import STRATIFIED_SAMPLING
 from Constants import SUCCESS
 from Constants import SYMBOLOGY_DIR
+from Constants import TEMP_ADJACENCY_LIST_NAME
+from Constants import TILE_SIZE
 from Constants import symbology_layer_name
 from Constants import USE_NETWORK_RADIUS
 from Constants import WARNING_APPLY_SYMBOLOGY_FAILED
 from Constants import WARNING_FAIL_TO_DISPLAY
 from Constants import WARNING_LARGE_ADJ_FILE_NAME
+from Constants import WARNING_NO_MEMORY_LIMIT
 from Constants import WARNING_NO_NODES
+from Constants import WARNING_NO_PREVIOUS_RESULTS
+from Constants import WARNING_NO_SAMPLED_ACCUMULATIONS
+from Constants import WARNING_NO_TILES
+from Constants import WARNING_NO_WORKER_PROCESSES
 from Constants import WARNING_OUTPUT_ALREADY_EXISTS
 from Constants import WARNING_POINTS_NOT_IN_GRAPH
-from Constants import WEIGHT
-from Node import Node
+from Graph import Graph_Builder
+from Graph import renumbered
+from Incremental_Centrality import update_previous_results
+from Instrumentation import enable as enable_instrumentation
+from Instrumentation import finish_step
+from Instrumentation import start_step
+from Instrumentation import write_report
+from Native_Adjacency_List import compute_native_adjacency_list
+from Native_Adjacency_List import edge_shapefile
+from Native_Adjacency_List import snapped_locations
+from numpy import column_stack
+from os.path import isfile
 from os.path import join
+from Parallel_Centrality import worker_processes
+from Sharded_Centrality import compute_shard
+from Sharded_Centrality import merge_partial_results
+from Sharded_Centrality import parse_shard
 from sys import argv
 from Utils import all_values_in_column
 from Utils import basename
 from Utils import calculate_network_locations
 from Utils import delete
 from Utils import Invalid_Input_Exception
-from Utils import is_accumulator_field
 from Utils import Progress_Bar
 from Utils import to_point_feature_class
 from Utils import trim
 
-env.overwriteOutput = True # Enable overwritting
-CheckOutExtension("Network")
+def main():
+  """
+  Runs the tool on the inputs in |argv|
+  """
+  env.overwriteOutput = True # Enable overwritting
 
-# Success of the program through the six steps
-success = True
+  # Success of the program through the six steps
+  success = True
 
-# Inputs to the tool
-if len(argv) != INPUT_COUNT + 1:
-  raise Exception("Invalid number of inputs")
-input_number = index()
-input_number.next() # Skip over sys.argv[0]
-inputs = {}
-inputs[INPUT_BUILDINGS] = argv[input_number.next()]
-inputs[POINT_LOCATION] = ("INSIDE" if argv[input_number.next()] == "true" else
-    "CENTROID")
-inputs[INPUT_NETWORK] = argv[input_number.next()]
-inputs[COMPUTE_REACH] = argv[input_number.next()] == "true"
-inputs[COMPUTE_GRAVITY] = argv[input_number.next()] == "true"
-inputs[COMPUTE_BETWEENNESS] = argv[input_number.next()] == "true"
-inputs[COMPUTE_CLOSENESS] = argv[input_number.next()] == "true"
-inputs[COMPUTE_STRAIGHTNESS] = argv[input_number.next()] == "true"
-inputs[ID_ATTRIBUTE] = argv[input_number.next()]
-inputs[NODE_WEIGHT_ATTRIBUTE] = argv[input_number.next()]
-inputs[IMPEDANCE_ATTRIBUTE] = argv[input_number.next()]
-try: inputs[SEARCH_RADIUS] = float(argv[input_number.next()])
-except: inputs[SEARCH_RADIUS] = INFINITE_RADIUS
-inputs[USE_NETWORK_RADIUS] = argv[input_number.next()] == ON_THE_NETWORK_OPTION
-try: inputs[BETA] = float(argv[input_number.next()])
-except: raise Invalid_Input_Exception("Beta")
-inputs[NORMALIZE_RESULTS] = [measure for measure in
-    argv[input_number.next()].split(";") if measure != "#"]
-inputs[OUTPUT_LOCATION] = argv[input_number.next()]
-inputs[OUTPUT_FILE_NAME] = argv[input_number.next()]
-inputs[ACCUMULATOR_ATTRIBUTES] = argv[input_number.next()]
+  # Inputs to the tool
+  if not REQUIRED_INPUT_COUNT + 1 <= len(argv) <= INPUT_COUNT + 1:
+    raise Exception("Invalid number of inputs")
+  input_number = index()
+  input_number.next() # Skip over sys.argv[0]
+  inputs = {}
+  inputs[INPUT_BUILDINGS] = argv[input_number.next()]
+  inputs[POINT_LOCATION] = ("INSIDE" if argv[input_number.next()] == "true" else
+      "CENTROID")
+  inputs[INPUT_NETWORK] = argv[input_number.next()]
+  inputs[COMPUTE_REACH] = argv[input_number.next()] == "true"
+  inputs[COMPUTE_GRAVITY] = argv[input_number.next()] == "true"
+  inputs[COMPUTE_BETWEENNESS] = argv[input_number.next()] == "true"
+  inputs[COMPUTE_CLOSENESS] = argv[input_number.next()] == "true"
+  inputs[COMPUTE_STRAIGHTNESS] = argv[input_number.next()] == "true"
+  inputs[ID_ATTRIBUTE] = argv[input_number.next()]
+  inputs[NODE_WEIGHT_ATTRIBUTE] = argv[input_number.next()]
+  inputs[IMPEDANCE_ATTRIBUTE] = argv[input_number.next()]
+  try: inputs[SEARCH_RADIUS] = float(argv[input_number.next()])
+  except: inputs[SEARCH_RADIUS] = INFINITE_RADIUS
+  inputs[USE_NETWORK_RADIUS] = (argv[input_number.next()] ==
+      ON_THE_NETWORK_OPTION)
+  try: inputs[BETA] = float(argv[input_number.next()])
+  except: raise Invalid_Input_Exception("Beta")
+  inputs[NORMALIZE_RESULTS] = [measure for measure in
+      argv[input_number.next()].split(";") if measure != "#"]
+  inputs[OUTPUT_LOCATION] = argv[input_number.next()]
+  inputs[OUTPUT_FILE_NAME] = argv[input_number.next()]
+  inputs[ACCUMULATOR_ATTRIBUTES] = argv[input_number.next()]
+  # Optional inputs
+  optional_input = lambda input: (argv[input + 1] if len(argv) > input + 1 and
+      argv[input + 1] != "#" else None)
+  try: inputs[PARALLEL_PROCESSES] = max(1,
+      int(optional_input(PARALLEL_PROCESSES)))
+  except: inputs[PARALLEL_PROCESSES] = 1
+  # Worker processes need a python interpreter, ArcMap cannot start them
+  processes = worker_processes(inputs[PARALLEL_PROCESSES])
+  if processes < inputs[PARALLEL_PROCESSES]:
+    AddWarning(WARNING_NO_WORKER_PROCESSES)
+  inputs[PARALLEL_PROCESSES] = processes
+  # Several radii or betas, given as a list separated by ";" or ","
+  parse_list = lambda text: [float(item) for item in text.replace(";",
+      ",").split(",") if item.strip()]
+  if optional_input(SEARCH_RADII):
+    try: inputs[SEARCH_RADIUS] = parse_list(optional_input(SEARCH_RADII))
+    except: raise Invalid_Input_Exception("Search Radii")
+  if optional_input(BETAS):
+    try: inputs[BETA] = parse_list(optional_input(BETAS))
+    except: raise Invalid_Input_Exception("Betas")
+  # Estimate the metrics from a sample of the origins if a sample size or a
+  #     target relative error is given
+  try: inputs[SAMPLE_SIZE] = max(1, int(optional_input(SAMPLE_SIZE)))
+  except: inputs[SAMPLE_SIZE] = None
+  try: inputs[RELATIVE_ERROR] = float(optional_input(RELATIVE_ERROR))
+  except: inputs[RELATIVE_ERROR] = None
+  inputs[STRATIFIED_SAMPLING] = optional_input(STRATIFIED_SAMPLING) == "true"
+  try: inputs[RANDOM_SEED] = int(optional_input(RANDOM_SEED))
+  except: inputs[RANDOM_SEED] = 0
+  # Directory to cache the distances within the search radius in, if any
+  inputs[DISTANCE_CACHE] = optional_input(DISTANCE_CACHE)
+  # Width of the buckets of the bucket queue used by Dijkstra, if any
+  try: inputs[QUEUE_QUANTUM] = float(optional_input(QUEUE_QUANTUM))
+  except: inputs[QUEUE_QUANTUM] = None
+  if inputs[QUEUE_QUANTUM] is not None and inputs[QUEUE_QUANTUM] <= 0:
+    raise Invalid_Input_Exception("Bucket Queue Quantum")
+  # Order to renumber the nodes in before the centrality computation, the
+  #     nodes keep the order they are read in unless one is chosen
+  inputs[NODE_ORDERING] = optional_input(NODE_ORDERING) or NO_ORDERING
+  if inputs[NODE_ORDERING] not in NODE_ORDERINGS:
+    raise Invalid_Input_Exception("Node Ordering")
+  # Memory limit of the centrality computation, given in megabytes
+  try: inputs[MAX_MEMORY] = float(optional_input(MAX_MEMORY)) * 2**20
+  except: inputs[MAX_MEMORY] = None
+  # Run a single shard of the origins, given as "k/n" or as a file of origin
+  #     ids, and write its results to a partial results file instead of the
+  #     output
+  if optional_input(SHARD):
+    try: inputs[SHARD] = parse_shard(optional_input(SHARD))
+    except: raise Invalid_Input_Exception("Shard")
+  else:
+    inputs[SHARD] = None
+  inputs[PARTIAL_RESULTS] = optional_input(PARTIAL_RESULTS)
+  if inputs[SHARD] is not None and inputs[PARTIAL_RESULTS] is None:
+    raise Invalid_Input_Exception("Partial Results")
+  # Partial results files of all the shards to merge into the output, given as a
+  #     list separated by ";"
+  inputs[MERGE_PARTIAL_RESULTS] = [path for path in (optional_input(
+      MERGE_PARTIAL_RESULTS) or "").split(";") if path.strip()]
+  # Record the time and work of each step in a report?
+  inputs[PERFORMANCE_REPORT] = optional_input(PERFORMANCE_REPORT) == "true"
+  if inputs[PERFORMANCE_REPORT]:
+    enable_instrumentation()
+  # Width of the spatial tiles to run the origins in, if any
+  try: inputs[TILE_SIZE] = float(optional_input(TILE_SIZE))
+  except: inputs[TILE_SIZE] = None
+  if inputs[TILE_SIZE] is not None and inputs[TILE_SIZE] <= 0:
+    raise Invalid_Input_Exception("Tile Size")
+  # Compute the adjacency list with Network Analyst or natively
+  inputs[ADJACENCY_ENGINE] = (optional_input(ADJACENCY_ENGINE) or
+      NETWORK_ANALYST_ENGINE)
+  if inputs[ADJACENCY_ENGINE] not in ADJACENCY_ENGINES:
+    raise Invalid_Input_Exception("Adjacency List Engine")
+  if inputs[ADJACENCY_ENGINE] == NETWORK_ANALYST_ENGINE:
+    CheckOutExtension("Network")
+  # Compress the adjacency list file?
+  inputs[COMPRESS_ADJACENCY_LIST] = (optional_input(COMPRESS_ADJACENCY_LIST) ==
+      "true")
+  # Also export the adjacency list as a DBF table?
+  inputs[ADJACENCY_LIST_DBF] = optional_input(ADJACENCY_LIST_DBF) == "true"
+  # File with the graph and results of a previous run, which this run updates
+  #     after the network was edited and then replaces
+  inputs[PREVIOUS_RESULTS] = optional_input(PREVIOUS_RESULTS)
+  # The adjacency list has to cover the largest radius
+  if isinstance(inputs[SEARCH_RADIUS], list):
+    max_radius = max(inputs[SEARCH_RADIUS])
+  else:
+    max_radius = inputs[SEARCH_RADIUS]
+  # With a birds-eye radius, a run accumulates over its whole shortest path
+  #     tree, which a sample of the nodes cannot estimate
+  if ((inputs[SAMPLE_SIZE] is not None or inputs[RELATIVE_ERROR] is not None)
+      and not inputs[USE_NETWORK_RADIUS] and inputs[ACCUMULATOR_ATTRIBUTES] !=
+      "#"):
+    AddWarning(WARNING_NO_SAMPLED_ACCUMULATIONS)
+    inputs[ACCUMULATOR_ATTRIBUTES] = "#"
+  # Sampling keeps sums for every node whatever the number of origins, it is
+  #     not run in chunks
+  if ((inputs[SAMPLE_SIZE] is not None or inputs[RELATIVE_ERROR] is not None)
+      and inputs[MAX_MEMORY] is not None):
+    AddWarning(WARNING_NO_MEMORY_LIMIT)
+    inputs[MAX_MEMORY] = None
+  # Tiles load the edges within the radius of their origins, which is only
+  #     bounded for a network radius
+  if inputs[TILE_SIZE] is not None and (not inputs[USE_NETWORK_RADIUS] or
+      max_radius == INFINITE_RADIUS or inputs[SAMPLE_SIZE] is not None or
+      inputs[RELATIVE_ERROR] is not None or
+      inputs[DISTANCE_CACHE] is not None or inputs[MAX_MEMORY] is not None or
+      inputs[SHARD] is not None or inputs[MERGE_PARTIAL_RESULTS]):
+    AddWarning(WARNING_NO_TILES)
+    inputs[TILE_SIZE] = None
+  # Previous results are updated on the whole graph by a single process
+  if inputs[PREVIOUS_RESULTS] is not None and (inputs[SAMPLE_SIZE] is not None
+      or inputs[RELATIVE_ERROR] is not None or inputs[SHARD] is not None or
+      inputs[MERGE_PARTIAL_RESULTS] or inputs[TILE_SIZE] is not None or
+      inputs[MAX_MEMORY] is not None):
+    AddWarning(WARNING_NO_PREVIOUS_RESULTS)
+    inputs[PREVIOUS_RESULTS] = None
 
-# Record the origin nodes for centrality measurements
-# This is important if the user selects a subset of the features to be origins
-selected_features = all_values_in_column(inputs[INPUT_BUILDINGS],
-  inputs[ID_ATTRIBUTE])
-# Clear selection if we got a layer file
-try:
-  SelectLayerByAttribute_management(inputs[INPUT_BUILDINGS],
-    "CLEAR_SELECTION")
-except:
-  pass
+  # Record the origin nodes for centrality measurements
+  # This is important if the user selects a subset of the features to be origins
+  selected_features = all_values_in_column(inputs[INPUT_BUILDINGS],
+    inputs[ID_ATTRIBUTE])
+  # Clear selection if we got a layer file
+  try:
+    SelectLayerByAttribute_management(inputs[INPUT_BUILDINGS],
+      "CLEAR_SELECTION")
+  except:
+    pass
 
-# Adjacency List table name
-node_locations_needed = (inputs[COMPUTE_STRAIGHTNESS] or
-    not inputs[USE_NETWORK_RADIUS])
-adj_dbf_name = ("%s_%s_%s_%s_%s_%s.dbf" % (ADJACENCY_LIST_NAME,
-    basename(inputs[INPUT_BUILDINGS]), basename(inputs[INPUT_NETWORK]),
-    inputs[ID_ATTRIBUTE], inputs[IMPEDANCE_ATTRIBUTE],
-    inputs[ACCUMULATOR_ATTRIBUTES])).replace("#", "None")
-if len(adj_dbf_name) > MAX_FILE_NAME_LENGTH:
-  AddWarning(WARNING_LARGE_ADJ_FILE_NAME)
-adj_dbf = join(inputs[OUTPUT_LOCATION], adj_dbf_name)
+  # Adjacency List file name, and the name of its DBF export
+  node_locations_needed = (inputs[COMPUTE_STRAIGHTNESS] or
+      not inputs[USE_NETWORK_RADIUS] or inputs[TILE_SIZE] is not None)
+  adj_name = ("%s_%s_%s_%s_%s_%s" % (ADJACENCY_LIST_NAME,
+      basename(inputs[INPUT_BUILDINGS]), basename(inputs[INPUT_NETWORK]),
+      inputs[ID_ATTRIBUTE], inputs[IMPEDANCE_ATTRIBUTE],
+      inputs[ACCUMULATOR_ATTRIBUTES])).replace("#", "None")
+  # The engines model the network differently, so an adjacency list is only
+  #     reused by the engine that computed it; lists computed with Network
+  #     Analyst keep the name they had before there were other engines
+  if inputs[ADJACENCY_ENGINE] != NETWORK_ANALYST_ENGINE:
+    adj_name = "%s_%s" % (adj_name, inputs[ADJACENCY_ENGINE].replace(" ", ""))
+  adj_file_name = "%s.adj" % adj_name
+  if len(adj_file_name) > MAX_FILE_NAME_LENGTH:
+    AddWarning(WARNING_LARGE_ADJ_FILE_NAME)
+  adj_file = join(inputs[OUTPUT_LOCATION], adj_file_name)
+  adj_dbf = join(inputs[OUTPUT_LOCATION], "%s.dbf" % adj_name)
 
-# Output file names
-output_feature_class_name = feature_class_name(inputs[OUTPUT_FILE_NAME])
-output_feature_class = "%s.shp" % join(inputs[OUTPUT_LOCATION],
-    output_feature_class_name)
-# Create a feature class that is a copy of the input buildings
-try:
-  AddMessage(INPUT_BUILDINGS_COPY_STARTED)
-  CreateFeatureclass_management(out_path=inputs[OUTPUT_LOCATION],
-      out_name=output_feature_class_name)
-  CopyFeatures_management(in_features=inputs[INPUT_BUILDINGS],
-      out_feature_class=output_feature_class)
-  AddMessage(INPUT_BUILDINGS_COPY_FINISHED)
-except:
-  AddWarning(GetMessages(2))
-  AddMessage(INPUT_BUILDINGS_COPY_FAILED)
-  success = False
-output_layer_name = layer_name(inputs[OUTPUT_FILE_NAME])
-output_layer = "%s.lyr" % join(inputs[OUTPUT_LOCATION], output_layer_name)
+  # Output file names
+  output_feature_class_name = feature_class_name(inputs[OUTPUT_FILE_NAME])
+  output_feature_class = "%s.shp" % join(inputs[OUTPUT_LOCATION],
+      output_feature_class_name)
+  # Create a feature class that is a copy of the input buildings
+  try:
+    AddMessage(INPUT_BUILDINGS_COPY_STARTED)
+    CreateFeatureclass_management(out_path=inputs[OUTPUT_LOCATION],
+        out_name=output_feature_class_name)
+    CopyFeatures_management(in_features=inputs[INPUT_BUILDINGS],
+        out_feature_class=output_feature_class)
+    AddMessage(INPUT_BUILDINGS_COPY_FINISHED)
+  except:
+    AddWarning(GetMessages(2))
+    AddMessage(INPUT_BUILDINGS_COPY_FAILED)
+    success = False
+  output_layer_name = layer_name(inputs[OUTPUT_FILE_NAME])
+  output_layer = "%s.lyr" % join(inputs[OUTPUT_LOCATION], output_layer_name)
+  report_file = join(inputs[OUTPUT_LOCATION], report_name(
+      inputs[OUTPUT_FILE_NAME]))
 
-# If output has already been created, don't carry on
-if Exists(output_layer):
-  AddWarning(WARNING_OUTPUT_ALREADY_EXISTS)
-  success = False
+  # If output has already been created, don't carry on
+  if Exists(output_layer):
+    AddWarning(WARNING_OUTPUT_ALREADY_EXISTS)
+    success = False
 
-# We will convert polygon input buildings to point feature class
-buildings_description = Describe(output_feature_class)
-if buildings_description.shapeType == "Point":
-  # Input buildings are already a point shape file
-  inputs[INPUT_POINTS] = output_feature_class
-elif buildings_description.shapeType == "Polygon":
-  # Input buildings need to be converted to point feature class
-  point_feature_class_name = POINT_FEATURE_CLASS_NAME(
-      basename(output_feature_class), inputs[POINT_LOCATION])
-  inputs[INPUT_POINTS] = "%s.shp" % join(inputs[OUTPUT_LOCATION],
-      point_feature_class_name)
-  # If FID is used as ID attribute, we need to change it since a point
-  #     shapefile will be in use
-  if inputs[ID_ATTRIBUTE] == "FID":
-    inputs[ID_ATTRIBUTE] = ORIGINAL_FID
-else:
-  # Input buildings need to be either points or polygons
-  raise Invalid_Input_Exception("Input Buildings")
+  # We will convert polygon input buildings to point feature class
+  buildings_description = Describe(output_feature_class)
+  if buildings_description.shapeType == "Point":
+    # Input buildings are already a point shape file
+    inputs[INPUT_POINTS] = output_feature_class
+  elif buildings_description.shapeType == "Polygon":
+    # Input buildings need to be converted to point feature class
+    point_feature_class_name = POINT_FEATURE_CLASS_NAME(
+        basename(output_feature_class), inputs[POINT_LOCATION])
+    inputs[INPUT_POINTS] = "%s.shp" % join(inputs[OUTPUT_LOCATION],
+        point_feature_class_name)
+    # If FID is used as ID attribute, we need to change it since a point
+    #     shapefile will be in use
+    if inputs[ID_ATTRIBUTE] == "FID":
+      inputs[ID_ATTRIBUTE] = ORIGINAL_FID
+  else:
+    # Input buildings need to be either points or polygons
+    raise Invalid_Input_Exception("Input Buildings")
 
-# Find the appropriate symbology layer
-for metric_index in range(len(METRICS)):
-    if inputs[COMPUTE_REACH + metric_index]:
-        first_metric = METRICS[metric_index]
-        break
-symbology_layer_name = symbology_layer_name(buildings_description.shapeType,
-    first_metric)
-symbology_layer = join(SYMBOLOGY_DIR, symbology_layer_name)
+  # Find the appropriate symbology layer
+  for metric_index in range(len(METRICS)):
+      if inputs[COMPUTE_REACH + metric_index]:
+          first_metric = METRICS[metric_index]
+          break
+  symbology_layer = join(SYMBOLOGY_DIR, symbology_layer_name(
+      buildings_description.shapeType, first_metric))
 
-def clean_up():
-  """
-  Removes all auxiliary files
-  """
-  auxiliary_dir = join(inputs[OUTPUT_LOCATION], AUXILIARY_DIR_NAME)
-  od_cost_matrix_layer = join(auxiliary_dir, OD_COST_MATRIX_LAYER_NAME)
-  od_cost_matrix_lines = join(auxiliary_dir, OD_COST_MATRIX_LINES)
-  temp_adj_dbf_name = "%s~.dbf" % adj_dbf_name[-4]
-  temp_adj_dbf = join(inputs[OUTPUT_LOCATION], temp_adj_dbf_name)
-  partial_adj_dbf = join(auxiliary_dir, PARTIAL_ADJACENCY_LIST_NAME)
-  polygons = join(auxiliary_dir, POLYGONS_SHAPEFILE_NAME)
-  raster = join(auxiliary_dir, RASTER_NAME)
-  polygons_layer = join(auxiliary_dir, POLYGONS_LAYER_NAME)
-  input_points_layer = join(auxiliary_dir, INPUT_POINTS_LAYER_NAME)
-  for delete_path in [input_points_layer, polygons_layer, raster, polygons,
-      partial_adj_dbf, temp_adj_dbf, od_cost_matrix_lines, od_cost_matrix_layer,
-      auxiliary_dir]:
-    delete(delete_path)
+  def clean_up():
+    """
+    Removes all auxiliary files
+    """
+    auxiliary_dir = join(inputs[OUTPUT_LOCATION], AUXILIARY_DIR_NAME)
+    od_cost_matrix_layer = join(auxiliary_dir, OD_COST_MATRIX_LAYER_NAME)
+    od_cost_matrix_lines = join(auxiliary_dir, OD_COST_MATRIX_LINES)
+    temp_adj_file = join(inputs[OUTPUT_LOCATION], TEMP_ADJACENCY_LIST_NAME(
+        adj_file_name))
+    partial_adj_dbf = join(auxiliary_dir, PARTIAL_ADJACENCY_LIST_NAME)
+    polygons = join(auxiliary_dir, POLYGONS_SHAPEFILE_NAME)
+    raster = join(auxiliary_dir, RASTER_NAME)
+    polygons_layer = join(auxiliary_dir, POLYGONS_LAYER_NAME)
+    input_points_layer = join(auxiliary_dir, INPUT_POINTS_LAYER_NAME)
+    for delete_path in [input_points_layer, polygons_layer, raster, polygons,
+        partial_adj_dbf, temp_adj_file, od_cost_matrix_lines,
+        od_cost_matrix_layer, auxiliary_dir]:
+      delete(delete_path)
 
-try:
-  """
-  Here we carry out the six steps of the tool
-  """
-  # Step 1
-  if success:
-    AddMessage(STEP_1_STARTED)
-    # If necessary, convert input buildings to point feature class
-    if buildings_description.shapeType == "Polygon":
-      AddMessage(POINT_CONVERSION_STARTED)
-      to_point_feature_class(output_feature_class, inputs[INPUT_POINTS],
-          inputs[POINT_LOCATION])
-      AddMessage(POINT_CONVERSION_FINISHED)
-    if Exists(adj_dbf):
-      AddMessage(ADJACENCY_LIST_COMPUTED)
-      if node_locations_needed:
-        calculate_network_locations(inputs[INPUT_POINTS], inputs[INPUT_NETWORK])
-      AddMessage(STEP_1_FINISHED)
-    else:
-      try:
-        compute_adjacency_list(inputs[INPUT_POINTS], inputs[INPUT_NETWORK],
-            inputs[ID_ATTRIBUTE], inputs[IMPEDANCE_ATTRIBUTE],
-            inputs[ACCUMULATOR_ATTRIBUTES], inputs[SEARCH_RADIUS],
-            inputs[OUTPUT_LOCATION], adj_dbf_name)
+  def adjacency_rows():
+    """
+    Returns an iterator over the edges of the adjacency list, as (origin_id,
+        destination_id, distance, accumulations) tuples, read as in Step 2
+    """
+    for (origins, destinations, values) in read_chunks(adj_file):
+      for (origin_id, destination_id, row_values) in zip(origins.tolist(),
+          destinations.tolist(), values.T.tolist()):
+        distance = row_values[0]
+        if origin_id != destination_id and distance >= 0:
+          yield (origin_id, destination_id, distance, dict(zip(
+              accumulator_columns, row_values[1:])))
+
+  try:
+    """
+    Here we carry out the six steps of the tool
+    """
+    # Step 1
+    if success:
+      AddMessage(STEP_1_STARTED)
+      start_step(STEP_1)
+      # If necessary, convert input buildings to point feature class
+      if buildings_description.shapeType == "Polygon":
+        AddMessage(POINT_CONVERSION_STARTED)
+        to_point_feature_class(output_feature_class, inputs[INPUT_POINTS],
+            inputs[POINT_LOCATION])
+        AddMessage(POINT_CONVERSION_FINISHED)
+      # The native engine keeps the snapped locations of the buildings for
+      #     Step 3 instead of writing them to the input points
+      native = inputs[ADJACENCY_ENGINE] == NATIVE_ENGINE
+      snap_locations = None
+      if isfile(adj_file):
+        AddMessage(ADJACENCY_LIST_COMPUTED)
+        if node_locations_needed and native:
+          snap_locations = snapped_locations(inputs[INPUT_POINTS],
+              edge_shapefile(inputs[INPUT_NETWORK]), inputs[ID_ATTRIBUTE])
+        elif node_locations_needed:
+          calculate_network_locations(inputs[INPUT_POINTS],
+              inputs[INPUT_NETWORK])
         AddMessage(STEP_1_FINISHED)
+      else:
+        try:
+          if native:
+            snap_locations = compute_native_adjacency_list(inputs[INPUT_POINTS],
+                edge_shapefile(inputs[INPUT_NETWORK]), inputs[ID_ATTRIBUTE],
+                inputs[IMPEDANCE_ATTRIBUTE], inputs[ACCUMULATOR_ATTRIBUTES],
+                max_radius, inputs[OUTPUT_LOCATION], adj_file_name,
+                inputs[COMPRESS_ADJACENCY_LIST])
+          else:
+            compute_adjacency_list(inputs[INPUT_POINTS], inputs[INPUT_NETWORK],
+                inputs[ID_ATTRIBUTE], inputs[IMPEDANCE_ATTRIBUTE],
+                inputs[ACCUMULATOR_ATTRIBUTES], max_radius,
+                inputs[OUTPUT_LOCATION], adj_file_name,
+                inputs[PARALLEL_PROCESSES], inputs[COMPRESS_ADJACENCY_LIST])
+          if inputs[ADJACENCY_LIST_DBF]:
+            export_dbf(adj_file, adj_dbf)
+            AddMessage(ADJACENCY_LIST_EXPORTED(adj_dbf))
+          AddMessage(STEP_1_FINISHED)
+        except:
+          AddWarning(GetMessages(2))
+          AddMessage(STEP_1_FAILED)
+          success = False
+      finish_step()
+
+    # Step 2
+    if success:
+      AddMessage(STEP_2_STARTED)
+      start_step(STEP_2)
+      try:
+        accumulator_fields = set([trim("Total_%s" % accumulator_attribute)
+            for accumulator_attribute in
+            inputs[ACCUMULATOR_ATTRIBUTES].split(";")
+            if accumulator_attribute != "#"])
+        # The first value column of |adj_file| holds the distances, the others
+        #     hold the accumulations
+        accumulator_columns = read_fields(adj_file)[1:]
+        # Graph representation: nodes and edges are collected by |graph_builder|
+        #     and then stored in a compact array-backed |Graph|
+        graph_builder = Graph_Builder(accumulator_fields)
+        # The number of rows in |adj_file|
+        directed_edge_count = row_count(adj_file)
+        graph_progress = Progress_Bar(directed_edge_count, 1, STEP_2)
+        for (origins, destinations, values) in read_chunks(adj_file):
+          for (origin_id, destination_id, row_values) in zip(origins.tolist(),
+              destinations.tolist(), values.T.tolist()):
+            # Get neighboring nodes, and the distance between them
+            distance = row_values[0]
+            # Make sure the nodes are recorded in the graph
+            for id in [origin_id, destination_id]:
+              graph_builder.add_node(id)
+            # Make sure that the nodes are neighbors in the graph, tiles load
+            #     their edges in Step 4
+            if (origin_id != destination_id and distance >= 0 and
+                inputs[TILE_SIZE] is None):
+              graph_builder.add_edge(origin_id, destination_id, distance,
+                  dict(zip(accumulator_columns, row_values[1:])))
+            graph_progress.step()
+        nodes = graph_builder.build()
+        N = len(nodes) # The number of nodes in the graph
+        if N == 0:
+          AddWarning(WARNING_NO_NODES)
+          success = False
+        AddMessage(STEP_2_FINISHED)
       except:
         AddWarning(GetMessages(2))
-        AddMessage(STEP_1_FAILED)
+        AddMessage(STEP_2_FAILED)
         success = False
+      finish_step()
 
-  # Step 2
-  if success:
-    AddMessage(STEP_2_STARTED)
-    try:
-      distance_field = trim("Total_%s" % inputs[IMPEDANCE_ATTRIBUTE])
-      accumulator_fields = set([trim("Total_%s" % accumulator_attribute)
-          for accumulator_attribute in inputs[ACCUMULATOR_ATTRIBUTES].split(";")
-          if accumulator_attribute != "#"])
-      # Graph representation: dictionary mapping node id's to Node objects
-      nodes = {}
-      # The number of rows in |adj_dbf|
-      directed_edge_count = int(GetCount_management(adj_dbf).getOutput(0))
-      graph_progress = Progress_Bar(directed_edge_count, 1, STEP_2)
-      rows = UpdateCursor(adj_dbf)
-      for row in rows:
-        # Get neighboring nodes, and the distance between them
-        origin_id = row.getValue(trim(ORIGIN_ID_FIELD_NAME))
-        destination_id = row.getValue(trim(DESTINATION_ID_FIELD_NAME))
-        distance = float(row.getValue(distance_field))
-        # Make sure the nodes are recorded in the graph
-        for id in [origin_id, destination_id]:
-          if not id in nodes:
-            nodes[id] = Node()
-        # Make sure that the nodes are neighbors in the graph
-        if origin_id != destination_id and distance >= 0:
-          accumulations = {}
-          for field in accumulator_fields:
-            accumulations[field] = float(row.getValue(field))
-          nodes[origin_id].add_neighbor(destination_id, distance, accumulations)
-          nodes[destination_id].add_neighbor(origin_id, distance, accumulations)
-        graph_progress.step()
-      N = len(nodes) # The number of nodes in the graph
-      if N == 0:
-        AddWarning(WARNING_NO_NODES)
+    # Step 3
+    if success:
+      AddMessage(STEP_3_STARTED)
+      start_step(STEP_3)
+      try:
+        get_weights = inputs[NODE_WEIGHT_ATTRIBUTE] != "#"
+        get_locations = node_locations_needed
+        # Keep track of number nodes in input points not present in the graph
+        point_not_in_graph_count = 0
+        input_point_count = int(
+            GetCount_management(inputs[INPUT_POINTS]).getOutput(0))
+        node_attribute_progress = Progress_Bar(input_point_count, 1, STEP_3)
+        rows = UpdateCursor(inputs[INPUT_POINTS])
+        for row in rows:
+          id = row.getValue(inputs[ID_ATTRIBUTE])
+          if not id in nodes.index:
+            point_not_in_graph_count += 1
+            continue
+          if get_weights:
+            nodes.set_weight(id,
+                row.getValue(trim(inputs[NODE_WEIGHT_ATTRIBUTE])))
+          if get_locations and snap_locations is not None:
+            if id in snap_locations:
+              nodes.set_location(id, snap_locations[id])
+          elif get_locations:
+            snap_x = row.getValue(trim("SnapX"))
+            snap_y = row.getValue(trim("SnapY"))
+            nodes.set_location(id, (snap_x, snap_y))
+          node_attribute_progress.step()
+        if point_not_in_graph_count:
+          AddWarning(WARNING_POINTS_NOT_IN_GRAPH(N,
+              point_not_in_graph_count))
+        # Renumber the nodes so that neighboring nodes are close in memory
+        nodes = renumbered(nodes, inputs[NODE_ORDERING])
+        AddMessage(STEP_3_FINISHED)
+      except:
+        AddWarning(GetMessages(2))
+        AddMessage(STEP_3_FAILED)
         success = False
-      AddMessage(STEP_2_FINISHED)
-    except:
-      AddWarning(GetMessages(2))
-      AddMessage(STEP_2_FAILED)
-      success = False
+      finish_step()
 
-  # Step 3
-  if success:
-    AddMessage(STEP_3_STARTED)
-    try:
-      get_weights = inputs[NODE_WEIGHT_ATTRIBUTE] != "#"
-      get_locations = node_locations_needed
-      # Keep track of number nodes in input points not present in the graph
-      point_not_in_graph_count = 0
-      input_point_count = int(
-          GetCount_management(inputs[INPUT_POINTS]).getOutput(0))
-      node_attribute_progress = Progress_Bar(input_point_count, 1, STEP_3)
-      rows = UpdateCursor(inputs[INPUT_POINTS])
-      for row in rows:
-        id = row.getValue(inputs[ID_ATTRIBUTE])
-        if not id in nodes:
-          point_not_in_graph_count += 1
-          continue
-        if get_weights:
-          setattr(nodes[id], WEIGHT,
-              row.getValue(trim(inputs[NODE_WEIGHT_ATTRIBUTE])))
-        if get_locations:
-          snap_x = row.getValue(trim("SnapX"))
-          snap_y = row.getValue(trim("SnapY"))
-          setattr(nodes[id], LOCATION, (snap_x, snap_y))
-        node_attribute_progress.step()
-      if point_not_in_graph_count:
-        AddWarning(WARNING_POINTS_NOT_IN_GRAPH(N,
-            point_not_in_graph_count))
-      AddMessage(STEP_3_FINISHED)
-    except:
-      AddWarning(GetMessages(2))
-      AddMessage(STEP_3_FAILED)
-      success = False
+    # Step 4
+    if success:
+      AddMessage(STEP_4_STARTED)
+      start_step(STEP_4)
+      try:
+        if inputs[MERGE_PARTIAL_RESULTS]:
+          # Combine the results computed by the shards
+          merged_origins = merge_partial_results(nodes,
+              inputs[MERGE_PARTIAL_RESULTS], inputs[NORMALIZE_RESULTS])
+          AddMessage(PARTIAL_RESULTS_MERGED(len(inputs[MERGE_PARTIAL_RESULTS]),
+              len(merged_origins)))
+        elif inputs[SHARD] is not None:
+          # Compute the measures of one shard of the origins
+          shard_ids = compute_shard(nodes, selected_features, inputs[SHARD],
+              inputs[PARTIAL_RESULTS], inputs[COMPUTE_REACH],
+              inputs[COMPUTE_GRAVITY], inputs[COMPUTE_BETWEENNESS],
+              inputs[COMPUTE_CLOSENESS], inputs[COMPUTE_STRAIGHTNESS],
+              inputs[SEARCH_RADIUS], inputs[USE_NETWORK_RADIUS], inputs[BETA],
+              accumulator_fields, inputs[PARALLEL_PROCESSES],
+              inputs[DISTANCE_CACHE], inputs[QUEUE_QUANTUM], inputs[MAX_MEMORY])
+          AddMessage(PARTIAL_RESULTS_WRITTEN(len(shard_ids),
+              inputs[PARTIAL_RESULTS]))
+        elif inputs[PREVIOUS_RESULTS] is not None:
+          # Only recompute the origins that the edits of the network affect
+          update_previous_results(inputs[PREVIOUS_RESULTS], nodes,
+              selected_features, inputs[COMPUTE_REACH],
+              inputs[COMPUTE_GRAVITY], inputs[COMPUTE_BETWEENNESS],
+              inputs[COMPUTE_CLOSENESS], inputs[COMPUTE_STRAIGHTNESS],
+              inputs[SEARCH_RADIUS], inputs[USE_NETWORK_RADIUS], inputs[BETA],
+              inputs[NORMALIZE_RESULTS], accumulator_fields)
+        else:
+          # Compute measures
+          compute_centrality(nodes, selected_features, inputs[COMPUTE_REACH],
+              inputs[COMPUTE_GRAVITY], inputs[COMPUTE_BETWEENNESS],
+              inputs[COMPUTE_CLOSENESS], inputs[COMPUTE_STRAIGHTNESS],
+              inputs[SEARCH_RADIUS], inputs[USE_NETWORK_RADIUS], inputs[BETA],
+              inputs[NORMALIZE_RESULTS], accumulator_fields,
+              inputs[PARALLEL_PROCESSES], inputs[SAMPLE_SIZE],
+              inputs[RELATIVE_ERROR], inputs[STRATIFIED_SAMPLING],
+              inputs[RANDOM_SEED], inputs[DISTANCE_CACHE],
+              inputs[QUEUE_QUANTUM], inputs[MAX_MEMORY], inputs[TILE_SIZE],
+              adjacency_rows)
+        AddMessage(STEP_4_FINISHED)
+      except:
+        AddWarning(GetMessages(2))
+        AddMessage(STEP_4_FAILED)
+        success = False
+      finish_step()
 
-  # Step 4
-  if success:
-    AddMessage(STEP_4_STARTED)
-    try:
-      # Compute measures
-      compute_centrality(nodes, selected_features, inputs[COMPUTE_REACH],
-          inputs[COMPUTE_GRAVITY], inputs[COMPUTE_BETWEENNESS],
-          inputs[COMPUTE_CLOSENESS], inputs[COMPUTE_STRAIGHTNESS],
-          inputs[SEARCH_RADIUS], inputs[USE_NETWORK_RADIUS], inputs[BETA],
-          inputs[NORMALIZE_RESULTS], accumulator_fields)
-      AddMessage(STEP_4_FINISHED)
-    except:
-      AddWarning(GetMessages(2))
-      AddMessage(STEP_4_FAILED)
-      success = False
+    # A shard only writes its partial results, the output is written when the
+    #     partial results of all shards are merged
+    output_needed = inputs[SHARD] is None
 
-  # Step 5
-  if success:
-    AddMessage(STEP_5_STARTED)
-    try:
-      # Make output layer
-      MakeFeatureLayer_management(in_features=output_feature_class,
-          out_layer=output_layer_name)
-      # Save output layer
-      SaveToLayerFile_management(output_layer_name, output_layer,
-          "ABSOLUTE")
-      # Use a test node to figure out which metrics were computed
-      test_node_id = selected_features.pop()
-      # Make sure the test node is in the graph
-      while test_node_id not in nodes:
-        test_node_id = selected_features.pop()
-      test_node = nodes[test_node_id]
-      measures = set([measure for measure in dir(test_node) if (measure in
-          FINAL_ATTRIBUTES or is_accumulator_field(measure))])
-      # Add a field in the output layer for each computed metric
-      for measure in measures:
-        AddField_management(in_table=output_layer, field_name=trim(measure),
-            field_type="DOUBLE", field_is_nullable="NON_NULLABLE")
-      # Figure out the id field to use based on the type of the input buildings
-      if (buildings_description.shapeType == "Polygon" and
-          inputs[ID_ATTRIBUTE] == ORIGINAL_FID):
-        id_field = "FID"
-      else:
-        id_field = inputs[ID_ATTRIBUTE]
-      # Fill the layer with the metric values
-      write_progress = Progress_Bar(N, 1, STEP_5)
-      layer_rows = UpdateCursor(output_layer)
-      for row in layer_rows:
-          id = row.getValue(id_field)
-          for measure in measures:
-            # If no value was computed for this node id, set value to 0
-            value = 0
-            if id in nodes and hasattr(nodes[id], measure):
-              value = getattr(nodes[id], measure)
-            row.setValue(trim(measure), value)
-          layer_rows.updateRow(row)
-          write_progress.step()
-      # Save to toolbox output
-      SetParameterAsText(OUTPUT_FEATURE_CLASS, output_feature_class)
-      AddMessage(STEP_5_FINISHED)
-    except:
-      AddWarning(GetMessages(2))
-      AddMessage(STEP_5_FAILED)
-      success = False
+    # Step 5
+    if success and output_needed:
+      AddMessage(STEP_5_STARTED)
+      start_step(STEP_5)
+      try:
+        # Make output layer
+        MakeFeatureLayer_management(in_features=output_feature_class,
+            out_layer=output_layer_name)
+        # Save output layer
+        SaveToLayerFile_management(output_layer_name, output_layer,
+            "ABSOLUTE")
+        # Figure out which metrics were computed, including one column per
+        #     radius and beta when several were given
+        measures = sorted(nodes.metrics)
+        # Add a field in the output layer for each computed metric
+        for measure in measures:
+          AddField_management(in_table=output_layer, field_name=trim(measure),
+              field_type="DOUBLE", field_is_nullable="NON_NULLABLE")
+        # Figure out the id field to use based on the type of the input
+        #     buildings
+        if (buildings_description.shapeType == "Polygon" and
+            inputs[ID_ATTRIBUTE] == ORIGINAL_FID):
+          id_field = "FID"
+        else:
+          id_field = inputs[ID_ATTRIBUTE]
+        # Fill the layer with the metric values, the values of each node are
+        #     read from the metric columns by node index
+        fields = [trim(measure) for measure in measures]
+        node_values = column_stack([nodes.metrics[measure] for measure in
+            measures]).tolist() if measures else [[]] * N
+        # If no value was computed for a node id, its values are 0
+        no_values = [0.0] * len(measures)
+        write_progress = Progress_Bar(N, 1, STEP_5)
+        layer_rows = UpdateCursor(output_layer)
+        for row in layer_rows:
+            id = row.getValue(id_field)
+            values = (node_values[nodes.index[id]] if id in nodes.index else
+                no_values)
+            for (field, value) in zip(fields, values):
+              row.setValue(field, value)
+            layer_rows.updateRow(row)
+            write_progress.step()
+        # Save to toolbox output
+        SetParameterAsText(OUTPUT_FEATURE_CLASS, output_feature_class)
+        AddMessage(STEP_5_FINISHED)
+      except:
+        AddWarning(GetMessages(2))
+        AddMessage(STEP_5_FAILED)
+        success = False
+      finish_step()
+
+    # Step 6
+    if success and output_needed:
+      AddMessage(STEP_6_STARTED)
+      start_step(STEP_6)
+      # Apply symbology
+      try:
+        ApplySymbologyFromLayer_management(in_layer=output_layer,
+            in_symbology_layer=symbology_layer)
+      except:
+        AddWarning(WARNING_APPLY_SYMBOLOGY_FAILED)
+        AddWarning(GetMessages(2))
+        AddMessage(STEP_6_FAILED)
+      # Display
+      try:
+        current_map_document = mapping.MapDocument("CURRENT")
+        data_frame = mapping.ListDataFrames(current_map_document,
+            "Layers")[0]
+        add_layer = mapping.Layer(output_layer)
+        mapping.AddLayer(data_frame, add_layer, "AUTO_ARRANGE")
+        AddMessage(STEP_6_FINISHED)
+      except:
+        AddWarning(WARNING_FAIL_TO_DISPLAY)
+        AddWarning(GetMessages(2))
+        AddMessage(STEP_6_FAILED)
+      finish_step()
+
+    # Clean up
+    clean_up()
 
-  # Step 6
-  if success:
-    AddMessage(STEP_6_STARTED)
-    # Apply symbology
-    try:
-      ApplySymbologyFromLayer_management(in_layer=output_layer,
-          in_symbology_layer=symbology_layer)
-    except:
-      AddWarning(WARNING_APPLY_SYMBOLOGY_FAILED)
-      AddWarning(GetMessages(2))
-      AddMessage(STEP_6_FAILED)
-    # Display
-    try:
-      current_map_document = mapping.MapDocument("CURRENT")
-      data_frame = mapping.ListDataFrames(current_map_document,
-          "Layers")[0]
-      add_layer = mapping.Layer(output_layer)
-      mapping.AddLayer(data_frame, add_layer, "AUTO_ARRANGE")
-      AddMessage(STEP_6_FINISHED)
-    except:
-      AddWarning(WARNING_FAIL_TO_DISPLAY)
-      AddWarning(GetMessages(2))
-      AddMessage(STEP_6_FAILED)
+    # Write the timings and counts of the steps next to the output
+    if inputs[PERFORMANCE_REPORT]:
+      write_report(report_file)
+      AddMessage(PERFORMANCE_REPORT_WRITTEN(report_file))
 
-  # Clean up
-  clean_up()
+    AddMessage(SUCCESS if success else FAILURE)
 
-  AddMessage(SUCCESS if success else FAILURE)
+  except ExecuteAbort:
+    clean_up()
 
-except ExecuteAbort:
-  clean_up()
+if __name__ == "__main__":
+  main()
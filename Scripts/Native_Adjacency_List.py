@@ -0,0 +1,378 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Script for adjacency list computation without Network Analyst.
+The streets are read from the shapefile of the edges of the network, and are
+    connected where their ends meet. Each building is snapped to the closest
+    point on the closest street within |SEARCH_TOLERANCE|, which splits the
+    street at that point. A search then grows from the location of each
+    building up to the search radius, and stops at the location of every other
+    building it reaches, as the point barriers of the Network Analyst
+    computation do: two buildings are neighbors only if a shortest path
+    between them goes through no other building. Buildings that share a
+    location are not neighbors of each other, as with the barriers.
+Impedances and accumulations are read from the field of the street edges named
+    after the attribute, or are the lengths of the streets if there is no such
+    field, and are split along a street in proportion to length.
+Usage: python Native_Adjacency_List.py [buildings] [streets] [id attribute]
+           [impedance attribute] [search radius] [output adjacency file]
+           [accumulator attributes]
+"""
+
+# Outside of ArcGIS, the messages and progressors of arcpy are replaced by
+#     console stand-ins
+from Headless import install
+install()
+
+from Adjacency_File import Adjacency_Writer
+from Adjacency_File import value_fields
+from arcpy import AddWarning
+from Constants import BARRIER_COST
+from Constants import INFINITE_RADIUS
+from Constants import SEARCH_TOLERANCE
+from Constants import STEP_1
+from Constants import TEMP_ADJACENCY_LIST_NAME
+from Constants import WARNING_NO_EDGE_SHAPEFILE
+from Constants import WARNING_POINTS_NOT_SNAPPED
+from Constants import XY_TOLERANCE
+from numpy import array
+from numpy import clip
+from numpy import concatenate
+from numpy import cumsum
+from numpy import float64
+from numpy import int32
+from numpy import sqrt
+from numpy import where
+from numpy import zeros
+from os import remove
+from os import rename
+from os.path import dirname
+from os.path import isfile
+from os.path import join
+from os.path import splitext
+from Priority_Queue import Priority_Queue
+from Shapefile_IO import read_dbf
+from Shapefile_IO import read_shapefile
+from Shapefile_IO import read_shapes
+from Spatial_Index import Grid_Index
+from sys import argv
+from Utils import Invalid_Input_Exception
+from Utils import network_features
+from Utils import Progress_Bar
+from Utils import trim
+
+def search_tolerance():
+  """
+  Returns |SEARCH_TOLERANCE| as a distance in the units of the data
+  """
+  return float(SEARCH_TOLERANCE.split()[0])
+
+def parse_attributes(accumulator_attributes):
+  """
+  Returns the list of attributes in |accumulator_attributes|, given as a list
+      separated by ";", or "#" for none
+  """
+  return [attribute for attribute in accumulator_attributes.split(";") if
+      attribute.strip() and attribute != "#"]
+
+def edge_shapefile(network):
+  """
+  Returns the path of the shapefile of the street edges of |network|, a network
+      dataset built on shapefiles or the edge shapefile itself
+  Raises |Invalid_Input_Exception| if there is no such shapefile
+  """
+  if network.lower().endswith(".shp"):
+    return network
+  junction_feature, edge_feature = network_features(network)
+  path = join(dirname(network), "%s.shp" % edge_feature)
+  if not isfile(path):
+    AddWarning(WARNING_NO_EDGE_SHAPEFILE(network))
+    raise Invalid_Input_Exception("Input Network")
+  return path
+
+def read_buildings(input_points, id_attribute):
+  """
+  Returns the list of (id, (x, y)) of the buildings in the point shapefile
+      |input_points|, identified by |id_attribute| ("FID" for the number of the
+      record)
+  Raises |Invalid_Input_Exception| if the shapefile does not hold points
+  """
+  shapes = read_shapes(input_points)
+  fields, records = read_dbf("%s.dbf" % splitext(input_points)[0])
+  buildings = []
+  for (fid, (shape, record)) in enumerate(zip(shapes, records)):
+    if shape is None or record is None:
+      continue
+    if not isinstance(shape, tuple):
+      raise Invalid_Input_Exception("Input Buildings")
+    buildings.append((fid if id_attribute == "FID" else
+        record[trim(id_attribute)], shape))
+  return buildings
+
+class Street_Network:
+  """
+  Streets read from a shapefile of polylines, each part of a polyline is a
+      street between two junctions
+  Junctions are the ends of streets, ends that agree to within |XY_TOLERANCE|
+      are the same junction
+  """
+
+  def __init__(self, streets, impedance_attribute, accumulator_attributes):
+    """
+    |streets|: list of (parts, attributes) of the polylines, as returned by
+        |read_shapefile|
+    |impedance_attribute|, |accumulator_attributes|: names of the attributes
+        that make up the costs of a street, in order
+    """
+    names = [trim(attribute) for attribute in [impedance_attribute] +
+        accumulator_attributes]
+    # Junction keys to junction indices
+    junctions = {}
+    junction_of = lambda point: junctions.setdefault(tuple(int(round(
+        coordinate / XY_TOLERANCE)) for coordinate in point), len(junctions))
+    # Per street: its ends, length, costs, and the first of its segments
+    self.ends = []
+    self.lengths = []
+    self.costs = []
+    segment_starts, segment_ends, segment_streets, segment_offsets = (
+        [], [], [], [])
+    for (parts, attributes) in streets:
+      if not parts:
+        continue
+      part_lengths = []
+      for part in parts:
+        vertices = array(part, dtype=float64)
+        steps = sqrt(((vertices[1:] - vertices[:-1])**2).sum(axis=1))
+        segment_starts.append(vertices[:-1])
+        segment_ends.append(vertices[1:])
+        segment_streets.append(zeros(len(steps), dtype=int32) + len(
+            self.ends) + len(part_lengths))
+        segment_offsets.append(cumsum(steps) - steps)
+        part_lengths.append(steps.sum())
+      total = sum(part_lengths)
+      feature_costs = [float(attributes[name]) if attributes.get(name) is not
+          None else total for name in names]
+      for (part, length) in zip(parts, part_lengths):
+        share = length / total if total > 0 else 1.0 / len(parts)
+        self.ends.append((junction_of(part[0]), junction_of(part[-1])))
+        self.lengths.append(length)
+        self.costs.append(tuple(cost * share for cost in feature_costs))
+    self.junction_count = len(junctions)
+    self.cost_count = len(names)
+    self.segment_starts = concatenate(segment_starts or [zeros((0, 2))])
+    self.segment_ends = concatenate(segment_ends or [zeros((0, 2))])
+    self.segment_streets = concatenate(segment_streets or [zeros(0,
+        dtype=int32)])
+    self.segment_offsets = concatenate(segment_offsets or [zeros(0)])
+    midpoints = (self.segment_starts + self.segment_ends) / 2
+    half_lengths = sqrt(((self.segment_ends - self.segment_starts)**2).sum(
+        axis=1)) / 2
+    self.max_half_length = half_lengths.max() if len(half_lengths) else 0.0
+    self.cell_size = max(XY_TOLERANCE, 2 * half_lengths.mean() if len(
+        half_lengths) else 1.0)
+    self.index = Grid_Index(midpoints.ravel(), self.cell_size)
+
+  def snap(self, x, y, tolerance):
+    """
+    Returns (street, position, (snap_x, snap_y)) for the closest point to
+        (|x|, |y|) on the streets, where |position| is the length along
+        |street| to that point, or None if no street is within |tolerance|
+    """
+    if not len(self.index):
+      return None
+    point = array([x, y])
+    radius = self.cell_size
+    while True:
+      candidates = self.index.candidates(x, y, radius + self.max_half_length)
+      if len(candidates):
+        starts = self.segment_starts[candidates]
+        steps = self.segment_ends[candidates] - starts
+        squared_lengths = (steps**2).sum(axis=1)
+        t = clip(((point - starts) * steps).sum(axis=1) / where(
+            squared_lengths > 0, squared_lengths, 1.0), 0.0, 1.0)
+        closest = starts + t[:, None] * steps
+        distances = sqrt(((closest - point)**2).sum(axis=1))
+        best = distances.argmin()
+        # Any closer segment has its midpoint within the query
+        if distances[best] <= min(radius, tolerance):
+          segment = candidates[best]
+          return (int(self.segment_streets[segment]),
+              self.segment_offsets[segment] + t[best] * sqrt(
+              squared_lengths[best]), tuple(closest[best].tolist()))
+      if radius >= tolerance:
+        return None
+      radius = min(2 * radius, tolerance)
+
+  def search_graph(self, snaps):
+    """
+    Returns (neighbors, locations) for the streets split at the points in
+        |snaps|, a list of (street, position) as returned by |snap|
+    |neighbors|: list with the (node, costs) pairs of each node, junctions are
+        nodes 0, 1, ..., then come the points where streets are split
+    |locations|: list with the node of each snap, snaps at the end of a street
+        are at the junction, snaps closer than |XY_TOLERANCE| are the same node
+    """
+    node_of = {}
+    splits = {}
+    locations = []
+    for (street, position) in snaps:
+      u, v = self.ends[street]
+      length = self.lengths[street]
+      if position <= XY_TOLERANCE:
+        locations.append(u)
+      elif position >= length - XY_TOLERANCE:
+        locations.append(v)
+      else:
+        key = (street, int(round(position / XY_TOLERANCE)))
+        if key not in node_of:
+          node_of[key] = self.junction_count + len(node_of)
+          splits.setdefault(street, []).append((position, node_of[key]))
+        locations.append(node_of[key])
+    neighbors = [[] for i in xrange(self.junction_count + len(node_of))]
+    for (street, ((u, v), length, costs)) in enumerate(zip(self.ends,
+        self.lengths, self.costs)):
+      chain = ([(0.0, u)] + sorted(splits.get(street, [])) + [(length, v)])
+      for ((start, a), (end, b)) in zip(chain[:-1], chain[1:]):
+        share = (end - start) / length if length > 0 else 1.0
+        piece = tuple(cost * share for cost in costs)
+        neighbors[a].append((b, piece))
+        neighbors[b].append((a, piece))
+    return neighbors, locations
+
+def search(neighbors, source, stops, cutoff, cost_count):
+  """
+  Returns the list of (node, costs) for the nodes in |stops| reachable from
+      |source| within an impedance of |cutoff| without going through another
+      node in |stops|, in the order they are reached
+  |costs|: the |cost_count| costs of the shortest path to the node, its
+      impedance and then its accumulations
+  """
+  queue = Priority_Queue([(0.0, source, (0.0,) * cost_count)])
+  settled = set()
+  reached = []
+  while queue:
+    impedance, node, costs = queue.pop()
+    settled.add(node)
+    if node != source and node in stops:
+      # Paths do not go through other buildings
+      reached.append((node, costs))
+      continue
+    for (neighbor, edge_costs) in neighbors[node]:
+      if neighbor in settled:
+        continue
+      new_impedance = impedance + edge_costs[0]
+      if new_impedance > cutoff:
+        continue
+      entry = (new_impedance, neighbor, tuple(a + b for (a, b) in zip(costs,
+          edge_costs)))
+      if neighbor not in queue:
+        queue.push(entry)
+      elif new_impedance < queue.priority[neighbor]:
+        queue.decrease_key(entry)
+  return reached
+
+def snap_buildings(network, buildings):
+  """
+  Returns a list with the snap of each of the |buildings| on |network|, as
+      returned by |Street_Network.snap|, warns about the buildings that could
+      not be snapped
+  """
+  tolerance = search_tolerance()
+  snaps = [network.snap(x, y, tolerance) for (id, (x, y)) in buildings]
+  not_snapped = sum(1 for snap in snaps if snap is None)
+  if not_snapped:
+    AddWarning(WARNING_POINTS_NOT_SNAPPED(len(buildings), not_snapped))
+  return snaps
+
+def adjacency_rows(network, buildings, snaps, search_radius):
+  """
+  Returns an iterator over the rows of the adjacency list of the |buildings|
+      snapped at |snaps| on |network|, as (origin_id, destination_id, costs)
+      tuples, where |costs| are the impedance and then the accumulations, in
+      order of origin building and then of destination building
+  """
+  snapped = [i for (i, snap) in enumerate(snaps) if snap is not None]
+  neighbors, locations = network.search_graph([snaps[i][:2] for i in snapped])
+  # Buildings at each location
+  buildings_at = {}
+  for (i, node) in zip(snapped, locations):
+    buildings_at.setdefault(node, []).append(i)
+  cutoff = min(search_radius, BARRIER_COST / 2)
+  progress = Progress_Bar(len(buildings_at), 1, STEP_1)
+  reached_from = {}
+  for (i, node) in zip(snapped, locations):
+    if node not in reached_from:
+      reached = search(neighbors, node, buildings_at, cutoff,
+          network.cost_count)
+      reached_from[node] = sorted((j, costs) for (other, costs) in reached for
+          j in buildings_at[other])
+      progress.step()
+    for (j, costs) in reached_from[node]:
+      yield buildings[i][0], buildings[j][0], costs
+    # Every building at a location is an origin before the search is dropped
+    if i == buildings_at[node][-1]:
+      del reached_from[node]
+
+def compute_native_adjacency_list(input_points, streets, id_attribute,
+    impedance_attribute, accumulator_attributes, search_radius,
+    output_location, adj_file_name, compress=False):
+  """
+  Same as |compute_adjacency_list|, without Network Analyst
+  |input_points|: point shapefile of the buildings, with integer ids
+  |streets|: shapefile of the street edges of the network
+  |accumulator_attributes|: list separated by ";", or "#" for none
+  Returns a dictionary mapping the id of each snapped building to its snapped
+      (x, y) location
+  """
+  buildings = read_buildings(input_points, id_attribute)
+  if not all(isinstance(id, (int, long)) for (id, location) in buildings):
+    raise Invalid_Input_Exception("ID Attribute")
+  network = Street_Network(read_shapefile(streets), impedance_attribute,
+      parse_attributes(accumulator_attributes))
+  snaps = snap_buildings(network, buildings)
+  # The adjacency list only appears once it is complete
+  temp_adj_file = join(output_location, TEMP_ADJACENCY_LIST_NAME(
+      adj_file_name))
+  adj_file = join(output_location, adj_file_name)
+  writer = Adjacency_Writer(temp_adj_file, value_fields(impedance_attribute,
+      accumulator_attributes), compress)
+  try:
+    for (origin_id, destination_id, costs) in adjacency_rows(network,
+        buildings, snaps, search_radius):
+      writer.write(origin_id, destination_id, costs)
+  finally:
+    writer.close()
+  if isfile(adj_file):
+    remove(adj_file)
+  rename(temp_adj_file, adj_file)
+  return dict((id, snap[2]) for ((id, location), snap) in zip(buildings,
+      snaps) if snap is not None)
+
+def snapped_locations(input_points, streets, id_attribute):
+  """
+  Returns the snapped locations of the buildings in |input_points| on
+      |streets|, as |compute_native_adjacency_list|, without computing the
+      adjacency list
+  """
+  buildings = read_buildings(input_points, id_attribute)
+  network = Street_Network(read_shapefile(streets), "", [])
+  snaps = snap_buildings(network, buildings)
+  return dict((id, snap[2]) for ((id, location), snap) in zip(buildings,
+      snaps) if snap is not None)
+
+if __name__ == "__main__":
+  if len(argv) < 7:
+    raise Exception("Invalid number of inputs")
+  try: radius = float(argv[5])
+  except: radius = INFINITE_RADIUS
+  output = argv[6]
+  compute_native_adjacency_list(argv[1], argv[2], argv[3], argv[4],
+      argv[7] if len(argv) > 7 else "#", radius, dirname(output) or ".",
+      output[len(dirname(output)):].lstrip("\\/"))
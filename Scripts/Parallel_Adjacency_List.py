@@ -0,0 +1,141 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Script for solving the cells of origins of the adjacency list computation on
+    several processes at once.
+Each worker makes its own solver, with its own state and its own scratch
+    workspace, and solves a fixed subset of the cells, each into a partial
+    table of its workspace. The partial tables are returned in cell order, so
+    that merging them gives the same adjacency list whatever the number of
+    workers.
+A solver is made by calling |make_solver| with its workspace, |make_solver|
+    has to be picklable (e.g. a class or a |functools.partial| of one defined
+    at the top of a module). A solver has two methods: |solve|(cell, path),
+    which solves |cell| into the partial table at |path| and returns the path
+    of the table, and |close|(), which releases its state.
+"""
+
+from Constants import PARTIAL_CELL_TABLE_NAME
+from Constants import WORKER_WORKSPACE_NAME
+from Instrumentation import add_worker_report
+from Instrumentation import enable as enable_instrumentation
+from Instrumentation import enabled as instrumentation_enabled
+from Instrumentation import worker_report
+from multiprocessing import Process
+from multiprocessing import Queue
+from os import mkdir
+from os.path import isdir
+from os.path import join
+from Parallel_Centrality import COUNTERS_MESSAGE
+from Parallel_Centrality import DONE_MESSAGE
+from Parallel_Centrality import ERROR_MESSAGE
+from Parallel_Centrality import next_message
+from Parallel_Centrality import PROGRESS_MESSAGE
+from Parallel_Centrality import RESULT_MESSAGE
+from Parallel_Centrality import split_origins
+from Parallel_Centrality import worker_processes
+from traceback import format_exc
+
+def worker_workspace(workspace, k):
+  """
+  Returns the scratch workspace of worker |k| within |workspace|, made if it
+      does not exist
+  """
+  path = join(workspace, WORKER_WORKSPACE_NAME(k))
+  if not isdir(path):
+    mkdir(path)
+  return path
+
+def solve_cells(make_solver, workspace, cells, result):
+  """
+  Solves |cells|, a list of (j, cell), with a solver made for |workspace|
+      (see |make_solver|), and calls |result|(j, path) with the path of the
+      partial table of each cell in turn
+  """
+  solver = make_solver(workspace)
+  try:
+    for (j, cell) in cells:
+      result(j, solver.solve(cell, join(workspace, PARTIAL_CELL_TABLE_NAME(j))))
+  finally:
+    solver.close()
+
+def _cell_worker(k, make_solver, workspace, cells, messages, instrument):
+  """
+  Solves |cells| and reports the partial tables through |messages|
+  |k|: index of this worker
+  |workspace|: this worker's scratch workspace
+  |cells|: list of (j, cell), where |j| is the index of the cell
+  |instrument|: count the work of the solver and report the counts?
+  """
+  try:
+    if instrument:
+      enable_instrumentation()
+    def result(j, path):
+      messages.put((PROGRESS_MESSAGE, k, 1))
+      messages.put((RESULT_MESSAGE, k, (j, path)))
+    solve_cells(make_solver, workspace, cells, result)
+    if instrument:
+      messages.put((COUNTERS_MESSAGE, k, worker_report()))
+    messages.put((DONE_MESSAGE, k, None))
+  except:
+    messages.put((ERROR_MESSAGE, k, format_exc()))
+
+def solve_cells_in_parallel(cells, make_solver, workspace, processes, step):
+  """
+  Solves each of the |cells| into a partial table, on |processes| worker
+      processes, each with a solver made by |make_solver| for its own scratch
+      workspace within |workspace|
+  Cells are dealt to the workers in turn, so that each worker gets cells from
+      all parts of |cells|
+  |step|: called once for each cell that is done, in the parent process
+  Returns the list of the paths of the partial tables, in the order of |cells|
+  With a single process, or if worker processes cannot be started (see
+      |worker_processes|), the cells are solved in this process
+  """
+  processes = worker_processes(max(1, min(processes, len(cells))))
+  paths = [None] * len(cells)
+  if processes == 1:
+    def result(j, path):
+      paths[j] = path
+      step()
+    solve_cells(make_solver, worker_workspace(workspace, 0), list(enumerate(
+        cells)), result)
+    return paths
+  cell_lists = split_origins(list(enumerate(cells)), processes)
+  messages = Queue()
+  workers = [Process(target=_cell_worker, args=(k, make_solver,
+      worker_workspace(workspace, k), cell_list, messages,
+      instrumentation_enabled())) for (k, cell_list) in enumerate(cell_lists)]
+  for worker in workers:
+    worker.daemon = True
+    worker.start()
+  try:
+    finished = [False] * processes
+    while not all(finished):
+      message, k, content = next_message(messages, workers, finished,
+          "Adjacency list")
+      if message == PROGRESS_MESSAGE:
+        for i in xrange(content):
+          step()
+      elif message == RESULT_MESSAGE:
+        j, path = content
+        paths[j] = path
+      elif message == COUNTERS_MESSAGE:
+        add_worker_report(content)
+      elif message == DONE_MESSAGE:
+        finished[k] = True
+      else:
+        raise Exception("Adjacency list worker %d failed:\n%s" % (k, content))
+  finally:
+    for worker in workers:
+      if worker.is_alive():
+        worker.terminate()
+      worker.join()
+  return paths
@@ -0,0 +1,315 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Script for running the centrality computation on several processes at once.
+The graph arrays are copied once into shared memory and mapped by every worker.
+Each worker computes the shortest path trees of a fixed subset of the origins
+    and keeps its own partial betweenness array, the partial results are
+    combined in worker order so that the results are deterministic.
+Graphs with several connected components are instead split into work units,
+    which are dealt to the workers largest first.
+"""
+
+from Centrality_Kernels import kernel_for
+from Instrumentation import add_worker_report
+from Instrumentation import enable as enable_instrumentation
+from Instrumentation import enabled as instrumentation_enabled
+from Instrumentation import worker_report
+from multiprocessing import Process
+from multiprocessing import Queue
+from multiprocessing.sharedctypes import RawArray
+from numpy import float64
+from numpy import frombuffer
+from numpy import int32
+from numpy import zeros
+from os.path import basename
+from os.path import isfile
+from os.path import join
+from Queue import Empty
+from sys import exec_prefix
+from sys import executable
+from sys import prefix
+from traceback import format_exc
+
+# Messages sent by the workers to the parent process
+PROGRESS_MESSAGE = "progress"
+RESULT_MESSAGE = "result"
+ERROR_MESSAGE = "error"
+DONE_MESSAGE = "done"
+COUNTERS_MESSAGE = "counters"
+
+# Number of origins a worker completes between progress messages
+PROGRESS_INTERVAL = 16
+# Seconds to wait for a message before checking that the workers are running
+MESSAGE_TIMEOUT = 5
+
+# Shared memory type codes for the array types used by the graph
+TYPE_CODES = {float64: "d", int32: "i"}
+
+# File names of the python interpreter in an installation
+PYTHON_EXECUTABLES = ["python.exe", "python"]
+
+def standalone_python():
+  """
+  Returns the path of a python interpreter that worker processes can be started
+      with, or None if there is none
+  When the tool runs inside ArcMap, |executable| is ArcMap itself, and the
+      interpreter is looked up in the python installation instead
+  """
+  if basename(executable).lower().startswith("python"):
+    return executable
+  for directory in (exec_prefix, prefix):
+    for name in PYTHON_EXECUTABLES:
+      path = join(directory, name)
+      if isfile(path):
+        return path
+  return None
+
+def worker_processes(processes):
+  """
+  Returns the number of processes to compute on, |processes| if worker
+      processes can be started and 1 otherwise
+  Worker processes are set up to start with the interpreter returned by
+      |standalone_python|
+  """
+  if processes <= 1:
+    return 1
+  python = standalone_python()
+  if python is None:
+    return 1
+  if python != executable:
+    # Only defined where processes are spawned rather than forked
+    from multiprocessing import set_executable
+    set_executable(python)
+  return processes
+
+def share_array(a):
+  """
+  Returns a shared memory copy of the one dimensional array |a|, or None if |a|
+      is None
+  The shared copy can be indexed one item at a time like a list
+  """
+  if a is None:
+    return None
+  dtype = a.dtype.type
+  shared = RawArray(TYPE_CODES[dtype], len(a))
+  frombuffer(shared, dtype=dtype)[:] = a
+  return shared
+
+def split_origins(origins, processes):
+  """
+  Returns |processes| lists of origins, origins are dealt out in turn so that
+      each list covers all parts of |origins|
+  """
+  return [origins[i::processes] for i in xrange(processes)]
+
+def _worker(k, shared_sequences, origins, arguments, shared_betweenness,
+    messages, quantum, instrument):
+  """
+  Computes the results for |origins| and reports them through |messages|
+  |k|: index of this worker
+  |shared_sequences|: graph arrays in shared memory
+  |arguments|: the metric arguments to |compute_origins|
+  |shared_betweenness|: this worker's partial betweenness array
+  |quantum|: as in |kernel_for|
+  |instrument|: count the work of the kernel and report the counts?
+  """
+  try:
+    if instrument:
+      enable_instrumentation()
+    done = [0]
+    def step():
+      done[0] += 1
+      if done[0] == PROGRESS_INTERVAL:
+        messages.put((PROGRESS_MESSAGE, k, done[0]))
+        done[0] = 0
+    kernel = kernel_for(arguments, shared_sequences, quantum)
+    values = kernel(shared_sequences, origins, *(arguments +
+        (shared_betweenness, step)))
+    if done[0]:
+      messages.put((PROGRESS_MESSAGE, k, done[0]))
+    if instrument:
+      messages.put((COUNTERS_MESSAGE, k, worker_report()))
+    messages.put((RESULT_MESSAGE, k, values))
+  except:
+    messages.put((ERROR_MESSAGE, k, format_exc()))
+
+def schedule_units(costs, processes):
+  """
+  Returns |processes| lists of unit indices, units are taken in decreasing
+      order of |costs| and each one goes to the worker with the least work so
+      far
+  """
+  loads = [0] * processes
+  schedule = [[] for k in xrange(processes)]
+  for j in sorted(xrange(len(costs)), key=lambda j: (-costs[j], j)):
+    k = loads.index(min(loads))
+    schedule[k].append(j)
+    loads[k] += costs[j]
+  return schedule
+
+def _unit_worker(k, units, arguments, messages, quantum, instrument):
+  """
+  Computes the results of the work |units| and reports them through |messages|
+  |k|: index of this worker
+  |units|: list of (j, arrays, origins), where |j| is the index of the unit,
+      |arrays| the arrays returned by |graph_arrays| for the graph of the unit
+      and |origins| the node indices of its origins in that graph
+  |arguments|: the metric arguments to |compute_origins|
+  |quantum|: as in |kernel_for|
+  |instrument|: as in |_worker|
+  """
+  try:
+    if instrument:
+      enable_instrumentation()
+    radii = arguments[5]
+    R = len(radii) if isinstance(radii, list) else 1
+    for (j, arrays, origins) in units:
+      sequences = tuple(None if a is None else a.tolist() for a in arrays)
+      betweenness = [0.0] * (len(sequences[3]) * R)
+      kernel = kernel_for(arguments, sequences, quantum)
+      values = kernel(sequences, origins, *(arguments + (betweenness,
+          lambda: None)))
+      messages.put((PROGRESS_MESSAGE, k, len(origins)))
+      messages.put((RESULT_MESSAGE, k, (j, values, betweenness)))
+    if instrument:
+      messages.put((COUNTERS_MESSAGE, k, worker_report()))
+    messages.put((DONE_MESSAGE, k, None))
+  except:
+    messages.put((ERROR_MESSAGE, k, format_exc()))
+
+def next_message(messages, workers, finished, name):
+  """
+  Returns the next (message, k, content) sent by the |workers| on the queue
+      |messages|
+  |finished|: list of whether each worker sent its last message
+  |name|: name of the workers in errors
+  A worker that is killed (e.g. out of memory) sends no message, so an
+      exception is raised if a worker that did not finish exits with an error
+      code while no message comes
+  """
+  while True:
+    try:
+      return messages.get(timeout=MESSAGE_TIMEOUT)
+    except Empty:
+      for (k, worker) in enumerate(workers):
+        if not finished[k] and worker.exitcode not in (None, 0):
+          raise Exception("%s worker %d stopped with exit code %d" % (name, k,
+              worker.exitcode))
+
+def compute_units_in_parallel(units, costs, processes, arguments, step,
+    quantum=None):
+  """
+  Computes the results of independent work units on |processes| worker
+      processes
+  |units|: list of (arrays, origins), the arrays returned by |graph_arrays| for
+      the graph of each unit and the node indices of its origins
+  |costs|: estimated cost of each unit, see |schedule_units|
+  |arguments|: the arguments to |compute_origins| between |origins| and
+      |betweenness|, as a tuple
+  |step|: called once for each origin that is done, in the parent process
+  |quantum|: as in |kernel_for|
+  Returns a list with (values, betweenness) for each unit, as returned by
+      |compute_origins|
+  """
+  processes = max(1, min(processes, len(units)))
+  schedule = schedule_units(costs, processes)
+  messages = Queue()
+  workers = [Process(target=_unit_worker, args=(k, [(j,) + tuple(units[j]) for
+      j in unit_list], arguments, messages, quantum,
+      instrumentation_enabled())) for (k, unit_list) in enumerate(schedule)]
+  for worker in workers:
+    worker.daemon = True
+    worker.start()
+  try:
+    results = [None] * len(units)
+    finished = [False] * processes
+    while not all(finished):
+      message, k, content = next_message(messages, workers, finished,
+          "Centrality")
+      if message == PROGRESS_MESSAGE:
+        for i in xrange(content):
+          step()
+      elif message == RESULT_MESSAGE:
+        j, values, betweenness = content
+        results[j] = (values, betweenness)
+      elif message == COUNTERS_MESSAGE:
+        add_worker_report(content)
+      elif message == DONE_MESSAGE:
+        finished[k] = True
+      else:
+        raise Exception("Centrality worker %d failed:\n%s" % (k, content))
+  finally:
+    for worker in workers:
+      if worker.is_alive():
+        worker.terminate()
+      worker.join()
+  return results
+
+def compute_origins_in_parallel(arrays, origins, processes, arguments,
+    betweenness_size, step, quantum=None):
+  """
+  Same as |compute_origins|, but the work is split among |processes| worker
+      processes
+  |arrays|: the arrays returned by |graph_arrays|
+  |arguments|: the arguments to |compute_origins| between |origins| and
+      |betweenness|, as a tuple
+  |betweenness_size|: length of the betweenness arrays
+  |step|: called once for each origin that is done, in the parent process
+  |quantum|: as in |kernel_for|
+  Returns (values, betweenness), where |values| is as returned by
+      |compute_origins| and |betweenness| is the sum of the partial betweenness
+      arrays of the workers
+  """
+  processes = max(1, min(processes, len(origins)))
+  shared_sequences = tuple(share_array(a) for a in arrays)
+  origin_lists = split_origins(origins, processes)
+  partial_betweenness = [RawArray("d", betweenness_size) for
+      origin_list in origin_lists]
+  messages = Queue()
+  workers = [Process(target=_worker, args=(k, shared_sequences, origin_list,
+      arguments, partial_betweenness[k], messages, quantum,
+      instrumentation_enabled())) for (k, origin_list) in
+      enumerate(origin_lists)]
+  for worker in workers:
+    worker.daemon = True
+    worker.start()
+  try:
+    worker_values = [None] * processes
+    finished = [False] * processes
+    while not all(finished):
+      message, k, content = next_message(messages, workers, finished,
+          "Centrality")
+      if message == PROGRESS_MESSAGE:
+        for i in xrange(content):
+          step()
+      elif message == COUNTERS_MESSAGE:
+        add_worker_report(content)
+      elif message == RESULT_MESSAGE:
+        worker_values[k] = content
+        finished[k] = True
+      else:
+        raise Exception("Centrality worker %d failed:\n%s" % (k, content))
+  finally:
+    for worker in workers:
+      if worker.is_alive():
+        worker.terminate()
+      worker.join()
+
+  # Put the per-origin values back in the order of |origins|
+  values = dict((key, [None] * len(origins)) for key in worker_values[0])
+  for (k, origin_list) in enumerate(origin_lists):
+    for key in values:
+      values[key][k::processes] = worker_values[k][key]
+  # Reduce the partial betweenness arrays, always in worker order
+  betweenness = zeros(betweenness_size)
+  for partial in partial_betweenness:
+    betweenness += frombuffer(partial, dtype=float64)
+  return values, betweenness
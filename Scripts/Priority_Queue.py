@@ -0,0 +1,167 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Priority queues used by the shortest path computations.
+|Priority_Queue| is a binary heap. |Bucket_Queue| has the same interface, it
+    files entries in buckets of priorities that are |quantum| wide (Dial's
+    algorithm) and only orders the entries of one bucket at a time. Both pop
+    entries in exactly the same order.
+"""
+
+from heapq import heapify
+from heapq import heappop
+from heapq import heappush
+
+class Priority_Queue:
+  """
+  Binary heap keyed on node id that supports decrease-key by lazy deletion
+  Entries are tuples of the form (priority, key, ...), any extra items in an
+      entry (e.g. the euclidean distance of the node) are carried along
+  When the priority of a key is decreased, the new entry is pushed and the old
+      entry is left in the heap; old (stale) entries are skipped when popped
+  """
+
+  def __init__(self, entries=()):
+    """
+    |entries|: initial entries of the queue
+    """
+    # Heap of entries, may contain stale entries
+    self.heap = []
+    # Maps each key in the queue to the priority of its live entry
+    self.priority = {}
+    for entry in entries:
+      self.push(entry)
+
+  def __len__(self):
+    """
+    Returns the number of keys in the queue (stale entries are not counted)
+    """
+    return len(self.priority)
+
+  def __contains__(self, key):
+    """
+    Returns True if |key| is in the queue, False otherwise
+    """
+    return key in self.priority
+
+  def push(self, entry):
+    """
+    Adds |entry| to the queue
+    If the key of |entry| is already in the queue, its old entry becomes stale
+    """
+    self.priority[entry[1]] = entry[0]
+    heappush(self.heap, entry)
+
+  def decrease_key(self, entry):
+    """
+    Lowers the priority of the key of |entry| to the priority of |entry|
+    """
+    self.push(entry)
+
+  def pop(self):
+    """
+    Removes and returns the live entry with the lowest priority
+    Raises IndexError if the queue is empty
+    """
+    heap = self.heap
+    priority = self.priority
+    while heap:
+      entry = heappop(heap)
+      key = entry[1]
+      if key in priority and priority[key] == entry[0]:
+        del priority[key]
+        return entry
+    raise IndexError("pop from an empty priority queue")
+
+class Bucket_Queue:
+  """
+  Bucket queue keyed on node id that supports decrease-key by lazy deletion
+  Priorities must not be negative, and must never be lower than the priority of
+      the last popped entry by more than |quantum| (as in Dijkstra, where edge
+      weights are not negative)
+  Entries are filed in the bucket of their priority, bucket i holds the
+      priorities in [i * |quantum|, (i + 1) * |quantum|). Buckets are emptied
+      in order, and the entries of the bucket being emptied are kept in a heap,
+      so that entries are popped in exact order of priority (and then key) as
+      from a |Priority_Queue|
+  """
+
+  def __init__(self, entries=(), quantum=1.0):
+    """
+    |entries|: initial entries of the queue
+    |quantum|: width of the buckets, a positive number
+    """
+    self.quantum = float(quantum)
+    # Bucket numbers are priorities times |scale|
+    self.scale = 1.0 / self.quantum
+    # Maps bucket numbers to lists of entries, may contain stale entries
+    self.buckets = {}
+    # Heap of the numbers of the buckets above the current one
+    self.later = []
+    # Number of the bucket being emptied, its list of entries is a heap
+    self.current = 0
+    # Maps each key in the queue to the priority of its live entry
+    self.priority = {}
+    for entry in entries:
+      self.push(entry)
+
+  def __len__(self):
+    """
+    Returns the number of keys in the queue (stale entries are not counted)
+    """
+    return len(self.priority)
+
+  def __contains__(self, key):
+    """
+    Returns True if |key| is in the queue, False otherwise
+    """
+    return key in self.priority
+
+  def push(self, entry):
+    """
+    Adds |entry| to the queue
+    If the key of |entry| is already in the queue, its old entry becomes stale
+    """
+    self.priority[entry[1]] = entry[0]
+    bucket = int(entry[0] * self.scale)
+    if bucket > self.current:
+      entries = self.buckets.get(bucket)
+      if entries is None:
+        self.buckets[bucket] = [entry]
+        heappush(self.later, bucket)
+      else:
+        entries.append(entry)
+    else:
+      # Entries below the current bucket are ordered along with it
+      heappush(self.buckets.setdefault(self.current, []), entry)
+
+  # Lowers the priority of the key of an entry to the priority of the entry
+  decrease_key = push
+
+  def pop(self):
+    """
+    Removes and returns the live entry with the lowest priority
+    Raises IndexError if the queue is empty
+    """
+    buckets = self.buckets
+    priority = self.priority
+    while priority:
+      entries = buckets.get(self.current)
+      while entries:
+        entry = heappop(entries)
+        key = entry[1]
+        if key in priority and priority[key] == entry[0]:
+          del priority[key]
+          return entry
+      # Move on to the next bucket that holds entries
+      buckets.pop(self.current, None)
+      self.current = heappop(self.later)
+      heapify(buckets[self.current])
+    raise IndexError("pop from an empty priority queue")
@@ -0,0 +1,81 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Benchmark of the shortest path kernels with a binary heap and with bucket
+    queues of several quanta, on the same grid graphs.
+Usage: python Queue_Benchmark.py [grid size] [radius]
+"""
+
+from Centrality_Kernels import graph_arrays
+from Centrality_Kernels import kernel_for
+from Graph import Graph_Builder
+from random import Random
+from sys import argv
+from time import time
+from Utils import eq_tol
+
+# Bucket widths to try, as multiples of the mean edge weight
+QUANTA = (0.25, 0.5, 1.0, 2.0)
+
+def grid_graph(size, seed=0):
+  """
+  Returns a |size| by |size| grid |Graph| with random edge weights in [1, 3)
+      and random node weights
+  """
+  random = Random(seed)
+  builder = Graph_Builder()
+  for x in xrange(size):
+    for y in xrange(size):
+      if x + 1 < size:
+        builder.add_edge((x, y), (x + 1, y), 1 + 2 * random.random())
+      if y + 1 < size:
+        builder.add_edge((x, y), (x, y + 1), 1 + 2 * random.random())
+  graph = builder.build()
+  for id in graph.ids:
+    graph.set_location(id, id)
+    graph.set_weight(id, random.randint(1, 3))
+  return graph
+
+def run(graph, radius, quantum):
+  """
+  Runs all metrics from every node of |graph| and returns (seconds, values,
+      betweenness)
+  """
+  arguments = (True, True, True, True, True, radius, True, 0.5, [])
+  sequences = tuple(None if a is None else a.tolist() for a in
+      graph_arrays(graph, []))
+  kernel = kernel_for(arguments, sequences, quantum)
+  betweenness = [0.0] * len(graph)
+  start = time()
+  values = kernel(sequences, range(len(graph)), *(arguments + (betweenness,
+      lambda: None)))
+  return time() - start, values, betweenness
+
+def same_results(first, second):
+  """
+  Returns True if the two runs gave the same values and betweenness
+  """
+  return all(all(eq_tol(a, b) for (a, b) in zip(first[1][key],
+      second[1][key])) for key in first[1]) and all(eq_tol(a, b) for (a, b) in
+      zip(first[2], second[2]))
+
+if __name__ == "__main__":
+  size = int(argv[1]) if len(argv) > 1 else 40
+  radius = float(argv[2]) if len(argv) > 2 else 12.0
+  graph = grid_graph(size)
+  mean_weight = graph.weights.mean()
+  heap = run(graph, radius, None)
+  print("%d nodes, radius %g" % (len(graph), radius))
+  print("binary heap: %.3fs" % heap[0])
+  for multiple in QUANTA:
+    quantum = multiple * mean_weight
+    bucket = run(graph, radius, quantum)
+    print("bucket queue, quantum %.3f: %.3fs (%.2fx), same results: %s" % (
+        quantum, bucket[0], heap[0] / bucket[0], same_results(heap, bucket)))
@@ -0,0 +1,216 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Reading shapefiles, and reading and writing DBF tables, without arcpy.
+Only the parts of the formats that the tool needs are supported: point and
+    polyline shapes (with or without Z and M values, which are dropped), and
+    dBASE III tables with character, numeric, float, logical and date fields.
+"""
+
+from datetime import date
+from os.path import splitext
+from struct import pack
+from struct import unpack
+from Utils import Invalid_Input_Exception
+
+# Shape types of the shapefile format
+NULL_SHAPE = 0
+POINT_SHAPES = (1, 11, 21)
+POLYLINE_SHAPES = (3, 13, 23)
+POLYGON_SHAPES = (5, 15, 25)
+# Length of the header of a shapefile, and file code found at its start
+SHAPEFILE_HEADER_LENGTH = 100
+SHAPEFILE_CODE = 9994
+# Markers of the DBF format
+DBF_VERSION = 3
+DBF_HEADER_END = "\r"
+DBF_FILE_END = "\x1a"
+DBF_DELETED = "*"
+DBF_FIELD_LENGTH = 32
+# Width and decimals of numeric fields, as ArcGIS writes doubles and integers
+DOUBLE_FIELD = ("N", 19, 11)
+INTEGER_FIELD = ("N", 18, 0)
+
+def _parse_value(field_type, decimals, text):
+  """
+  Returns the value of a DBF field of |field_type| stored as |text|, None if
+      the field is blank
+  """
+  text = text.strip()
+  if field_type in "NF":
+    if not text or text.startswith("*"):
+      return None
+    if decimals == 0 and "." not in text:
+      return int(text)
+    return float(text)
+  if field_type == "L":
+    return None if text in ("", "?") else text in "YyTt"
+  return text
+
+def read_dbf(path):
+  """
+  Returns (fields, records) for the DBF table at |path|
+  |fields|: list of (name, type, length, decimals)
+  |records|: list with one dictionary per record mapping field names to
+      values, None for deleted records so that records stay aligned with the
+      shapes of a shapefile
+  """
+  dbf_file = open(path, "rb")
+  try:
+    header = dbf_file.read(DBF_FIELD_LENGTH)
+    record_count, header_length, record_length = unpack("<xxxxLHH20x", header)
+    fields = []
+    for i in xrange((header_length - DBF_FIELD_LENGTH - 1) //
+        DBF_FIELD_LENGTH):
+      descriptor = dbf_file.read(DBF_FIELD_LENGTH)
+      name = descriptor[:11].split("\0")[0].strip()
+      fields.append((name, descriptor[11], ord(descriptor[16]),
+          ord(descriptor[17])))
+    dbf_file.seek(header_length)
+    records = []
+    for i in xrange(record_count):
+      record = dbf_file.read(record_length)
+      if record[0] == DBF_DELETED:
+        records.append(None)
+        continue
+      values = {}
+      start = 1
+      for (name, field_type, length, decimals) in fields:
+        values[name] = _parse_value(field_type, decimals,
+            record[start:start + length])
+        start += length
+      records.append(values)
+    return fields, records
+  finally:
+    dbf_file.close()
+
+def read_shapes(path):
+  """
+  Returns the shapes of the shapefile at |path|, in order: None for a null
+      shape, (x, y) for a point, and a list of parts for a polyline or a
+      polygon, where each part is a list of (x, y) vertices
+  Raises |Invalid_Input_Exception| for other shape types
+  """
+  shp_file = open(path, "rb")
+  try:
+    header = shp_file.read(SHAPEFILE_HEADER_LENGTH)
+    if unpack(">i", header[:4])[0] != SHAPEFILE_CODE:
+      raise Invalid_Input_Exception(path)
+    shapes = []
+    while True:
+      record_header = shp_file.read(8)
+      if len(record_header) < 8:
+        break
+      content_length = 2 * unpack(">ii", record_header)[1]
+      content = shp_file.read(content_length)
+      shape_type = unpack("<i", content[:4])[0]
+      if shape_type == NULL_SHAPE:
+        shapes.append(None)
+      elif shape_type in POINT_SHAPES:
+        shapes.append(unpack("<dd", content[4:20]))
+      elif shape_type in POLYLINE_SHAPES + POLYGON_SHAPES:
+        part_count, point_count = unpack("<ii", content[36:44])
+        starts = list(unpack("<%di" % part_count, content[44:44 + 4 *
+            part_count]))
+        offset = 44 + 4 * part_count
+        coordinates = unpack("<%dd" % (2 * point_count), content[offset:offset +
+            16 * point_count])
+        points = zip(coordinates[::2], coordinates[1::2])
+        shapes.append([list(points[start:end]) for (start, end) in zip(starts,
+            starts[1:] + [point_count])])
+      else:
+        raise Invalid_Input_Exception(path)
+    return shapes
+  finally:
+    shp_file.close()
+
+def read_shapefile(path):
+  """
+  Returns a list of (shape, attributes) for the features of the shapefile at
+      |path|, as returned by |read_shapes| and |read_dbf|, leaving out deleted
+      features
+  """
+  shapes = read_shapes(path)
+  fields, records = read_dbf("%s.dbf" % splitext(path)[0])
+  return [(shape, record) for (shape, record) in zip(shapes, records) if
+      record is not None]
+
+def _format_value(field_type, length, decimals, value):
+  """
+  Returns |value| as stored in a DBF field of |field_type|, |length| and
+      |decimals|
+  """
+  if value is None:
+    text = ""
+  elif field_type in "NF":
+    text = ("%d" % value if decimals == 0 else "%.*f" % (decimals, value))
+    if len(text) > length:
+      # Keep as many decimals as fit
+      text = ("%.*g" % (max(1, length - 6), value))[:length]
+  elif field_type == "L":
+    text = "T" if value else "F"
+  else:
+    text = unicode(value).encode("utf-8")
+  if field_type in "NF":
+    return text.rjust(length)[:length]
+  return text.ljust(length)[:length]
+
+class DBF_Writer:
+  """
+  Writes the records of a DBF table one at a time, so that a table of any size
+      can be written without holding its records in memory
+  The record count in the header is filled in by |close|
+  """
+
+  def __init__(self, path, fields):
+    """
+    |path|: path of the table, replaced if it exists
+    |fields|: list of (name, type, length, decimals), names are cut to 10
+        characters
+    """
+    self.fields = [(name[:10], field_type, length, decimals) for (name,
+        field_type, length, decimals) in fields]
+    self.record_count = 0
+    self.dbf_file = open(path, "wb")
+    self._write_header()
+    for (name, field_type, length, decimals) in self.fields:
+      self.dbf_file.write(pack("<11sc4xBB14x", name, field_type, length,
+          decimals))
+    self.dbf_file.write(DBF_HEADER_END)
+
+  def _write_header(self):
+    """
+    Writes the header of the table at the start of the file
+    """
+    today = date.today()
+    header_length = DBF_FIELD_LENGTH * (len(self.fields) + 1) + 1
+    record_length = 1 + sum(length for (name, field_type, length, decimals) in
+        self.fields)
+    self.dbf_file.seek(0)
+    self.dbf_file.write(pack("<BBBBLHH20x", DBF_VERSION, today.year - 1900,
+        today.month, today.day, self.record_count, header_length,
+        record_length))
+
+  def write(self, values):
+    """
+    Appends a record with |values|, in the order of the fields
+    """
+    self.dbf_file.write(" " + "".join(_format_value(field_type, length,
+        decimals, value) for ((name, field_type, length, decimals), value) in
+        zip(self.fields, values)))
+    self.record_count += 1
+
+  def close(self):
+    """
+    Ends the table and records the number of records in its header
+    """
+    self.dbf_file.write(DBF_FILE_END)
+    self._write_header()
+    self.dbf_file.close()
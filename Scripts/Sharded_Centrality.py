@@ -0,0 +1,207 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Script for splitting the centrality computation among several machines.
+Each machine runs one shard of the origins and writes a partial results file
+    with the raw values of its origins and its partial betweenness sums. The
+    partial results files of all shards are then merged into the final columns,
+    which are normalized as a whole.
+Every shard, and the merge, has to be run on the same graph with the same
+    metric inputs; partial results files record both and are refused
+    otherwise.
+"""
+
+from Centrality_Computation import compute_centrality
+from Centrality_Computation import normalize_metrics
+from Centrality_Kernels import sweep_columns
+from Constants import BETWEENNESS
+from Distance_Cache import graph_key
+from json import dumps
+from json import loads
+from numpy import array
+from numpy import flatnonzero
+from numpy import int32
+from numpy import load
+from numpy import savez
+from numpy import zeros
+from Utils import Invalid_Parameters_Exception
+
+# Version of the layout of partial results files
+PARTIAL_RESULTS_VERSION = 1
+
+# Names of the arrays in a partial results file
+DESCRIPTION_COLUMN = "description"
+ORIGINS_COLUMN = "origins"
+VALUES_PREFIX = "values:"
+BETWEENNESS_PREFIX = "betweenness:"
+REACH_VALUES_PREFIX = "reach:"
+
+def parse_shard(text):
+  """
+  Returns the shard described by |text|: (k, n) for "k/n", the k-th of n
+      shards counting from 1, or else the list of the origin ids, as text,
+      read from the file at path |text|, one id per line
+  Raises |Invalid_Parameters_Exception| for a "k/n" shard that does not exist
+  """
+  parts = text.split("/")
+  if len(parts) == 2 and all(part.strip().isdigit() for part in parts):
+    k, n = int(parts[0]), int(parts[1])
+    if not 1 <= k <= n:
+      raise Invalid_Parameters_Exception("there is no shard %d of %d" % (k, n))
+    return k, n
+  id_file = open(text)
+  try:
+    return [line.strip() for line in id_file if line.strip()]
+  finally:
+    id_file.close()
+
+def shard_origins(graph, origins, shard):
+  """
+  Returns the ids of the |origins| that belong to |shard|, as returned by
+      |parse_shard|
+  Origins are dealt to the n shards of a (k, n) shard in turn, in order of node
+      index, so that every machine splits them the same way and each shard
+      covers all parts of the graph
+  """
+  if isinstance(shard, tuple):
+    k, n = shard
+    origin_indices = sorted(graph.index[id] for id in origins if id in
+        graph.index)
+    return [graph.ids[i] for i in origin_indices[k - 1::n]]
+  shard_ids = set(shard)
+  return [id for id in origins if str(id) in shard_ids]
+
+def _columns(parameters):
+  """
+  Returns the metric columns computed with |parameters|, as |sweep_columns|
+  """
+  return sweep_columns(parameters["radii"], parameters["betas"],
+      *(parameters["compute"] + [parameters["accumulator_fields"]]))
+
+def compute_shard(graph, origins, shard, path, compute_r, compute_g, compute_b,
+    compute_c, compute_s, radius, network_radius, beta, accumulator_fields,
+    processes=1, distance_cache=None, queue_quantum=None, max_memory=None):
+  """
+  Computes the metrics of the origins of one shard of |origins| on |graph|,
+      without normalizing them, and writes them to a partial results file
+  |shard|: as returned by |parse_shard|
+  |path|: path of the partial results file
+  All other parameters are as in |compute_centrality|
+  Returns the ids of the origins of the shard
+  """
+  shard_ids = shard_origins(graph, origins, shard)
+  compute_centrality(graph, shard_ids, compute_r, compute_g, compute_b,
+      compute_c, compute_s, radius, network_radius, beta, [],
+      accumulator_fields, processes, None, None, False, 0, distance_cache,
+      queue_quantum, max_memory)
+  radii = sorted(set(radius)) if isinstance(radius, (list, tuple)) else [radius]
+  betas = list(beta) if isinstance(beta, (list, tuple)) else [beta]
+  # The metrics that were actually computed, as in |compute_centrality|
+  accumulator_fields = [field for field in graph.accumulator_fields if field in
+      accumulator_fields]
+  compute_s = compute_s and graph.locations is not None
+  if accumulator_fields and shard_ids and not all(column in graph.metrics for
+      column in sweep_columns(radii, betas, False, False, False, False, False,
+      accumulator_fields)[0][3]):
+    # Accumulations did not fit in |max_memory|
+    accumulator_fields = []
+  parameters = {"compute": [compute_r, compute_g, compute_b, compute_c,
+      compute_s], "radii": radii, "betas": betas, "network_radius":
+      network_radius, "accumulator_fields": accumulator_fields}
+  write_partial_results(graph, path, shard_ids, shard, parameters)
+  return shard_ids
+
+def write_partial_results(graph, path, origins, shard, parameters):
+  """
+  Writes the unnormalized metrics that |graph| holds for |origins| to the
+      partial results file at |path|
+  The file describes itself: it records the key of the graph, the shard and
+      the |parameters| the metrics were computed with, the node indices of
+      the origins, one array of values per metric column for the origins, and
+      the whole partial betweenness column of the shard
+  """
+  origin_indices = array([graph.index[id] for id in origins], dtype=int32)
+  description = {"version": PARTIAL_RESULTS_VERSION, "graph": graph_key(graph),
+      "nodes": len(graph), "shard": shard, "parameters": parameters}
+  arrays = {DESCRIPTION_COLUMN: array(dumps(description)), ORIGINS_COLUMN:
+      origin_indices}
+  for (r, (reach_key, weighted_reach_key, metrics, accumulators)) in enumerate(
+      _columns(parameters)):
+    for (metric, column, norm_column, beta_i) in metrics:
+      if metric == BETWEENNESS:
+        arrays[BETWEENNESS_PREFIX + column] = graph.metric(column)
+      else:
+        arrays[VALUES_PREFIX + column] = graph.metric(column)[origin_indices]
+    for column in accumulators:
+      arrays[VALUES_PREFIX + column] = graph.metric(column)[origin_indices]
+    for (j, key) in enumerate((reach_key, weighted_reach_key)):
+      arrays["%s%d:%d" % (REACH_VALUES_PREFIX, r, j)] = graph.reach(key)[
+          origin_indices]
+  # A file object keeps |savez| from changing the name of the file
+  partial_file = open(path, "wb")
+  try:
+    savez(partial_file, **arrays)
+  finally:
+    partial_file.close()
+
+def merge_partial_results(graph, paths, measures_to_normalize):
+  """
+  Combines the partial results files at |paths| into the metrics of |graph|,
+      and normalizes them as |compute_centrality| would for all of their
+      origins; betweenness sums are added in the order of |paths|
+  |measures_to_normalize|: a list of measures to normalize
+  Raises |Invalid_Parameters_Exception| if a file was written for another
+      graph or with other parameters, or if two files share an origin
+  Returns the ids of all the origins, in order of node index
+  """
+  if not paths:
+    raise Invalid_Parameters_Exception("no partial results to merge")
+  key = graph_key(graph)
+  parameters = None
+  merged = zeros(len(graph), dtype=bool)
+  for path in paths:
+    archive = load(path)
+    try:
+      description = loads(str(archive[DESCRIPTION_COLUMN]))
+      if (description["version"] != PARTIAL_RESULTS_VERSION or
+          description["graph"] != key):
+        raise Invalid_Parameters_Exception("%s was not computed on this graph"
+            % path)
+      if parameters is None:
+        parameters = description["parameters"]
+        columns = _columns(parameters)
+      elif description["parameters"] != parameters:
+        raise Invalid_Parameters_Exception("%s was computed with other "
+            "parameters" % path)
+      origin_indices = archive[ORIGINS_COLUMN]
+      if merged[origin_indices].any():
+        raise Invalid_Parameters_Exception("%s shares origins with another "
+            "partial results file" % path)
+      merged[origin_indices] = True
+      for (r, (reach_key, weighted_reach_key, metrics, accumulators)) in (
+          enumerate(columns)):
+        for (metric, column, norm_column, beta_i) in metrics:
+          if metric == BETWEENNESS:
+            graph.metric(column)[:] += archive[BETWEENNESS_PREFIX + column]
+          else:
+            graph.metric(column)[origin_indices] = archive[VALUES_PREFIX +
+                column]
+        for column in accumulators:
+          graph.metric(column)[origin_indices] = archive[VALUES_PREFIX +
+              column]
+        for (j, reach_key_j) in enumerate((reach_key, weighted_reach_key)):
+          graph.reach(reach_key_j)[origin_indices] = archive["%s%d:%d" % (
+              REACH_VALUES_PREFIX, r, j)]
+    finally:
+      archive.close()
+  origin_indices = flatnonzero(merged)
+  normalize_metrics(graph, origin_indices, len(origin_indices), columns,
+      list(measures_to_normalize))
+  return [graph.ids[i] for i in origin_indices]
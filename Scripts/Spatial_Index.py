@@ -0,0 +1,147 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Spatial index for radius queries on node locations, and spatial batches of
+    locations.
+"""
+
+from math import floor
+from numpy import arange
+from numpy import asarray
+from numpy import concatenate
+from numpy import flatnonzero
+from numpy import float64
+from numpy import floor as array_floor
+from numpy import int64
+from numpy import sqrt
+from numpy import unique
+from numpy import zeros
+
+class Grid_Index:
+  """
+  Uniform grid over a set of (x, y) locations
+  Each location is put in the square cell of the grid that contains it, so a
+      radius query only has to look at the locations in the cells that overlap
+      the query circle
+  Works best when the cell size is close to the radius of the queries
+  """
+
+  def __init__(self, locations, cell_size):
+    """
+    |locations|: flat sequence of (x, y) pairs, location i is
+        (|locations|[2 * i], |locations|[2 * i + 1])
+    |cell_size|: width and height of the cells of the grid
+    """
+    xy = asarray(locations, dtype=float64).reshape((-1, 2))
+    self.x = xy[:, 0]
+    self.y = xy[:, 1]
+    self.cell_size = float(cell_size) if cell_size > 0 else 1.0
+    if len(xy) == 0:
+      self.x_min = self.y_min = 0.0
+      self.columns = self.rows = 0
+      self.cells = {}
+      self.order = zeros(0, dtype=int64)
+      return
+    self.x_min = self.x.min()
+    self.y_min = self.y.min()
+    column = array_floor((self.x - self.x_min) / self.cell_size).astype(int64)
+    row = array_floor((self.y - self.y_min) / self.cell_size).astype(int64)
+    self.columns = int(column.max()) + 1
+    self.rows = int(row.max()) + 1
+    # Sort locations by cell and record the range of each non-empty cell
+    keys = column * self.rows + row
+    self.order = keys.argsort(kind="mergesort")
+    cell_keys, starts = unique(keys[self.order], return_index=True)
+    ends = concatenate((starts[1:], [len(keys)]))
+    self.cells = dict(zip(cell_keys.tolist(), zip(starts.tolist(),
+        ends.tolist())))
+
+  def __len__(self):
+    """
+    Returns the number of locations in the index
+    """
+    return len(self.x)
+
+  def candidates(self, x, y, radius):
+    """
+    Returns an array of the indices of all locations in cells that overlap the
+        square of half-width |radius| centered at (|x|, |y|)
+    """
+    cell_size = self.cell_size
+    first_column = max(0, int(floor((x - radius - self.x_min) / cell_size)))
+    last_column = min(self.columns - 1, int(floor((x + radius - self.x_min) /
+        cell_size)))
+    first_row = max(0, int(floor((y - radius - self.y_min) / cell_size)))
+    last_row = min(self.rows - 1, int(floor((y + radius - self.y_min) /
+        cell_size)))
+    ranges = []
+    if (last_column - first_column + 1) * (last_row - first_row + 1) > len(
+        self.cells):
+      # Query covers more cells than there are non-empty cells
+      for (key, cell_range) in self.cells.items():
+        column, row = divmod(key, self.rows)
+        if (first_column <= column <= last_column and
+            first_row <= row <= last_row):
+          ranges.append(cell_range)
+    else:
+      for column in xrange(first_column, last_column + 1):
+        for row in xrange(first_row, last_row + 1):
+          key = column * self.rows + row
+          if key in self.cells:
+            ranges.append(self.cells[key])
+    if not ranges:
+      return zeros(0, dtype=int64)
+    return concatenate([self.order[start:end] for (start, end) in ranges])
+
+  def within_distances(self, x, y, radius):
+    """
+    Returns (indices, distances), the indices of all locations within |radius|
+        of (|x|, |y|) and their distances to (|x|, |y|)
+    """
+    candidates = self.candidates(x, y, radius)
+    distances = sqrt((x - self.x[candidates])**2 + (y - self.y[candidates])**2)
+    within = flatnonzero(distances <= radius)
+    return candidates[within], distances[within]
+
+  def within(self, x, y, radius):
+    """
+    Returns an array of the indices of all locations within |radius| of
+        (|x|, |y|)
+    """
+    return self.within_distances(x, y, radius)[0]
+
+def kd_batches(locations, max_size):
+  """
+  Returns batches of the (x, y) |locations|, as lists of location indices in
+      increasing order, each of at most |max_size| locations
+  The locations are split in two at the median of the coordinate along which
+      they spread most, and each half is split again until it is small enough,
+      so dense areas get small batches and sparse areas large ones, and every
+      batch of a split holds at least half of |max_size| locations
+  Batches are in the order of the splits, so that neighboring batches are
+      close to each other
+  """
+  xy = asarray(locations, dtype=float64).reshape((-1, 2))
+  max_size = max(1, int(max_size))
+  batches = []
+  # Depth-first, with the lower half of each split done first
+  stack = [arange(len(xy))] if len(xy) else []
+  while stack:
+    indices = stack.pop()
+    if len(indices) <= max_size:
+      batches.append(sorted(indices.tolist()))
+      continue
+    spread = xy[indices].max(axis=0) - xy[indices].min(axis=0)
+    axis = int(spread.argmax())
+    order = indices[xy[indices, axis].argsort(kind="mergesort")]
+    middle = len(order) // 2
+    stack.append(order[middle:])
+    stack.append(order[:middle])
+  return batches
@@ -0,0 +1,267 @@
+# ------------------------------------------------------------------------------
+# Urban Network Analysis Toolbox for ArcGIS10
+# Credits: Michael Mekonnen, Andres Sevtsuk
+# MIT City Form Research Group
+# Usage: Creative Commons Attribution - NonCommercial - ShareAlike 3.0 Unported
+#   License
+# License: http://creativecommons.org/licenses/by-nc-sa/3.0/
+# ------------------------------------------------------------------------------
+
+"""
+Script for running the centrality computation one spatial tile at a time.
+The origins are grouped in square tiles by location. Each tile loads only the
+    edges of the adjacency list between the nodes that lie within the tile or
+    within a halo around it, so the memory taken grows with the size of a tile
+    rather than with the size of the whole graph.
+The halo starts as wide as the search radius. Network distances may be shorter
+    than straight line distances, so the halo is widened until no node within
+    the network radius of the origins of the tile has an edge that was left
+    out. The shortest path trees of the tile are then the same as on the whole
+    graph.
+The adjacency list is read once, and its edges are filed on disk in buckets by
+    the tile cells of their end nodes, so that a tile only reads the buckets of
+    the cells that overlap it and its halo.
+"""
+
+from arcpy import AddMessage
+from Component_Centrality import compute_origins_by_component
+from Constants import TILE_DONE
+from Graph import Graph_Builder
+from Graph import nodes_within
+from numpy import asarray
+from numpy import concatenate
+from numpy import float64
+from numpy import floor
+from numpy import fromfile
+from numpy import int32
+from numpy import lexsort
+from numpy import zeros
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from Utils import peak_memory
+
+# Factor the halo of a tile is widened by when it is too narrow
+HALO_GROWTH = 2
+# Number of edge records held in memory before they are written to the buckets
+BUCKET_BUFFER_RECORDS = 2**16
+
+def tile_origins(graph, origin_indices, tile_size):
+  """
+  Returns the tiles of |tile_size| by |tile_size| that hold the origins, as a
+      list of (extent, origins), where |extent| is (x_min, y_min, x_max, y_max)
+      and |origins| the node indices of the origins located in the tile, in
+      increasing order
+  Tiles are laid out from the lowest origin coordinates, in rows of increasing
+      y and then x
+  """
+  origin_indices = asarray(sorted(origin_indices), dtype=int)
+  if not len(origin_indices):
+    return []
+  locations = graph.locations[origin_indices]
+  corner = locations.min(axis=0)
+  cells = floor((locations - corner) / tile_size).astype(int)
+  order = lexsort((cells[:, 0], cells[:, 1]))
+  tiles = []
+  for i in order.tolist():
+    cell = tuple(cells[i].tolist())
+    if not tiles or tiles[-1][0] != cell:
+      tiles.append((cell, []))
+    tiles[-1][1].append(int(origin_indices[i]))
+  return [((corner[0] + x * tile_size, corner[1] + y * tile_size, corner[0] +
+      (x + 1) * tile_size, corner[1] + (y + 1) * tile_size), sorted(origins))
+      for ((x, y), origins) in tiles]
+
+class Edge_Buckets:
+  """
+  Edges of an adjacency list, filed on disk by the tile cells of their end
+      nodes
+  Each edge is filed in the cell of its origin and in the cell of its
+      destination, as a record of doubles (origin, destination, copy, distance,
+      accumulations...), where the end nodes are node indices of the graph and
+      |copy| is 0 for the record in the cell of the origin and 1 for the other
+  Edges with an end node that is not in the graph are left out, as they are
+      when the graph is built in Step 2
+  """
+
+  def __init__(self, graph, edge_rows, corner, tile_size, accumulator_fields):
+    """
+    Reads the adjacency list once and files its edges
+    |graph|: |Graph| of all the nodes, with their locations
+    |edge_rows|: function that returns an iterator over the edges of the
+        adjacency list, as (origin_id, destination_id, distance, accumulations)
+        tuples, where |accumulations| maps accumulator fields to weights
+    |corner|, |tile_size|: lowest corner and width of the tile cells
+    |accumulator_fields|: the accumulator fields to file
+    """
+    self.corner = asarray(corner, dtype=float64)
+    self.tile_size = tile_size
+    self.width = 4 + len(accumulator_fields)
+    self.directory = mkdtemp()
+    # Maps each cell that holds edges to the file of its bucket
+    self.paths = {}
+    cells = [tuple(cell) for cell in self.cell(graph.locations).tolist()]
+    index = graph.index
+    buffered = {}
+    count = 0
+    for (origin_id, destination_id, distance, accumulations) in edge_rows():
+      u = index.get(origin_id, -1)
+      v = index.get(destination_id, -1)
+      if u < 0 or v < 0:
+        continue
+      record = [u, v, 0, distance] + [accumulations[field] for field in
+          accumulator_fields]
+      buffered.setdefault(cells[u], []).extend(record)
+      count += 1
+      if cells[v] != cells[u]:
+        record[2] = 1
+        buffered.setdefault(cells[v], []).extend(record)
+        count += 1
+      if count >= BUCKET_BUFFER_RECORDS:
+        self.flush(buffered)
+        count = 0
+    self.flush(buffered)
+
+  def cell(self, locations):
+    """
+    Returns the array of the (column, row) tile cells of the |locations|
+    """
+    return floor((asarray(locations, dtype=float64) - self.corner) /
+        self.tile_size).astype(int)
+
+  def flush(self, buffered):
+    """
+    Appends the |buffered| records, a map from cells to flat lists of records,
+        to the buckets of their cells and empties |buffered|
+    """
+    for (cell, records) in buffered.items():
+      if cell not in self.paths:
+        self.paths[cell] = join(self.directory, "%d.bin" % len(self.paths))
+      bucket = open(self.paths[cell], "ab")
+      asarray(records, dtype=float64).tofile(bucket)
+      bucket.close()
+    buffered.clear()
+
+  def records(self, x_min, y_min, x_max, y_max):
+    """
+    Returns the array of the records, one per row, in the buckets of the cells
+        that overlap the box from (|x_min|, |y_min|) to (|x_max|, |y_max|)
+    """
+    (low_x, low_y), (high_x, high_y) = self.cell([(x_min, y_min), (x_max,
+        y_max)]).tolist()
+    buckets = [fromfile(path, dtype=float64) for ((x, y), path) in
+        self.paths.items() if low_x <= x <= high_x and low_y <= y <= high_y]
+    if not buckets:
+      return zeros((0, self.width))
+    return concatenate(buckets).reshape((-1, self.width))
+
+  def close(self):
+    """
+    Removes the buckets
+    """
+    rmtree(self.directory, ignore_errors=True)
+
+def load_tile(graph, buckets, extent, halo, accumulator_fields):
+  """
+  Returns (tile, nodes, boundary) for the nodes of |graph| located within
+      |halo| of |extent|
+  |tile|: |Graph| of these nodes and of the edges between them, with the node
+      weights and locations of |graph|
+  |nodes|: array with the index in |graph| of each node of |tile|, in
+      increasing order, so that nodes are in the same order as in |graph|
+  |boundary|: set of the indices in |tile| of the nodes that have an edge to a
+      node that was left out
+  |buckets|: |Edge_Buckets| of the adjacency list, only the buckets of the
+      cells that overlap the tile and its halo are read
+  |accumulator_fields|: the accumulator fields to load
+  """
+  x_min, y_min, x_max, y_max = extent
+  x, y = graph.locations[:, 0], graph.locations[:, 1]
+  inside = ((x >= x_min - halo) & (x <= x_max + halo) & (y >= y_min - halo) &
+      (y <= y_max + halo))
+  builder = Graph_Builder(accumulator_fields)
+  for i in inside.nonzero()[0].tolist():
+    builder.add_node(graph.ids[i])
+  records = buckets.records(x_min - halo, y_min - halo, x_max + halo, y_max +
+      halo)
+  ends = records[:, :2].astype(int)
+  # Whether each end node is within the halo
+  origin_inside, destination_inside = inside[ends[:, 0]], inside[ends[:, 1]]
+  # The nodes of an edge within the halo are in the cell of the origin, whose
+  #     copy of the edge is the one added
+  for k in (origin_inside & destination_inside & (records[:, 2] ==
+      0)).nonzero()[0].tolist():
+    builder.add_edge(graph.ids[ends[k, 0]], graph.ids[ends[k, 1]],
+        records[k, 3], dict(zip(accumulator_fields, records[k, 4:].tolist())))
+  boundary = set(ends[origin_inside & ~destination_inside, 0].tolist()) | set(
+      ends[destination_inside & ~origin_inside, 1].tolist())
+  tile = builder.build()
+  nodes = asarray(sorted(graph.index[id] for id in tile.ids), dtype=int32)
+  tile = tile.subgraph([tile.index[graph.ids[i]] for i in nodes.tolist()])
+  tile.node_weights = graph.node_weights[nodes]
+  tile.locations = graph.locations[nodes]
+  return tile, nodes, set(tile.index[graph.ids[i]] for i in boundary)
+
+def compute_tiles(graph, origin_indices, edge_rows, tile_size, arguments,
+    processes, R, step, quantum=None):
+  """
+  Same as |compute_origins_by_component| on the whole graph, run one tile of
+      origins at a time on the edges that the tile needs
+  |graph|: |Graph| of all the nodes, with their weights and locations, its
+      edges are not used
+  |edge_rows|: as in |Edge_Buckets|, read once
+  |tile_size|: width of the tiles
+  The search radius in |arguments| has to be a network radius
+  The halo of a tile is widened until the shortest path trees of its origins
+      cannot leave it, at most until it holds every node
+  The size of each tile, the width of its halo and the peak memory use of the
+      process are reported after each tile
+  Returns (values, betweenness), as |compute_origins_by_component|
+  """
+  N = len(graph)
+  radii = arguments[5]
+  radius = max(radii) if isinstance(radii, list) else radii
+  accumulator_fields = arguments[8]
+  if not origin_indices:
+    return compute_origins_by_component(graph, [], arguments, processes, R,
+        step, quantum)
+  # Position of each origin in |origin_indices|
+  position = dict((s, i) for (i, s) in enumerate(origin_indices))
+  values = None
+  betweenness = zeros(N * R)
+  tiles = tile_origins(graph, origin_indices, tile_size)
+  # The cells of the buckets are the cells of the tiles
+  corner = tiles[0][0][:2]
+  buckets = Edge_Buckets(graph, edge_rows, corner, tile_size,
+      accumulator_fields)
+  low, high = graph.locations.min(axis=0), graph.locations.max(axis=0)
+  try:
+    for (i, (extent, origins)) in enumerate(tiles):
+      # Halo that holds every node
+      full_halo = max(0.0, extent[0] - low[0], extent[1] - low[1], high[0] -
+          extent[2], high[1] - extent[3])
+      halo = min(radius, full_halo)
+      while True:
+        tile, nodes, boundary = load_tile(graph, buckets, extent, halo,
+            accumulator_fields)
+        local_origins = nodes.searchsorted(origins).tolist()
+        if halo >= full_halo or not boundary or not (boundary & nodes_within(
+            tile, local_origins, radius)):
+          break
+        halo = min(max(halo * HALO_GROWTH, tile_size), full_halo)
+      tile_values, tile_betweenness = compute_origins_by_component(tile,
+          local_origins, arguments, processes, R, step, quantum)
+      if values is None:
+        values = dict((key, zeros(len(origin_indices))) for key in
+            tile_values)
+      positions = [position[s] for s in origins]
+      for (key, key_values) in tile_values.items():
+        values[key][positions] = key_values
+      n = len(nodes)
+      tile_betweenness = asarray(tile_betweenness)
+      for r in xrange(R):
+        betweenness[r * N + nodes] += tile_betweenness[r * n:(r + 1) * n]
+      AddMessage(TILE_DONE(i + 1, len(tiles), n, halo, peak_memory()))
+  finally:
+    buckets.close()
+  return values, betweenness
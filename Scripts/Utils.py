@@ -241,3 +241,40 @@ def is_accumulator_field(field):
   Returns True if |field| is an accumulator field, False otherwise
   """
   return field.startswith("Total_")
+
+def peak_memory():
+  """
+  Returns the peak memory used by this process so far, in bytes, or None if it
+      cannot be measured on this platform
+  """
+  try:
+    from resource import getrusage
+    from resource import RUSAGE_SELF
+    from sys import platform
+    peak = getrusage(RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on Mac
+    return peak if platform == "darwin" else peak * 1024
+  except ImportError:
+    pass
+  try:
+    from ctypes import byref
+    from ctypes import c_size_t
+    from ctypes import c_ulong
+    from ctypes import sizeof
+    from ctypes import Structure
+    from ctypes import windll
+    class Process_Memory_Counters(Structure):
+      _fields_ = [("cb", c_ulong), ("PageFaultCount", c_ulong),
+          ("PeakWorkingSetSize", c_size_t), ("WorkingSetSize", c_size_t),
+          ("QuotaPeakPagedPoolUsage", c_size_t),
+          ("QuotaPagedPoolUsage", c_size_t),
+          ("QuotaPeakNonPagedPoolUsage", c_size_t),
+          ("QuotaNonPagedPoolUsage", c_size_t), ("PagefileUsage", c_size_t),
+          ("PeakPagefileUsage", c_size_t)]
+    counters = Process_Memory_Counters()
+    counters.cb = sizeof(counters)
+    windll.psapi.GetProcessMemoryInfo(windll.kernel32.GetCurrentProcess(),
+        byref(counters), counters.cb)
+    return counters.PeakWorkingSetSize
+  except:
+    return None
@@ -41,6 +41,16 @@ class ToolValidator:
                    "output_location": params[15],
                    "output_file_name": params[16],
                    "accumulator_attributes": params[17]}
+    # Optional parameters, not all versions of the tool have them
+    optional_params = ["parallel_processes", "search_radii", "betas",
+        "sample_size", "relative_error", "stratified_sampling", "random_seed",
+        "distance_cache", "queue_quantum", "node_ordering", "max_memory",
+        "shard", "partial_results", "merge_partial_results", "tile_size",
+        "performance_report", "adjacency_engine", "compress_adjacency_list",
+        "adjacency_list_dbf", "previous_results"]
+    for (i, name) in enumerate(optional_params):
+      if len(params) > 19 + i:
+        self.inputs[name] = params[19 + i]
 
   def initializeParameters(self):
     """
@@ -49,6 +59,23 @@ class ToolValidator:
     self.inputs["accumulator_attributes"].category = "Accumulators"
     self.inputs["normalize_results"].category = "Normalization"
     self.inputs["point_location"].enabled = False
+    for name in ("parallel_processes", "distance_cache", "queue_quantum",
+        "node_ordering", "max_memory", "tile_size", "performance_report",
+        "adjacency_engine", "compress_adjacency_list", "adjacency_list_dbf"):
+      if name in self.inputs:
+        self.inputs[name].category = "Performance"
+    for name in ("search_radii", "betas"):
+      if name in self.inputs:
+        self.inputs[name].category = "Sweep"
+    for name in ("sample_size", "relative_error", "stratified_sampling",
+        "random_seed"):
+      if name in self.inputs:
+        self.inputs[name].category = "Sampling"
+    for name in ("shard", "partial_results", "merge_partial_results"):
+      if name in self.inputs:
+        self.inputs[name].category = "Sharding"
+    if "previous_results" in self.inputs:
+      self.inputs["previous_results"].category = "Incremental"
 
   def updateParameters(self):
     """